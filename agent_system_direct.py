@@ -6,10 +6,14 @@ including planner, coder, and critic agents.
 """
 
 import sys
-import requests
 import json
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from llm_providers import DEFAULT_SYSTEM_INSTRUCTION
+from api_utils import provider_request
+from scheduler import INTERACTIVE
+from tracing import span, traced
 
+@traced("agent.planner")
 def planner_agent(llm, task):
     """
     Planner agent that breaks down coding tasks into implementation steps.
@@ -48,6 +52,7 @@ def planner_agent(llm, task):
         print(f"\n⚠️ ERROR in planner_agent: {e}")
         sys.exit(1)
 
+@traced("agent.coder")
 def coder_agent(llm, instruction):
     """
     Coder agent that writes code based on instructions.
@@ -92,6 +97,7 @@ def coder_agent(llm, instruction):
         print(f"\n⚠️ ERROR in coder_agent: {e}")
         sys.exit(1)
 
+@traced("agent.critic")
 def critic_agent(llm, code):
     """
     Critic agent that reviews code for correctness and suggests improvements.
@@ -136,6 +142,7 @@ def critic_agent(llm, code):
         print(f"\n⚠️ ERROR in critic_agent: {e}")
         sys.exit(1)
 
+@traced("agent.run")
 def run_multi_agent_system(llm, user_request):
     """
     Run the multi-agent system to process a user request.
@@ -143,6 +150,9 @@ def run_multi_agent_system(llm, user_request):
     Args:
         llm: The language model to use
         user_request (str): The user's request
+        
+    Returns:
+        dict: The request with the plan, code and review produced by the agents
     """
     try:
         print("📌 User Request:", user_request)
@@ -158,10 +168,80 @@ def run_multi_agent_system(llm, user_request):
         print("\n🧐 Step 3: Reviewing code...")
         review = critic_agent(llm, code)
         print(review)
+        
+        return {"request": user_request, "plan": plan, "code": code, "review": review}
     except Exception as e:
         print(f"\n⚠️ ERROR in run_multi_agent_system: {e}")
         sys.exit(1)
 
+@traced("agent.ask")
+def ask_ai(llm, user_input, system_instruction=DEFAULT_SYSTEM_INSTRUCTION):
+    """
+    Get a single response from the AI model, without any prompts.
+    
+    Args:
+        llm: The language model to use
+        user_input (str): The user's message
+        system_instruction (str): The system instruction
+        
+    Returns:
+        str: The AI response
+    """
+    if hasattr(llm, 'invoke'):
+        # Using ChatOpenAI or Together
+        response = llm.invoke([SystemMessage(content=system_instruction), HumanMessage(content=user_input)])
+        return response.content if hasattr(response, 'content') else response
+    # Using OpenAI completions API
+    return llm(f"{system_instruction}\n\nUser: {user_input}\n\nAI:")
+
+async def aask_ai(llm, user_input, system_instruction=DEFAULT_SYSTEM_INSTRUCTION):
+    """
+    Get a single response from the AI model like ask_ai, awaiting the model.
+    
+    Args:
+        llm: The language model to use
+        user_input (str): The user's message
+        system_instruction (str): The system instruction
+        
+    Returns:
+        str: The AI response
+    """
+    with span("agent.ask"):
+        if hasattr(llm, 'ainvoke'):
+            # Using ChatOpenAI or Together
+            response = await llm.ainvoke([SystemMessage(content=system_instruction), HumanMessage(content=user_input)])
+            return response.content if hasattr(response, 'content') else response
+        # A plain callable model has no async API; keep it off the event loop
+        import asyncio
+        return await asyncio.to_thread(llm, f"{system_instruction}\n\nUser: {user_input}\n\nAI:")
+
+async def aask_ai_direct(api_key, model_name, user_input, system_instruction=DEFAULT_SYSTEM_INSTRUCTION,
+                         priority=INTERACTIVE):
+    """
+    Get a single response from a Together AI model through the async provider layer.
+    
+    Args:
+        api_key (str): The Together AI API key
+        model_name (str): The model to use
+        user_input (str): The user's message
+        system_instruction (str): The system instruction
+        priority (str): The priority class of the call
+        
+    Returns:
+        str: The AI response
+        
+    Raises:
+        ValueError: If the provider does not answer with a 200
+    """
+    from async_providers import achat_completion
+    
+    messages = [
+        {"role": "system", "content": system_instruction},
+        {"role": "user", "content": user_input}
+    ]
+    result = await achat_completion(api_key, model_name, messages, priority=priority)
+    return result["response"]
+
 def talk_to_ai_direct(api_key, model_name):
     """
     Interactive chat with the AI model using direct API calls.
@@ -177,7 +257,7 @@ def talk_to_ai_direct(api_key, model_name):
         # Get system instruction from user
         system_instruction = input("\nEnter system instruction (or press Enter for default): ")
         if not system_instruction:
-            system_instruction = "You are a helpful AI assistant. Provide clear, concise, and accurate responses to the user's questions."
+            system_instruction = DEFAULT_SYSTEM_INSTRUCTION
         
         # Start the conversation loop
         while True:
@@ -206,8 +286,10 @@ def talk_to_ai_direct(api_key, model_name):
                     "max_tokens": 1000
                 }
                 
-                response = requests.post(
+                response = provider_request(
+                    "POST",
                     "https://api.together.xyz/v1/chat/completions",
+                    priority=INTERACTIVE,
                     headers=headers,
                     json=data,
                     timeout=30
@@ -252,7 +334,7 @@ def talk_to_ai(llm):
         # Get system instruction from user
         system_instruction = input("\nEnter system instruction (or press Enter for default): ")
         if not system_instruction:
-            system_instruction = "You are a helpful AI assistant. Provide clear, concise, and accurate responses to the user's questions."
+            system_instruction = DEFAULT_SYSTEM_INSTRUCTION
         
         # Set up the conversation with system message
         system_message = SystemMessage(content=system_instruction)
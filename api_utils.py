@@ -5,8 +5,278 @@ This module provides functions for API key verification
 for various AI service providers like OpenAI and Together AI.
 """
 
-import requests
+import os
 import json
+import time
+import threading
+from key_pool import (get_key_pool, key_id, service_for_url, UNAUTHORIZED_STATUSES,
+                      RATE_LIMITED_STATUS)
+
+# Shared HTTP session so repeated calls reuse pooled keep-alive connections
+_session = None
+_session_lock = threading.Lock()
+SESSION_POOL_SIZE = 16
+
+# Provider hosts each feature talks to: chat and images use api.together.xyz
+# (or api.openai.com), speech uses api.together.ai
+PREWARM_HOSTS = {
+    "general_chat": ("https://api.together.xyz", "https://api.openai.com"),
+    "image_generation": ("https://api.together.xyz",),
+    "audio_generation": ("https://api.together.xyz", "https://api.together.ai"),
+}
+# Connections opened per host; the PREWARM_CONNECTIONS environment variable overrides it, 0 turns pre-warming off
+DEFAULT_PREWARM_CONNECTIONS = 2
+PREWARM_TIMEOUT = 5
+# Seconds after which a host is warmed again, since servers close idle keep-alive connections
+PREWARM_INTERVAL = 60
+_prewarmed = {}
+_prewarm_lock = threading.Lock()
+
+def get_session():
+    """
+    Get the shared HTTP session used for provider and download requests.
+    
+    Returns:
+        requests.Session: A session with a connection pool per host
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # requests is imported on first use so importing this module stays cheap
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=SESSION_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def prewarm_connections(hosts, connections=None, wait=False):
+    """
+    Open pooled connections to provider hosts before the first real request needs them.
+
+    DNS resolution and the TCP and TLS handshakes happen in background threads
+    with a HEAD request to each host, which needs no API key and uses no quota;
+    the connections then stay in the shared session's pool. Hosts warmed less
+    than PREWARM_INTERVAL seconds ago are skipped.
+
+    Args:
+        hosts (iterable): Base URLs such as "https://api.together.xyz"
+        connections (int, optional): Connections per host, defaults to PREWARM_CONNECTIONS or 2
+        wait (bool): Whether to wait for the connections to be open
+
+    Returns:
+        list: The threads opening the connections
+    """
+    if connections is None:
+        connections = int(os.environ.get("PREWARM_CONNECTIONS", DEFAULT_PREWARM_CONNECTIONS))
+    now = time.monotonic()
+    with _prewarm_lock:
+        todo = [host for host in dict.fromkeys(hosts)
+                if host not in _prewarmed or now - _prewarmed[host] > PREWARM_INTERVAL]
+        if connections <= 0 or not todo:
+            return []
+        for host in todo:
+            _prewarmed[host] = now
+
+    def warm(url):
+        try:
+            get_session().head(url, timeout=PREWARM_TIMEOUT)
+        except Exception:
+            pass  # The first real request simply connects on its own
+
+    # Concurrent requests each check out their own connection, so every thread opens one
+    threads = [threading.Thread(target=warm, args=(host,), name="prewarm", daemon=True)
+               for host in todo for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    if wait:
+        for thread in threads:
+            thread.join()
+    return threads
+
+def _scheduled_request(method, url, priority=None, **kwargs):
+    """
+    Send a request on the shared session once the scheduler admits it.
+
+    A streamed response keeps its slot until it is closed.
+    """
+    from scheduler import get_scheduler
+    from tracing import span
+
+    scheduler = get_scheduler()
+    with span("scheduler.acquire") as acquired:
+        cls = scheduler.acquire(priority)
+        acquired.set(priority=cls)
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except BaseException:
+        scheduler.release(cls)
+        raise
+    if not kwargs.get("stream"):
+        scheduler.release(cls)
+        return response
+
+    close = response.close
+    released = threading.Event()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released.is_set():
+                released.set()
+                scheduler.release(cls)
+
+    response.close = close_and_release
+    return response
+
+def _bearer_key(headers):
+    """
+    Get the API key from the Authorization header of a request, if any.
+    """
+    authorization = (headers or {}).get("Authorization", "")
+    return authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+
+def request_key_pool(url, headers):
+    """
+    Find the key pool a provider request draws from.
+
+    Args:
+        url (str): The provider endpoint
+        headers (dict): The request headers, with the caller's key in Authorization
+
+    Returns:
+        tuple: The service name, the caller's key and the key pool, which is None
+            unless the caller's key belongs to the service's pool
+    """
+    service = service_for_url(url)
+    caller_key = _bearer_key(headers)
+    pool = get_key_pool(service) if service and caller_key else None
+    if pool is not None and caller_key not in pool:
+        pool = None
+    return service, caller_key, pool
+
+def choose_key(pool, caller_key, tried, rotate_key=True):
+    """
+    Reserve the key for the next attempt of a pooled request.
+
+    Args:
+        pool (KeyPool): The request's key pool
+        caller_key (str): The key the caller passed, used when rotation is off or no key is available
+        tried (set): Keys already used by this request; the chosen key is added
+        rotate_key (bool): Whether the pool may pick another key
+
+    Returns:
+        str: The key to send
+    """
+    api_key = (pool.acquire(exclude=tried) if rotate_key else None) or pool.acquire(preferred=caller_key)
+    tried.add(api_key)
+    return api_key
+
+def should_retry_with_another_key(pool, status, tried, rotate_key=True):
+    """
+    Check whether a pooled request that got a status should be retried with another key.
+
+    Args:
+        pool (KeyPool): The request's key pool
+        status (int): The response status
+        tried (set): Keys already used by this request
+        rotate_key (bool): Whether the pool may pick another key
+
+    Returns:
+        bool: True for a 401/403 or 429 when an untried key is in rotation
+    """
+    retry = status in UNAUTHORIZED_STATUSES + (RATE_LIMITED_STATUS,)
+    return retry and rotate_key and pool.has_available(exclude=tried)
+
+def provider_request(method, url, priority=None, rotate_key=True, **kwargs):
+    """
+    Send a request to a provider API through the priority scheduler and the key pool.
+
+    The call waits for a slot of its priority class, then uses the shared
+    session. When the request's key belongs to the provider's key pool, the
+    pool picks the key with the most quota left, and a 401/403 or 429 is
+    retried once per remaining key. A streamed response keeps its slot until
+    it is closed, so it should be used as a context manager or closed
+    explicitly. Calls to metered endpoints are recorded in the usage ledger;
+    a streaming caller can set the response's usage attribute to the token
+    usage it read before closing it.
+
+    Args:
+        method (str): The HTTP method
+        url (str): The provider endpoint
+        priority (str, optional): INTERACTIVE, NORMAL or BULK, defaults to the current priority
+        rotate_key (bool): Whether the pool may replace the request's key; False pins it, e.g. to verify it
+        **kwargs: Arguments for requests.Session.request
+
+    Returns:
+        requests.Response: The response, with the key id used in its key_id attribute
+    """
+    # The scheduler, tracing and the usage ledger are imported on first use so importing this module stays cheap
+    from tracing import span
+
+    headers = kwargs.get("headers") or {}
+    service, caller_key, pool = request_key_pool(url, headers)
+
+    with span("http.request", method=method, url=url, stream=bool(kwargs.get("stream"))) as request_span:
+        tried = set()
+        while True:
+            api_key = caller_key
+            if pool is not None:
+                api_key = choose_key(pool, caller_key, tried, rotate_key)
+                kwargs["headers"] = dict(headers, Authorization=f"Bearer {api_key}")
+
+            started = time.time()
+            try:
+                response = _scheduled_request(method, url, priority, **kwargs)
+            except BaseException:
+                if pool is not None:
+                    pool.release(api_key)
+                raise
+            response.key_id = key_id(service, api_key) if service and api_key else None
+            if pool is not None:
+                pool.release(api_key, response.status_code, response.headers, time.time() - started)
+                if should_retry_with_another_key(pool, response.status_code, tried, rotate_key):
+                    response.close()
+                    continue
+            request_span.set(status=response.status_code, key_id=response.key_id, attempts=max(len(tried), 1))
+            _record_usage(service, url, kwargs, response, started)
+            return response
+
+def _record_usage(service, url, kwargs, response, started):
+    """
+    Record a provider call in the usage ledger, once a streamed response is closed.
+    """
+    from usage_ledger import record_call
+
+    if not kwargs.get("stream"):
+        record_call(service, url, kwargs.get("json"), response, time.time() - started)
+        return
+
+    close = response.close
+    recorded = threading.Event()
+
+    def close_and_record():
+        try:
+            close()
+        finally:
+            if not recorded.is_set():
+                recorded.set()
+                record_call(service, url, kwargs.get("json"), response, time.time() - started, parse_body=False)
+
+    response.close = close_and_record
+
+def _verify_once(verify, api_key):
+    """
+    Run a key verification, sharing it with identical verifications in flight.
+    """
+    from coalesce import single_flight, request_key
+
+    key = request_key(verify.__module__, verify.__qualname__, api_key)
+    return single_flight("verify_key").do(key, verify, api_key)
 
 def verify_openai_key(api_key):
     """
@@ -18,6 +288,12 @@ def verify_openai_key(api_key):
     Returns:
         bool: True if the key is valid, False otherwise
     """
+    return _verify_once(_verify_openai_key, api_key)
+
+def _verify_openai_key(api_key):
+    """
+    Send a minimal chat completion with an OpenAI API key.
+    """
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
@@ -28,8 +304,10 @@ def verify_openai_key(api_key):
         "max_tokens": 5
     }
     try:
-        response = requests.post(
+        response = provider_request(
+            "POST",
             "https://api.openai.com/v1/chat/completions",
+            rotate_key=False,
             headers=headers,
             data=json.dumps(data),
             timeout=10
@@ -53,6 +331,12 @@ def verify_together_key(api_key):
     Returns:
         bool: True if the key is valid, False otherwise
     """
+    return _verify_once(_verify_together_key, api_key)
+
+def _verify_together_key(api_key):
+    """
+    Send a minimal completion with a Together AI API key.
+    """
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
@@ -63,8 +347,10 @@ def verify_together_key(api_key):
         "max_tokens": 5
     }
     try:
-        response = requests.post(
+        response = provider_request(
+            "POST",
             "https://api.together.xyz/v1/completions",
+            rotate_key=False,
             headers=headers,
             data=json.dumps(data),
             timeout=10
@@ -0,0 +1,203 @@
+"""
+Async providers module.
+
+This module is the asyncio counterpart of api_utils.provider_request. Chat
+and text completions, image generation, speech synthesis and the model
+catalog can be awaited over one shared httpx.AsyncClient per event loop, so a
+single process keeps hundreds of generations in flight without a thread per
+request. Requests go through the same priority scheduler and key pool as the
+synchronous calls, which stay available for existing callers.
+"""
+
+import time
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+import httpx
+from scheduler import get_scheduler
+from key_pool import key_id
+from usage_ledger import record_call
+from tracing import span
+from api_utils import request_key_pool, choose_key, should_retry_with_another_key
+from llm_providers import TOGETHER_API_BASE, OPENAI_API_BASE, chat_completions_url
+
+# Connection limits of the shared client; most requests wait on the provider, not on the pool
+ASYNC_MAX_CONNECTIONS = 256
+ASYNC_MAX_KEEPALIVE = 64
+ASYNC_TIMEOUT = 60
+
+_clients = weakref.WeakKeyDictionary()
+
+def get_async_client():
+    """
+    Get the HTTP client shared by the provider calls of the running event loop.
+
+    Returns:
+        httpx.AsyncClient: The client
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_KEEPALIVE)
+        client = _clients[loop] = httpx.AsyncClient(limits=limits, timeout=ASYNC_TIMEOUT)
+    return client
+
+async def close_async_client():
+    """
+    Close the running event loop's client, e.g. before the loop shuts down.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+@asynccontextmanager
+async def astream_provider_request(method, url, priority=None, rotate_key=True, **kwargs):
+    """
+    Send a request to a provider API and stream its response body.
+
+    Like provider_request, the request waits for a slot of its priority class
+    and draws its key from the key pool, retrying a 401/403 or 429 with
+    another key. The slot is held until the with block exits, when calls to
+    metered endpoints are recorded in the usage ledger.
+
+    Args:
+        method (str): The HTTP method
+        url (str): The provider endpoint
+        priority (str, optional): INTERACTIVE, NORMAL or BULK, defaults to the current priority
+        rotate_key (bool): Whether the pool may replace the request's key
+        **kwargs: Arguments for httpx.AsyncClient.build_request (headers, json, params, timeout...)
+
+    Yields:
+        httpx.Response: The response, body not read yet, with the key id used in its key_id attribute
+    """
+    client = get_async_client()
+    scheduler = get_scheduler()
+    headers = kwargs.get("headers") or {}
+    service, caller_key, pool = request_key_pool(url, headers)
+
+    with span("http.request", method=method, url=url) as request_span:
+        tried = set()
+        while True:
+            api_key = caller_key
+            if pool is not None:
+                api_key = choose_key(pool, caller_key, tried, rotate_key)
+                kwargs["headers"] = dict(headers, Authorization=f"Bearer {api_key}")
+
+            with span("scheduler.acquire") as acquired:
+                cls = await scheduler.acquire_async(priority)
+                acquired.set(priority=cls)
+            started = time.time()
+            try:
+                response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+            except BaseException:
+                scheduler.release(cls)
+                if pool is not None:
+                    pool.release(api_key)
+                raise
+            response.key_id = key_id(service, api_key) if service and api_key else None
+
+            if pool is not None:
+                pool.release(api_key, response.status_code, response.headers, time.time() - started)
+                if should_retry_with_another_key(pool, response.status_code, tried, rotate_key):
+                    await response.aclose()
+                    scheduler.release(cls)
+                    continue
+
+            request_span.set(status=response.status_code, key_id=response.key_id, attempts=max(len(tried), 1))
+            try:
+                yield response
+            finally:
+                await response.aclose()
+                scheduler.release(cls)
+                # Pricing the call may read the ledger database, so it runs off the event loop
+                await asyncio.to_thread(record_call, service, url, kwargs.get("json"), response,
+                                        time.time() - started, parse_body=response.is_stream_consumed)
+            return
+
+async def aprovider_request(method, url, priority=None, rotate_key=True, **kwargs):
+    """
+    Send a request to a provider API and read the whole response.
+
+    Args:
+        method (str): The HTTP method
+        url (str): The provider endpoint
+        priority (str, optional): INTERACTIVE, NORMAL or BULK, defaults to the current priority
+        rotate_key (bool): Whether the pool may replace the request's key
+        **kwargs: Arguments for httpx.AsyncClient.build_request
+
+    Returns:
+        httpx.Response: The response, with the key id used in its key_id attribute
+    """
+    async with astream_provider_request(method, url, priority, rotate_key, **kwargs) as response:
+        await response.aread()
+    return response
+
+def _headers(api_key):
+    """
+    Build the JSON request headers for a provider key.
+    """
+    return {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+
+async def _text_request(url, api_key, payload, priority):
+    """
+    Send a completion request and return the parsed body, response and latency.
+
+    Raises:
+        ValueError: If the provider does not answer with a 200
+    """
+    started = time.time()
+    response = await aprovider_request("POST", url, priority, headers=_headers(api_key), json=payload)
+    if response.status_code != 200:
+        raise ValueError(f"Error code: {response.status_code} - {response.text[:200]}")
+    return response.json(), response, round(time.time() - started, 3)
+
+async def achat_completion(api_key, model, messages, provider="together", temperature=0.7, max_tokens=1000,
+                           priority=None):
+    """
+    Get a chat response from a provider's Chat Completions API.
+
+    Args:
+        api_key (str): The provider API key
+        model (str): The model name
+        messages (list): The conversation as role/content dicts
+        provider (str): A key of llm_providers.PROVIDERS
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum number of tokens to generate
+        priority (str, optional): The priority class of the call
+
+    Returns:
+        dict: The response text, model, token usage, key id and latency
+
+    Raises:
+        ValueError: If the provider does not answer with a 200
+    """
+    payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+    data, response, latency = await _text_request(chat_completions_url(provider), api_key, payload, priority)
+    return {"ok": True, "model": model, "response": data["choices"][0]["message"]["content"],
+            "usage": data.get("usage"), "key": response.key_id, "latency": latency}
+
+async def acompletion(api_key, model, prompt, provider="together", temperature=0.7, max_tokens=1000,
+                      priority=None):
+    """
+    Get a text completion from a provider's Completions API.
+
+    Args:
+        api_key (str): The provider API key
+        model (str): The model name
+        prompt (str): The prompt
+        provider (str): A key of llm_providers.PROVIDERS
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum number of tokens to generate
+        priority (str, optional): The priority class of the call
+
+    Returns:
+        dict: The completion text, model, token usage, key id and latency
+
+    Raises:
+        ValueError: If the provider does not answer with a 200
+    """
+    base = OPENAI_API_BASE if provider == "openai" else TOGETHER_API_BASE
+    payload = {"model": model, "prompt": prompt, "temperature": temperature, "max_tokens": max_tokens}
+    data, response, latency = await _text_request(f"{base}/completions", api_key, payload, priority)
+    return {"ok": True, "model": model, "response": data["choices"][0]["text"],
+            "usage": data.get("usage"), "key": response.key_id, "latency": latency}
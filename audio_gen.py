@@ -8,75 +8,687 @@ Developed by Blackbeard (https://blackbeard.one | https://tentitanics.com | http
 © 2023-2024 Blackbeard. All rights reserved.
 """
 
-import requests
-from models_config import FAMOUS_MODELS, AVAILABLE_VOICES
+from models_config import FAMOUS_MODELS, AVAILABLE_VOICES, AUDIO_FORMATS, AUDIO_SAMPLE_RATE
+from api_utils import provider_request
+from output_index import record_output
+from mp3_utils import append_frames, analyze_mp3, normalize_mp3, TRIM_PAD_FRAMES
+from tts_cache import cache_key, cache_copy, cache_store
+from navigation import select_next_action, AGAIN
+from scheduler import submit_with_context, per_key_capacity
+from key_pool import get_key_pool
+from tracing import span, traced, current_span
 import sys
+import re
+import time
+import struct
+import shutil
+import hashlib
+import tempfile
+import subprocess
 
 import os
 
-def generate_audio(api_key, text, model="cartesia/sonic-2", voice="laidback woman", output_file="output.mp3"):
+STREAM_CHUNK_SIZE = 16 * 1024
+SPEECH_URL = "https://api.together.ai/v1/audio/speech"
+
+# Long-form synthesis settings
+LONG_TEXT_THRESHOLD = 600
+MAX_SEGMENT_CHARS = 400
+MIN_SEGMENT_CHARS = 20
+
+# Command-line players that can play audio piped to their standard input
+AUDIO_PLAYERS = [
+    ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-"],
+    ["mpv", "--no-video", "--really-quiet", "-"],
+    ["mpg123", "-q", "-"],
+]
+# Seconds a local player may keep playing after the last chunk before it is stopped
+PLAYER_EXIT_TIMEOUT = 120
+
+def open_audio_player():
     """
-    Generate audio from text using Together AI's text-to-speech API.
+    Start a local audio player that reads audio from its standard input.
+    
+    Returns:
+        subprocess.Popen or None: The player process, or None if no supported player is installed
+    """
+    for command in AUDIO_PLAYERS:
+        if shutil.which(command[0]):
+            return subprocess.Popen(command, stdin=subprocess.PIPE,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    print("⚠️ No audio player found (install ffplay, mpv or mpg123 for progressive playback).")
+    return None
+
+def close_audio_player(player, timeout=PLAYER_EXIT_TIMEOUT):
+    """
+    Close a player's standard input and wait for a local player process to finish.
+
+    Args:
+        player: A process from open_audio_player(), or any object with a stdin
+        timeout (float): Seconds to wait for the process before stopping it
+    """
+    try:
+        player.stdin.close()
+    except OSError:
+        pass
+    if not isinstance(player, subprocess.Popen):
+        return
+    try:
+        player.wait(timeout)
+    except subprocess.TimeoutExpired:
+        print("⚠️ The audio player did not exit, stopping it")
+        player.terminate()
+        player.wait()
+
+def wav_header(audio_format, data_size=0xFFFFFFFF - 36, sample_rate=AUDIO_SAMPLE_RATE, channels=1):
+    """
+    Build a 44-byte WAV header for raw PCM data.
+    
+    The default data size marks the length as unknown, which is what streaming
+    players expect until the header is rewritten with the real size.
+    
+    Args:
+        audio_format (str): A wav entry of AUDIO_FORMATS
+        data_size (int): Size of the PCM data in bytes
+        sample_rate (int): Sample rate in Hz
+        channels (int): Number of channels
+        
+    Returns:
+        bytes: The header
+    """
+    settings = AUDIO_FORMATS[audio_format]
+    bits = settings["bits"]
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, settings["wav_format_tag"], channels,
+        sample_rate, sample_rate * block_align, block_align, bits, b"data", data_size
+    )
+
+class AudioFileWriter:
+    """
+    Writes streamed audio chunks to disk and to an optional player.
+    
+    Chunks are written to a ".part" file that is renamed into place when the
+    with block exits without an error and removed otherwise, and are fed to
+    the player as they arrive. For WAV output a header is written first and
+    rewritten with the final sizes once all the PCM data has arrived.
+    """
+    
+    def __init__(self, output_path, player=None, audio_format="mp3"):
+        self.output_path = output_path
+        self.part_path = output_path + ".part"
+        self.player = player
+        self.audio_format = audio_format
+        self.is_wav = AUDIO_FORMATS[audio_format].get("container") == "wav"
+        self.digest = hashlib.sha256()
+        self.written = 0
+        self.first_chunk_at = None
+        self.file = None
+    
+    def __enter__(self):
+        self.file = open(self.part_path, "wb")
+        if self.is_wav:
+            header = wav_header(self.audio_format)
+            self.file.write(header)
+            if self.player is not None:
+                self.player.stdin.write(header)
+        return self
+    
+    def write(self, chunk):
+        """
+        Write one chunk of audio.
+        
+        Args:
+            chunk (bytes): The chunk
+        """
+        if not chunk:
+            return
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.time()
+        self.file.write(chunk)
+        self.digest.update(chunk)
+        self.written += len(chunk)
+        if self.player is not None:
+            try:
+                self.player.stdin.write(chunk)
+                self.player.stdin.flush()
+            except (BrokenPipeError, OSError):
+                # The player was closed; keep writing the file
+                self.player = None
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.is_wav:
+            self.file.seek(0)
+            self.file.write(wav_header(self.audio_format, self.written))
+            self.written += 44
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.part_path, self.output_path)
+        elif os.path.exists(self.part_path):
+            os.remove(self.part_path)
+        return False
+    
+    def result(self):
+        """
+        Get what was written.
+        
+        Returns:
+            tuple: The number of bytes written, their SHA-256 digest (None for WAV) and the time the first chunk arrived
+        """
+        return self.written, None if self.is_wav else self.digest.hexdigest(), self.first_chunk_at
+
+def stream_to_file(response, output_path, player=None, chunk_size=STREAM_CHUNK_SIZE, audio_format="mp3"):
+    """
+    Write a streaming HTTP response to disk chunk by chunk.
+    
+    Args:
+        response: The streaming HTTP response
+        output_path (str): Where to save the audio
+        player (subprocess.Popen, optional): Player process to pipe the audio to
+        chunk_size (int): Size of each chunk read from the response
+        audio_format (str): The output format, a key of AUDIO_FORMATS
+        
+    Returns:
+        tuple: The number of bytes written, their SHA-256 digest (None for WAV) and the time the first chunk arrived
+    """
+    with span("file.write", path=output_path, streamed=True) as write:
+        with AudioFileWriter(output_path, player, audio_format) as writer:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                writer.write(chunk)
+        write.set(bytes=writer.written)
+    return writer.result()
+
+def synthesize_speech(api_key, text, model, voice, output_path, player=None, timeout=30, audio_format="mp3"):
+    """
+    Request speech for a piece of text and stream it to a file.
     
     Args:
         api_key (str): The Together AI API key
         text (str): The text to convert to speech
         model (str): The model to use for text-to-speech
         voice (str): The voice to use for text-to-speech
-        output_file (str): The output file path
+        output_path (str): Where to save the audio
+        player (subprocess.Popen, optional): Player process to pipe the audio to
+        timeout (int): Request timeout in seconds
+        audio_format (str): The output format, a key of AUDIO_FORMATS
         
     Returns:
-        bool: True if audio generation was successful, False otherwise
+        dict or None: Bytes written, SHA-256, latency and time to first audio, or None if the request failed
     """
-    # Ensure Audio directory exists
-    audio_dir = "Audio"
-    if not os.path.exists(audio_dir):
-        os.makedirs(audio_dir)
-        print(f"Created directory: {audio_dir}")
+    headers, data = _speech_request(api_key, text, model, voice, audio_format)
     
-    # Prepare the full path for the output file
-    output_path = os.path.join(audio_dir, output_file)
-    print(f"\nGenerating audio using {model}...")
-    print(f"Text: '{text}'")
-    print(f"Voice: {voice}")
+    started = time.time()
+    response = provider_request(
+        "POST",
+        SPEECH_URL,
+        headers=headers,
+        json=data,
+        timeout=timeout,
+        stream=True
+    )
     
+    with response:
+        if response.status_code != 200:
+            _report_speech_error(response)
+            return None
+        
+        written, sha256, first_chunk_at = stream_to_file(response, output_path, player, audio_format=audio_format)
+    
+    return _speech_result(written, sha256, first_chunk_at, started)
+
+async def asynthesize_speech(api_key, text, model, voice, output_path, timeout=30, audio_format="mp3", priority=None):
+    """
+    Request speech for a piece of text and stream it to a file, awaiting the provider.
+    
+    Args:
+        api_key (str): The Together AI API key
+        text (str): The text to convert to speech
+        model (str): The model to use for text-to-speech
+        voice (str): The voice to use for text-to-speech
+        output_path (str): Where to save the audio
+        timeout (int): Request timeout in seconds
+        audio_format (str): The output format, a key of AUDIO_FORMATS
+        priority (str, optional): The priority class of the call, defaults to the current priority
+        
+    Returns:
+        dict or None: As synthesize_speech
+    """
+    from async_providers import astream_provider_request
+    
+    headers, data = _speech_request(api_key, text, model, voice, audio_format)
+    started = time.time()
+    async with astream_provider_request("POST", SPEECH_URL, priority, headers=headers, json=data,
+                                        timeout=timeout) as response:
+        if response.status_code != 200:
+            await response.aread()
+            _report_speech_error(response)
+            return None
+        
+        with span("file.write", path=output_path, streamed=True) as write:
+            with AudioFileWriter(output_path, audio_format=audio_format) as writer:
+                async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                    writer.write(chunk)
+            write.set(bytes=writer.written)
+    
+    return _speech_result(*writer.result(), started)
+
+def _speech_request(api_key, text, model, voice, audio_format):
+    """
+    Build the headers and JSON payload of a speech request.
+    """
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
     
+    settings = AUDIO_FORMATS[audio_format]
     data = {
         "model": model,
         "input": text,
         "voice": voice,
-        "response_format": "mp3"
+        "response_format": settings["response_format"]
+    }
+    if "encoding" in settings:
+        data["response_encoding"] = settings["encoding"]
+        data["sample_rate"] = AUDIO_SAMPLE_RATE
+    return headers, data
+
+def _report_speech_error(response):
+    """
+    Print why a speech request failed.
+    """
+    print(f"⚠️ Error generating audio: {response.status_code}")
+    try:
+        error_data = response.json()
+        print(f"Error details: {error_data}")
+    except:
+        print(f"Response content: {response.text[:200]}...")
+
+def _speech_result(written, sha256, first_chunk_at, started):
+    """
+    Build the result of a finished speech request.
+    """
+    return {
+        "bytes": written,
+        "sha256": sha256,
+        "latency": time.time() - started,
+        "first_audio": first_chunk_at - started if first_chunk_at else None,
     }
+
+def cached_synthesize(api_key, text, model, voice, output_path, player=None, audio_format="mp3"):
+    """
+    Synthesize speech, serving it from the TTS cache when the same text was spoken before.
+    
+    Args:
+        api_key (str): The Together AI API key
+        text (str): The text to convert to speech
+        model (str): The model to use for text-to-speech
+        voice (str): The voice to use for text-to-speech
+        output_path (str): Where to save the audio
+        player (subprocess.Popen, optional): Player process to pipe the audio to
+        audio_format (str): The output format, a key of AUDIO_FORMATS
+        
+    Returns:
+        dict or None: As synthesize_speech, with "cached" set on a cache hit
+    """
+    key = cache_key(model, voice, text, audio_format)
+    started = time.time()
+    if cache_copy(key, output_path):
+        if player is not None:
+            try:
+                with open(output_path, "rb") as f:
+                    shutil.copyfileobj(f, player.stdin)
+            except (BrokenPipeError, OSError):
+                pass
+        return {"bytes": os.path.getsize(output_path), "sha256": None,
+                "latency": time.time() - started, "first_audio": None, "cached": True}
+    
+    result = synthesize_speech(api_key, text, model, voice, output_path, player, audio_format=audio_format)
+    if result is not None:
+        cache_store(key, output_path)
+    return result
+
+def _ensure_audio_dir():
+    """
+    Create the Audio directory if it does not exist.
+    
+    Returns:
+        str: The Audio directory
+    """
+    audio_dir = "Audio"
+    if not os.path.exists(audio_dir):
+        os.makedirs(audio_dir)
+        print(f"Created directory: {audio_dir}")
+    return audio_dir
+
+@traced("audio.generate")
+def generate_audio(api_key, text, model="cartesia/sonic-2", voice="laidback woman", output_file="output.mp3",
+                   play=False, use_cache=True, audio_format="mp3", normalize=False, player=None):
+    """
+    Generate audio from text using Together AI's text-to-speech API.
+    
+    The response is streamed to disk as it arrives, so memory use stays flat
+    and the file is playable as soon as the first chunk has been written.
+    
+    Args:
+        api_key (str): The Together AI API key
+        text (str): The text to convert to speech
+        model (str): The model to use for text-to-speech
+        voice (str): The voice to use for text-to-speech
+        output_file (str): The output file path
+        play (bool): Pipe the audio to a local player while it is being received
+        use_cache (bool): Serve repeated (model, voice, text) requests from the TTS cache
+        audio_format (str): The output format, a key of AUDIO_FORMATS (mp3, wav, pcm or ulaw)
+        normalize (bool): Normalize the loudness and trim leading and trailing silence (mp3 only)
+        player (optional): Object whose stdin receives the audio as it arrives, used instead of a
+            local player (e.g. to stream it to an HTTP client); its stdin is closed when done
+        
+    Returns:
+        bool: True if audio generation was successful, False otherwise
+    """
+    current_span().set(model=model, voice=voice, chars=len(text), format=audio_format)
+    if audio_format not in AUDIO_FORMATS:
+        print(f"⚠️ Unsupported audio format '{audio_format}'. Choose one of: {', '.join(AUDIO_FORMATS)}")
+        if player is not None:
+            close_audio_player(player)
+        return False
+    if play and not AUDIO_FORMATS[audio_format]["playable"]:
+        print(f"Progressive playback is not available for {audio_format}; the file will only be saved.")
+        play = False
     
+    # Prepare the full path for the output file
+    output_path = os.path.join(_ensure_audio_dir(), output_file)
+    print(f"\nGenerating audio using {model}...")
+    print(f"Text: '{text}'")
+    print(f"Voice: {voice}")
+    
+    if player is None and play:
+        player = open_audio_player()
     try:
-        response = requests.post(
-            "https://api.together.ai/v1/audio/speech",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            # Save the audio content to a file
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            print(f"✅ Audio generated successfully and saved to {output_path}")
-            return True
+        if use_cache:
+            result = cached_synthesize(api_key, text, model, voice, output_path, player, audio_format)
         else:
-            print(f"⚠️ Error generating audio: {response.status_code}")
-            try:
-                error_data = response.json()
-                print(f"Error details: {error_data}")
-            except:
-                print(f"Response content: {response.text[:200]}...")
+            result = synthesize_speech(api_key, text, model, voice, output_path, player, audio_format=audio_format)
+        if result is None:
             return False
+        _finish_audio(result, output_path, model, text, voice, audio_format, normalize)
+        return True
     except Exception as e:
         print(f"⚠️ Exception while generating audio: {e}")
         return False
+    finally:
+        if player is not None:
+            close_audio_player(player)
+
+def _finish_audio(result, output_path, model, text, voice, audio_format, normalize):
+    """
+    Report a synthesized file, normalize it if asked and record it in the output index.
+    """
+    if result.get("cached"):
+        print("Served from the TTS cache")
+    elif result["first_audio"] is not None:
+        print(f"Time to first audio: {result['first_audio']:.2f}s")
+    print(f"✅ Audio generated successfully and saved to {output_path} ({result['bytes']} bytes)")
+    if normalize and audio_format == "mp3":
+        normalized = normalize_mp3(output_path)
+        print(f"Normalized by {normalized['gain_steps'] * 1.5:+.1f} dB, {normalized['frames']} frames kept")
+        result["sha256"] = None
+    record_output(output_path, "audio", {"model": model, "text": text, "voice": voice, "format": audio_format,
+                                         "normalized": bool(normalize and audio_format == "mp3")},
+                  result["latency"], sha256=result["sha256"])
+
+async def agenerate_audio(api_key, text, model="cartesia/sonic-2", voice="laidback woman", output_file="output.mp3",
+                          use_cache=True, audio_format="mp3", normalize=False, priority=None):
+    """
+    Generate audio like generate_audio, awaiting the provider instead of blocking a thread.
+    
+    Args:
+        api_key (str): The Together AI API key
+        text (str): The text to convert to speech
+        model (str): The model to use for text-to-speech
+        voice (str): The voice to use for text-to-speech
+        output_file (str): The output file path
+        use_cache (bool): Serve repeated (model, voice, text) requests from the TTS cache
+        audio_format (str): The output format, a key of AUDIO_FORMATS (mp3, wav, pcm or ulaw)
+        normalize (bool): Normalize the loudness and trim leading and trailing silence (mp3 only)
+        priority (str, optional): The priority class of the call, defaults to the current priority
+        
+    Returns:
+        bool: True if audio generation was successful, False otherwise
+    """
+    import asyncio
+
+    if audio_format not in AUDIO_FORMATS:
+        print(f"⚠️ Unsupported audio format '{audio_format}'. Choose one of: {', '.join(AUDIO_FORMATS)}")
+        return False
+    
+    with span("audio.generate", model=model, voice=voice, chars=len(text), format=audio_format):
+        output_path = os.path.join(_ensure_audio_dir(), output_file)
+        print(f"\nGenerating audio using {model}...")
+        print(f"Text: '{text}'")
+        print(f"Voice: {voice}")
+    
+        try:
+            # The cache, normalization and output index touch the disk, so they run off the event loop
+            key = cache_key(model, voice, text, audio_format)
+            started = time.time()
+            if use_cache and await asyncio.to_thread(cache_copy, key, output_path):
+                result = {"bytes": os.path.getsize(output_path), "sha256": None,
+                          "latency": time.time() - started, "first_audio": None, "cached": True}
+            else:
+                result = await asynthesize_speech(api_key, text, model, voice, output_path,
+                                                  audio_format=audio_format, priority=priority)
+                if result is None:
+                    return False
+                if use_cache:
+                    await asyncio.to_thread(cache_store, key, output_path)
+            await asyncio.to_thread(_finish_audio, result, output_path, model, text, voice, audio_format, normalize)
+            return True
+        except Exception as e:
+            print(f"⚠️ Exception while generating audio: {e}")
+            return False
+
+def split_text(text, max_chars=MAX_SEGMENT_CHARS):
+    """
+    Split text into sentence-sized segments for speech synthesis.
+    
+    Segments never cross a paragraph boundary. Very short sentences are joined
+    with the following one, and sentences longer than max_chars are split at
+    clause boundaries or, failing that, between words.
+    
+    Args:
+        text (str): The text to split
+        max_chars (int): Maximum length of a segment
+        
+    Returns:
+        list: The text segments, in order
+    """
+    segments = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        
+        pending = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            sentence = f"{pending} {sentence}".strip() if pending else sentence
+            pending = ""
+            if len(sentence) < MIN_SEGMENT_CHARS:
+                pending = sentence
+                continue
+            
+            while len(sentence) > max_chars:
+                cut = max(sentence.rfind(mark, 0, max_chars) for mark in (", ", "; ", ": "))
+                cut = cut + 1 if cut > 0 else sentence.rfind(" ", 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                segments.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+            if sentence:
+                segments.append(sentence)
+        
+        if pending:
+            if segments and len(segments[-1]) + len(pending) < max_chars:
+                segments[-1] = f"{segments[-1]} {pending}"
+            else:
+                segments.append(pending)
+    return segments
+
+@traced("audio.segment")
+def _synthesize_segment(api_key, text, model, voice, output_path, audio_format="mp3", normalize=False, attempts=2,
+                        use_cache=True):
+    """
+    Synthesize one long-form segment through the TTS cache, retrying once on failure.
+    
+    With normalize set, the segment's level is adjusted right away in the
+    worker thread, so normalization overlaps with synthesis of other segments.
+    
+    Args:
+        api_key (str): The Together AI API key
+        text (str): The segment text
+        model (str): The model to use for text-to-speech
+        voice (str): The voice to use for text-to-speech
+        output_path (str): Where to save the segment audio
+        audio_format (str): The segment format, a key of AUDIO_FORMATS
+        normalize (bool): Normalize the segment's loudness (mp3 only); silence is kept
+        attempts (int): Number of attempts before giving up
+        use_cache (bool): Serve the segment from the TTS cache when it was spoken before
+        
+    Returns:
+        str: The path of the synthesized segment
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            synthesize = cached_synthesize if use_cache else synthesize_speech
+            if synthesize(api_key, text, model, voice, output_path, audio_format=audio_format) is not None:
+                if normalize and audio_format == "mp3":
+                    normalize_mp3(output_path, trim=False)
+                return output_path
+        except Exception as e:
+            print(f"⚠️ Segment attempt {attempt} failed: {e}")
+    raise RuntimeError(f"Could not synthesize segment: '{text[:60]}...'")
+
+def longform_workers(unique_segments):
+    """
+    Size the thread pool that synthesizes the segments of a long text.
+
+    Args:
+        unique_segments (int): Number of distinct segments to synthesize
+
+    Returns:
+        int: One thread per segment, capped by the speech calls the scheduler lets
+            through for the Together AI key pool, so no thread only waits for a slot
+    """
+    capacity = per_key_capacity() * max(1, len(get_key_pool("together")))
+    return max(1, min(unique_segments, capacity))
+
+@traced("audio.generate_long")
+def generate_long_audio(api_key, text, model="cartesia/sonic-2", voice="laidback woman", output_file="output.mp3",
+                        max_workers=None, audio_format="mp3", normalize=False, use_cache=True):
+    """
+    Generate audio for long text by synthesizing its sentences concurrently.
+    
+    The text is split at sentence and paragraph boundaries, the segments are
+    synthesized in parallel with the same voice, and the results are joined at
+    the MP3 frame level without decoding (raw PCM segments are simply appended,
+    under a single WAV header for wav output). Segments are appended to the
+    output in order as soon as they and all earlier segments are ready.
+    
+    Args:
+        api_key (str): The Together AI API key
+        text (str): The text to convert to speech
+        model (str): The model to use for text-to-speech
+        voice (str): The voice to use for text-to-speech
+        output_file (str): The output file path
+        max_workers (int, optional): Number of segments synthesized at the same time,
+            defaults to longform_workers() of the unique segments
+        audio_format (str): The output format, a key of AUDIO_FORMATS
+        normalize (bool): Normalize every segment to the same loudness and trim silence
+            at the start and end of the stitched output (mp3 only)
+        use_cache (bool): Serve segments spoken before from the TTS cache
+        
+    Returns:
+        bool: True if audio generation was successful, False otherwise
+    """
+    if audio_format not in AUDIO_FORMATS:
+        print(f"⚠️ Unsupported audio format '{audio_format}'. Choose one of: {', '.join(AUDIO_FORMATS)}")
+        return False
+    normalize = normalize and audio_format == "mp3"
+    # WAV output is assembled from raw PCM segments under one header
+    segment_format = AUDIO_FORMATS[audio_format].get("segment_format", audio_format)
+    is_wav = AUDIO_FORMATS[audio_format].get("container") == "wav"
+    
+    output_path = os.path.join(_ensure_audio_dir(), output_file)
+    segments = split_text(text)
+    current_span().set(model=model, voice=voice, chars=len(text), format=audio_format, segments=len(segments))
+    if not segments:
+        print("⚠️ No text to convert to speech.")
+        return False
+    
+    print(f"\nGenerating long-form audio using {model}...")
+    print(f"Voice: {voice}")
+    # Repeated sentences are synthesized once and reused
+    keys = [cache_key(model, voice, segment, segment_format) for segment in segments]
+    unique_count = len(set(keys))
+    max_workers = max_workers or longform_workers(unique_count)
+    print(f"Split text into {len(segments)} segments ({unique_count} unique), "
+          f"synthesizing up to {max_workers} at a time")
+    
+    from concurrent.futures import ThreadPoolExecutor
+
+    started = time.time()
+    segment_dir = tempfile.mkdtemp(prefix=".longform_", dir=os.path.dirname(output_path) or ".")
+    part_path = output_path + ".part"
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            unique = {}
+            for segment, key in zip(segments, keys):
+                if key not in unique:
+                    unique[key] = submit_with_context(executor, _synthesize_segment, api_key, segment, model,
+                                                      voice, os.path.join(segment_dir, f"segment_{len(unique):05d}"),
+                                                      segment_format, normalize, use_cache=use_cache)
+            futures = [unique[key] for key in keys]
+            
+            # Includes waiting for the segments, which are appended in order as they finish
+            with span("audio.assemble", path=output_path, segments=len(segments)), open(part_path, "wb") as out:
+                if is_wav:
+                    out.write(wav_header(audio_format))
+                for i, future in enumerate(futures, 1):
+                    segment_path = future.result()
+                    if segment_format == "mp3":
+                        start, stop = 0, None
+                        if normalize and i in (1, len(futures)):
+                            # Trim the silence before the first and after the last segment
+                            analysis = analyze_mp3(segment_path)
+                            if analysis["first_active"] is not None:
+                                if i == 1:
+                                    start = max(0, analysis["first_active"] - TRIM_PAD_FRAMES)
+                                if i == len(futures):
+                                    stop = analysis["last_active"] + 1 + TRIM_PAD_FRAMES
+                        append_frames(segment_path, out, start, stop)
+                    else:
+                        with open(segment_path, "rb") as segment_file:
+                            shutil.copyfileobj(segment_file, out)
+                    print(f"Segment {i}/{len(segments)} ready")
+                if is_wav:
+                    data_size = out.tell() - 44
+                    out.seek(0)
+                    out.write(wav_header(audio_format, data_size))
+        
+        os.replace(part_path, output_path)
+        latency = time.time() - started
+        print(f"✅ Audio generated successfully and saved to {output_path} ({os.path.getsize(output_path)} bytes, {latency:.1f}s)")
+        record_output(output_path, "audio", {"model": model, "text": text, "voice": voice, "format": audio_format,
+                                             "segments": len(segments), "normalized": normalize}, latency)
+        return True
+    except Exception as e:
+        print(f"⚠️ Exception while generating long-form audio: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return False
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
 
 def run_audio_generation_mode(api_key, model_name=None):
     """
@@ -85,9 +697,34 @@ def run_audio_generation_mode(api_key, model_name=None):
     Args:
         api_key (str): The Together AI API key
         model_name (str, optional): Pre-selected model name from previous step
+        
+    Returns:
+        str: The navigation action chosen by the user (PREVIOUS_MENU, MAIN_MENU or EXIT)
+    """
+    while True:
+        # Keep the chosen model for the next audio file
+        model_name = _audio_generation_round(api_key, model_name)
+        action = select_next_action("audio file")
+        if action != AGAIN:
+            return action
+
+def _audio_generation_round(api_key, model_name=None):
+    """
+    Prompt for the settings of one audio file and generate it.
+    
+    Args:
+        api_key (str): The Together AI API key
+        model_name (str, optional): Pre-selected model name from previous step
+        
+    Returns:
+        str: The model that was used
     """
     print("\n=== AUDIO GENERATION MODE ===")
     
+    # Render voice previews in the background while the user picks a model
+    from voice_previews import start_preview_warmup, play_preview
+    start_preview_warmup(api_key)
+    
     audio_models = FAMOUS_MODELS["Audio Models"]
     model_info = None
     
@@ -136,8 +773,20 @@ def run_audio_generation_mode(api_key, model_name=None):
     for i, voice in enumerate(AVAILABLE_VOICES, 1):
         print(f"{i}. {voice}")
     
-    # Let user choose a voice
-    voice_choice = input(f"Choose a voice (1-{len(AVAILABLE_VOICES)}, default is 1): ") or "1"
+    # Let user choose a voice, previewing voices from the local cache on request
+    while True:
+        voice_choice = input(f"Choose a voice (1-{len(AVAILABLE_VOICES)}, default is 1, "
+                             f"or p1-p{len(AVAILABLE_VOICES)} to preview): ") or "1"
+        if not voice_choice.lower().startswith("p"):
+            break
+        try:
+            preview_index = int(voice_choice[1:]) - 1
+            if 0 <= preview_index < len(AVAILABLE_VOICES):
+                play_preview(model_name, AVAILABLE_VOICES[preview_index])
+                continue
+        except ValueError:
+            pass
+        print("Invalid preview choice.")
     
     try:
         voice_index = int(voice_choice) - 1
@@ -158,16 +807,43 @@ def run_audio_generation_mode(api_key, model_name=None):
         text = "Hello, this is a test of the Together AI text to speech system. It sounds quite natural, doesn't it?"
         print(f"Using default text: '{text}'")
     
-    # Get output filename and ensure it has .mp3 extension
-    output_file = input("Enter output filename (default is output.mp3): ") or "output.mp3"
+    # Display available output formats
+    print("\nAvailable Output Formats:")
+    for name, settings in AUDIO_FORMATS.items():
+        print(f"- {name}: {settings['description']}")
     
-    # Ensure the filename ends with .mp3
-    if not output_file.lower().endswith('.mp3'):
-        output_file += '.mp3'
-        print(f"Adding .mp3 extension. Output file will be: {output_file}")
+    # Get output format
+    audio_format = input("Enter output format (default is mp3): ").lower() or "mp3"
+    if audio_format not in AUDIO_FORMATS:
+        print("Invalid format. Using default mp3.")
+        audio_format = "mp3"
+    extension = AUDIO_FORMATS[audio_format]["extension"]
     
-    # Generate the audio
-    success = generate_audio(api_key, text, model_name, voice, output_file)
+    # Get output filename and ensure it has the extension of the chosen format
+    output_file = input(f"Enter output filename (default is output{extension}): ") or f"output{extension}"
+    
+    # Ensure the filename ends with the format's extension
+    if not output_file.lower().endswith(extension):
+        output_file += extension
+        print(f"Adding {extension} extension. Output file will be: {output_file}")
+    
+    # Ask whether to play the audio while it is being generated
+    play = False
+    if AUDIO_FORMATS[audio_format]["playable"]:
+        play = input("Play audio while it is generated? (y/n, default is n): ").lower() == "y"
+    
+    # Ask whether to normalize loudness and trim silence
+    normalize = False
+    if audio_format == "mp3":
+        normalize = input("Normalize loudness and trim silence? (y/n, default is n): ").lower() == "y"
+    
+    # Generate the audio, synthesizing long text in parallel segments
+    if len(text) > LONG_TEXT_THRESHOLD:
+        success = generate_long_audio(api_key, text, model_name, voice, output_file, audio_format=audio_format,
+                                      normalize=normalize)
+    else:
+        success = generate_audio(api_key, text, model_name, voice, output_file, play=play, audio_format=audio_format,
+                                 normalize=normalize)
     
     if success:
         audio_path = os.path.join("Audio", output_file)
@@ -175,31 +851,4 @@ def run_audio_generation_mode(api_key, model_name=None):
         print(f"You can play this file with your default audio player.")
     else:
         print("\n⚠️ Audio generation failed.")
-    
-    # Add options to return to previous menu, main menu, or exit
-    print("\nWhat would you like to do next?")
-    print("1. Generate another audio file")
-    print("2. Return to previous menu")
-    print("3. Return to main menu")
-    print("4. Exit")
-    
-    next_choice = input("Enter your choice (1-4): ")
-    
-    if next_choice == "1":
-        # Run audio generation mode again
-        return run_audio_generation_mode(api_key, model_name)
-    elif next_choice == "2":
-        # Return to previous menu - this will be handled by the calling function
-        return "previous_menu"
-    elif next_choice == "3":
-        # Return to main menu - this will be handled by the calling function
-        return "main_menu"
-    elif next_choice == "4":
-        # Exit
-        print("Exiting program.")
-        import sys
-        sys.exit(0)
-    else:
-        # Default to returning to previous menu
-        print("Invalid choice. Returning to previous menu.")
-        return "previous_menu"
+    return model_name
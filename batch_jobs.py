@@ -0,0 +1,463 @@
+"""
+Batch jobs module.
+
+This module provides resumable batch runners that work through a CSV or JSONL
+manifest of image prompts or texts to speak. Progress is recorded in a durable checkpoint file so an
+interrupted job picks up exactly where it stopped.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from models_config import AUDIO_FORMATS
+from scheduler import priority, BULK
+from llm_providers import provider_api_key
+from key_pool import get_key_pool
+from usage_ledger import usage_job
+from tracing import span
+
+# The journal of state changes is fsynced at most this often; every line is flushed to the OS at once
+JOURNAL_SYNC_INTERVAL = 1.0
+
+# Item states recorded in the checkpoint file
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+# Manifest columns passed to generate_image, with the type CSV values are converted to
+IMAGE_PARAMS = {
+    "prompt": str,
+    "model": str,
+    "negative_prompt": str,
+    "height": int,
+    "width": int,
+    "steps": int,
+    "guidance": float,
+    "output_format": str,
+    "response_format": str,
+    "seed": int,
+    "n": int,
+    "save_path": str,
+    "reference_image": str,
+}
+
+# Manifest columns used for audio items; "output" is the file name inside Audio/
+AUDIO_PARAMS = ["text", "voice", "model", "format", "output"]
+
+def load_manifest(manifest_path):
+    """
+    Load the items of a CSV or JSONL manifest.
+
+    Every item gets an "id": the manifest's own id column if present,
+    otherwise its position in the file.
+
+    Args:
+        manifest_path (str): Path to a .csv or .jsonl manifest
+
+    Returns:
+        list: The manifest items as dictionaries
+    """
+    items = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for index, row in enumerate(rows, 1):
+            item = {key: value for key, value in row.items() if value not in (None, "")}
+            item["id"] = str(item.get("id", index))
+            items.append(item)
+    return items
+
+class Checkpoint:
+    """
+    Durable record of the state of every item in a batch job.
+
+    The checkpoint is a JSON snapshot plus an append-only journal next to it
+    (path + ".journal"). Each state change appends one line to the journal, so
+    recording it costs the same however large the batch is; the journal is
+    folded into the snapshot, which is replaced atomically, when the
+    checkpoint is loaded and when the run closes it. A journal line cut short
+    by a crash is ignored.
+    """
+
+    def __init__(self, path, items):
+        """
+        Load an existing checkpoint or start a new one for the given items.
+
+        Items that were in flight when the previous run stopped are returned to
+        pending so they are retried.
+
+        Args:
+            path (str): Path to the checkpoint file
+            items (list): The manifest items
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.lock = threading.Lock()
+        self.items = {}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.items = json.load(f).get("items", {})
+        self._replay_journal()
+
+        for item in items:
+            entry = self.items.setdefault(item["id"], {"state": PENDING, "attempts": 0, "outputs": []})
+            if entry["state"] == IN_FLIGHT:
+                entry["state"] = PENDING
+        self.save()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._synced = time.monotonic()
+
+    def _replay_journal(self):
+        """
+        Apply the state changes journaled since the last snapshot.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    break  # A line cut short by a crash; nothing after it was written
+                self.items[change["id"]] = change["entry"]
+
+    def save(self):
+        """
+        Write the snapshot to disk atomically and empty the journal it now includes.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"updated": time.time(), "items": self.items}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        open(self.journal_path, "w").close()
+
+    def close(self):
+        """
+        Fold the journal into the snapshot and stop journaling.
+        """
+        with self.lock:
+            if not self._journal.closed:
+                self._journal.close()
+            self.save()
+
+    def mark(self, item_id, state, **fields):
+        """
+        Record a new state for an item and append it to the journal.
+
+        Args:
+            item_id (str): The manifest item id
+            state (str): One of pending, in_flight, done or failed
+            **fields: Extra fields to store, e.g. outputs or error
+        """
+        with self.lock:
+            entry = self.items[item_id]
+            entry["state"] = state
+            entry.update(fields)
+            if state == IN_FLIGHT:
+                entry["attempts"] += 1
+            self._journal.write(json.dumps({"id": item_id, "entry": entry}) + "\n")
+            self._journal.flush()
+            if time.monotonic() - self._synced >= JOURNAL_SYNC_INTERVAL:
+                os.fsync(self._journal.fileno())
+                self._synced = time.monotonic()
+
+    def state(self, item_id):
+        """
+        Get the recorded state of an item.
+
+        Args:
+            item_id (str): The manifest item id
+
+        Returns:
+            str: The item's state
+        """
+        with self.lock:
+            return self.items[item_id]["state"]
+
+    def counts(self):
+        """
+        Count items per state.
+
+        Returns:
+            dict: Number of items in each state
+        """
+        with self.lock:
+            counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+            for entry in self.items.values():
+                counts[entry["state"]] += 1
+            return counts
+
+def run_batch(items, worker, checkpoint_path, concurrency=2, retry_failed=False):
+    """
+    Run a worker function over manifest items with a resumable checkpoint.
+
+    Items already done are skipped. The first Ctrl+C stops submitting new items
+    and waits for the in-flight ones to finish; a second Ctrl+C aborts.
+
+    Args:
+        items (list): The manifest items
+        worker (callable): Function taking an item and returning (success, fields)
+        checkpoint_path (str): Path to the checkpoint file
+        concurrency (int): Number of items processed at the same time
+        retry_failed (bool): Whether items that failed in a previous run are retried
+
+    Returns:
+        Checkpoint: The checkpoint after the run
+    """
+    checkpoint = Checkpoint(checkpoint_path, items)
+    job = f"batch:{os.path.basename(checkpoint_path)}"
+    todo = [item for item in items
+            if checkpoint.state(item["id"]) == PENDING
+            or (retry_failed and checkpoint.state(item["id"]) == FAILED)]
+    print(f"\n{len(items) - len(todo)} of {len(items)} items already processed, {len(todo)} to go.")
+
+    stop = threading.Event()
+    previous_handler = None
+
+    def request_stop(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        print("\nStopping after in-flight items finish (press Ctrl+C again to abort)...")
+        stop.set()
+
+    if threading.current_thread() is threading.main_thread():
+        previous_handler = signal.signal(signal.SIGINT, request_stop)
+
+    def run_item(item):
+        checkpoint.mark(item["id"], IN_FLIGHT, error=None, outputs=[])
+        started = time.time()
+        try:
+            # Batch items yield to interactive and normal provider calls
+            with priority(BULK), usage_job(job), span("batch.item", id=item["id"]):
+                success, fields = worker(item)
+        except Exception as e:
+            success, fields = False, {"error": str(e)}
+        fields["latency"] = round(time.time() - started, 3)
+        checkpoint.mark(item["id"], DONE if success else FAILED, **fields)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            queue = iter(todo)
+            running = set()
+            while True:
+                while not stop.is_set() and len(running) < concurrency:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    running.add(executor.submit(run_item, item))
+                if not running:
+                    break
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+        checkpoint.close()
+
+    counts = checkpoint.counts()
+    print(f"\nBatch finished: {counts[DONE]} done, {counts[FAILED]} failed, {counts[PENDING]} pending.")
+    print(f"Checkpoint saved to {checkpoint_path}")
+    return checkpoint
+
+def write_summary(checkpoint, summary_path):
+    """
+    Write a CSV summary of a batch with per-item state, latency and byte counts.
+
+    Args:
+        checkpoint (Checkpoint): The checkpoint of the batch
+        summary_path (str): Where to write the summary
+    """
+    with checkpoint.lock:
+        entries = list(checkpoint.items.items())
+    with open(summary_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "state", "attempts", "latency", "bytes", "outputs", "error"])
+        for item_id, entry in entries:
+            writer.writerow([item_id, entry["state"], entry.get("attempts", 0), entry.get("latency", ""),
+                             entry.get("bytes", ""), ";".join(entry.get("outputs", [])), entry.get("error") or ""])
+
+    total_bytes = sum(entry.get("bytes") or 0 for _, entry in entries)
+    latencies = [entry["latency"] for _, entry in entries if entry["state"] == DONE and entry.get("latency")]
+    print(f"Summary saved to {summary_path} ({total_bytes} bytes written"
+          + (f", average latency {sum(latencies) / len(latencies):.2f}s)" if latencies else ")"))
+
+def _image_worker(api_key, defaults):
+    """
+    Build the worker that generates the images of one manifest item.
+
+    Args:
+        api_key (str): The Together AI API key
+        defaults (dict): Parameters applied to items that do not set them
+
+    Returns:
+        callable: The worker function for run_batch
+    """
+    # The feature modules are imported by the batch kind that uses them
+    from image_gen import generate_image, image_file_path
+
+    def worker(item):
+        params = dict(defaults)
+        for name, convert in IMAGE_PARAMS.items():
+            if name in item:
+                params[name] = convert(item[name])
+        params.setdefault("save_path", f"batch_{item['id']}")
+
+        success = generate_image(api_key, **params)
+        n = params.get("n", 1)
+        output_format = params.get("output_format", "jpeg")
+        outputs = [path for path in (image_file_path(params["save_path"], i, n, output_format) for i in range(n))
+                   if os.path.exists(path)]
+        return success, {"outputs": outputs, "bytes": sum(os.path.getsize(path) for path in outputs)}
+    return worker
+
+def run_image_batch(api_key, manifest_path, checkpoint_path=None, concurrency=2,
+                    retry_failed=False, **defaults):
+    """
+    Generate images for every prompt in a manifest, resuming from a checkpoint.
+
+    Manifest columns match the parameters of generate_image (prompt, model,
+    steps, width, height, guidance, seed, n, save_path, ...).
+
+    Args:
+        api_key (str): The Together AI API key
+        manifest_path (str): Path to a .csv or .jsonl manifest
+        checkpoint_path (str, optional): Path to the checkpoint file, defaults to the manifest path + ".checkpoint.json"
+        concurrency (int): Number of prompts generated at the same time
+        retry_failed (bool): Whether items that failed in a previous run are retried
+        **defaults: generate_image parameters applied to items that do not set them
+
+    Returns:
+        Checkpoint: The checkpoint after the run
+    """
+    items = load_manifest(manifest_path)
+    checkpoint_path = checkpoint_path or manifest_path + ".checkpoint.json"
+    checkpoint = run_batch(items, _image_worker(api_key, defaults), checkpoint_path,
+                           concurrency=concurrency, retry_failed=retry_failed)
+    if defaults.get("postprocess"):
+        from image_postprocess import wait_for_postprocess
+        variants = wait_for_postprocess()
+        print(f"✅ {len(variants)} post-processed variant(s) written")
+    write_summary(checkpoint, manifest_path + ".summary.csv")
+    return checkpoint
+
+def _audio_worker(api_key, defaults):
+    """
+    Build the worker that synthesizes the speech of one manifest item.
+
+    Args:
+        api_key (str): The Together AI API key
+        defaults (dict): Values for voice, model, format and normalize used when an item does not set them
+
+    Returns:
+        callable: The worker function for run_batch
+    """
+    from audio_gen import generate_audio, generate_long_audio, LONG_TEXT_THRESHOLD
+
+    def worker(item):
+        params = dict(defaults)
+        params.update({name: item[name] for name in AUDIO_PARAMS if name in item})
+        if not params.get("text"):
+            return False, {"error": "missing text"}
+        audio_format = params.get("format", "mp3")
+        if audio_format not in AUDIO_FORMATS:
+            return False, {"error": f"unsupported format {audio_format}"}
+        extension = AUDIO_FORMATS[audio_format]["extension"]
+        output_file = params.get("output") or f"batch_{item['id']}{extension}"
+        if not output_file.lower().endswith(extension):
+            output_file += extension
+
+        kwargs = {key: params[key] for key in ("model", "voice") if params.get(key)}
+        kwargs["audio_format"] = audio_format
+        kwargs["normalize"] = bool(params.get("normalize"))
+        if len(params["text"]) > LONG_TEXT_THRESHOLD:
+            success = generate_long_audio(api_key, params["text"], output_file=output_file, **kwargs)
+        else:
+            success = generate_audio(api_key, params["text"], output_file=output_file, **kwargs)
+
+        output_path = os.path.join("Audio", output_file)
+        outputs = [output_path] if success and os.path.exists(output_path) else []
+        return success, {"outputs": outputs, "bytes": sum(os.path.getsize(path) for path in outputs)}
+    return worker
+
+def run_audio_batch(api_key, manifest_path, checkpoint_path=None, concurrency=4,
+                    retry_failed=False, summary_path=None, **defaults):
+    """
+    Synthesize speech for every text in a manifest, resuming from a checkpoint.
+
+    Manifest columns are text, voice, model, format and output (file name inside Audio/).
+    Long texts are synthesized with generate_long_audio.
+
+    Args:
+        api_key (str): The Together AI API key
+        manifest_path (str): Path to a .csv or .jsonl manifest
+        checkpoint_path (str, optional): Path to the checkpoint file, defaults to the manifest path + ".checkpoint.json"
+        concurrency (int): Number of items synthesized at the same time
+        retry_failed (bool): Whether items that failed in a previous run are retried
+        summary_path (str, optional): Path to the CSV summary, defaults to the manifest path + ".summary.csv"
+        **defaults: voice, model, format and normalize applied to items that do not set them
+
+    Returns:
+        Checkpoint: The checkpoint after the run
+    """
+    items = load_manifest(manifest_path)
+    checkpoint_path = checkpoint_path or manifest_path + ".checkpoint.json"
+    checkpoint = run_batch(items, _audio_worker(api_key, defaults), checkpoint_path,
+                           concurrency=concurrency, retry_failed=retry_failed)
+    write_summary(checkpoint, summary_path or manifest_path + ".summary.csv")
+    return checkpoint
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a resumable batch of generations from a manifest.")
+    parser.add_argument("kind", choices=["images", "audio"], help="The type of batch to run")
+    parser.add_argument("manifest", help="Path to a .csv or .jsonl manifest")
+    parser.add_argument("--checkpoint", help="Path to the checkpoint file")
+    parser.add_argument("--concurrency", type=int, help="Number of items processed at the same time")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry items that failed in a previous run")
+    parser.add_argument("--postprocess", action="store_true", help="Render thumbnails and WebP variants of each image")
+    parser.add_argument("--voice", help="Default voice for audio items")
+    parser.add_argument("--format", choices=list(AUDIO_FORMATS), help="Default output format for audio items")
+    parser.add_argument("--normalize", action="store_true", help="Normalize loudness and trim silence of MP3 audio")
+    parser.add_argument("--model", help="Default model for items that do not set one")
+    args = parser.parse_args()
+
+    api_key = provider_api_key("together")
+    if not api_key:
+        print("TOGETHER_API_KEY or TOGETHER_API_KEYS must be set to run a batch.")
+        sys.exit(1)
+
+    # Each pooled key brings its own quota, so the default concurrency grows with the pool
+    keys = max(1, len(get_key_pool("together")))
+    defaults = {"model": args.model} if args.model else {}
+    if args.kind == "images":
+        checkpoint = run_image_batch(api_key, args.manifest, args.checkpoint, args.concurrency or 2 * keys,
+                                     args.retry_failed, postprocess=args.postprocess, **defaults)
+    else:
+        if args.voice:
+            defaults["voice"] = args.voice
+        if args.format:
+            defaults["format"] = args.format
+        if args.normalize:
+            defaults["normalize"] = True
+        checkpoint = run_audio_batch(api_key, args.manifest, args.checkpoint, args.concurrency or 4 * keys,
+                                     args.retry_failed, **defaults)
+    if keys > 1:
+        print("\nRequests per key:")
+        for name, stats in get_key_pool("together").stats().items():
+            print(f"  {name}: {stats['requests']} requests, {stats['rate_limited']} rate limited, "
+                  f"{stats['unauthorized']} rejected")
+    sys.exit(0 if checkpoint.counts()[FAILED] == 0 else 1)
@@ -0,0 +1,126 @@
+"""
+Startup benchmark.
+
+This script measures how long each entry point takes to import in a fresh
+interpreter and fails if any of them exceeds its budget, so heavy
+dependencies creeping back into module load are caught early.
+
+Usage:
+    python bench_startup.py [--repeat 5] [--scale 1.0] [--top 5]
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# Import-time budgets in milliseconds, on top of bare interpreter startup
+BUDGETS_MS = {
+    "main": 50,
+    "cli": 30,
+    "image_gen": 60,
+    "audio_gen": 60,
+    "batch_jobs": 80,
+    "output_index": 30,
+}
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _run(code, importtime=False):
+    """
+    Run Python code in a fresh interpreter from the repository directory.
+
+    Args:
+        code (str): The code to run
+        importtime (bool): Whether to collect -X importtime output
+
+    Returns:
+        subprocess.CompletedProcess: The finished process
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    return subprocess.run(command + ["-c", code], cwd=REPO_DIR, capture_output=True, text=True)
+
+def _time_code(code, repeat):
+    """
+    Measure the median wall time of running code in a fresh interpreter.
+
+    Args:
+        code (str): The code to run
+        repeat (int): Number of runs
+
+    Returns:
+        float or None: Median milliseconds, or None if the code failed
+    """
+    timer = "import time; _t = time.perf_counter(); {code}; print((time.perf_counter() - _t) * 1000)"
+    samples = []
+    for _ in range(repeat):
+        result = _run(timer.format(code=code))
+        if result.returncode != 0:
+            return None
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def slowest_imports(module, top=5):
+    """
+    List the imports that contribute most to a module's import time.
+
+    Args:
+        module (str): The module to import
+        top (int): Number of entries to return
+
+    Returns:
+        list: (cumulative milliseconds, module name) tuples, slowest first
+    """
+    def import_times(code):
+        times = {}
+        for line in _run(code, importtime=True).stderr.splitlines():
+            if line.startswith("import time:") and "cumulative" not in line:
+                _, cumulative, name = line[len("import time:"):].split("|")
+                times[name.strip()] = int(cumulative) / 1000
+        return times
+
+    # Leave out what the interpreter imports at startup anyway
+    baseline = import_times("pass")
+    entries = [(cumulative, name) for name, cumulative in import_times(f"import {module}").items()
+               if name != module and name not in baseline]
+    return sorted(entries, reverse=True)[:top]
+
+def run_benchmark(repeat=5, scale=1.0, top=0):
+    """
+    Measure every entry point against its budget.
+
+    Args:
+        repeat (int): Number of runs per entry point
+        scale (float): Multiplier applied to every budget, for slower machines
+        top (int): Number of slowest imports to show for entry points over budget
+
+    Returns:
+        bool: True if every entry point imported within its budget
+    """
+    print(f"{'Entry point':<14} {'Import (ms)':>12} {'Budget (ms)':>12}  Result")
+    all_ok = True
+    for module, budget in BUDGETS_MS.items():
+        budget *= scale
+        elapsed = _time_code(f"import {module}", repeat)
+        if elapsed is None:
+            print(f"{module:<14} {'-':>12} {budget:>12.0f}  ⚠️ import failed")
+            all_ok = False
+            continue
+        ok = elapsed <= budget
+        all_ok = all_ok and ok
+        print(f"{module:<14} {elapsed:>12.1f} {budget:>12.0f}  {'✅' if ok else '⚠️ over budget'}")
+        if not ok and top:
+            for cumulative, name in slowest_imports(module, top):
+                print(f"    {cumulative:8.1f} ms  {name}")
+    return all_ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of each entry point against its budget.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per entry point; the median is used")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget by this factor")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports shown for entry points over budget")
+    args = parser.parse_args()
+    sys.exit(0 if run_benchmark(args.repeat, args.scale, args.top) else 1)
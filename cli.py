@@ -0,0 +1,344 @@
+"""
+Command-line interface.
+
+This module runs the chat, multi-agent, image, audio and model listing
+features without any interactive prompts. Providers, models, parameters and
+file paths are given as flags, prompts are read from flags, files or stdin,
+and each result is written to stdout as one JSON object per line. Progress
+messages go to stderr so stdout stays machine-readable.
+
+Examples:
+    python cli.py chat --provider together --prompt "Explain recursion"
+    echo "Write a bubble sort" | python cli.py agents --provider openai
+    python cli.py image --prompt-file prompt.txt --steps 4 --output sunset
+    python cli.py audio --prompt "Welcome aboard!" --voice "laidback woman" --format wav
+    python cli.py models --category image
+
+Developed by Blackbeard (https://blackbeard.one | https://tentitanics.com | https://github.com/blackbeardONE)
+© 2023-2024 Blackbeard. All rights reserved.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+from models_config import FAMOUS_MODELS, AVAILABLE_VOICES, AUDIO_FORMATS
+from llm_providers import PROVIDERS, DEFAULT_SYSTEM_INSTRUCTION, build_llm, provider_api_key
+from api_utils import prewarm_connections, PREWARM_HOSTS
+
+MODEL_CATEGORIES = {"chat": "Chat Models", "image": "Image Models", "audio": "Audio Models"}
+
+def read_prompt(args):
+    """
+    Read the prompt from --prompt, --prompt-file or stdin, in that order.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        str: The prompt
+
+    Raises:
+        ValueError: If no prompt was given
+    """
+    if args.prompt:
+        return args.prompt
+    if args.prompt_file and args.prompt_file != "-":
+        with open(args.prompt_file, encoding="utf-8") as f:
+            return f.read().strip()
+    if args.prompt_file == "-" or not sys.stdin.isatty():
+        prompt = sys.stdin.read().strip()
+        if prompt:
+            return prompt
+    raise ValueError("No prompt given. Use --prompt, --prompt-file or pipe it to stdin.")
+
+def together_api_key(args):
+    """
+    Resolve the Together AI API key for image and audio commands.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        str: The API key
+
+    Raises:
+        ValueError: If no key is configured
+    """
+    api_key = provider_api_key("together", args.api_key)
+    if not api_key:
+        raise ValueError("TOGETHER_API_KEY must be set or --api-key given")
+    return api_key
+
+def _run_with_usage(provider, func, *args):
+    """
+    Run a function, collecting token usage for OpenAI models.
+
+    Args:
+        provider (str): The provider the LLM was built for
+        func (callable): The function to run
+        *args: Arguments for the function
+
+    Returns:
+        tuple: The function's result and a usage dict (or None when usage is not tracked)
+    """
+    if provider != "openai":
+        return func(*args), None
+    from langchain_community.callbacks.manager import get_openai_callback
+    with get_openai_callback() as cb:
+        result = func(*args)
+    return result, {"prompt_tokens": cb.prompt_tokens, "completion_tokens": cb.completion_tokens,
+                    "total_tokens": cb.total_tokens, "cost": cb.total_cost}
+
+def cmd_chat(args):
+    """
+    Get a single response for a prompt, or one per input line with --lines.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        list: One result dict per prompt
+    """
+    from agent_system_direct import ask_ai
+
+    prompt = read_prompt(args)
+    prompts = [line.strip() for line in prompt.splitlines() if line.strip()] if args.lines else [prompt]
+    llm = build_llm(args.provider, args.model, args.api_key, args.api, args.temperature, args.max_tokens)
+    system_instruction = args.system or DEFAULT_SYSTEM_INSTRUCTION
+
+    results = []
+    for prompt in prompts:
+        started = time.time()
+        try:
+            response, usage = _run_with_usage(args.provider, ask_ai, llm, prompt, system_instruction)
+            results.append({"ok": True, "prompt": prompt, "response": response, "usage": usage,
+                            "latency": round(time.time() - started, 3)})
+        except Exception as e:
+            results.append({"ok": False, "prompt": prompt, "error": str(e)})
+    return results
+
+def cmd_agents(args):
+    """
+    Run the planner, coder and critic agents on a request.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        list: A single result dict with the plan, code and review
+    """
+    from agent_system_direct import run_multi_agent_system
+
+    request = read_prompt(args)
+    llm = build_llm(args.provider, args.model, args.api_key, args.api, args.temperature, args.max_tokens)
+    started = time.time()
+    result, usage = _run_with_usage(args.provider, run_multi_agent_system, llm, request)
+    return [dict(result, ok=True, usage=usage, latency=round(time.time() - started, 3))]
+
+def cmd_image(args):
+    """
+    Generate images from a prompt.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        list: A single result dict listing the saved files
+    """
+    from image_gen import generate_image, image_file_path
+    from image_postprocess import wait_for_postprocess
+
+    prompt = read_prompt(args)
+    steps = args.steps or (10 if "FLUX.1-schnell" in args.model else 20)
+    started = time.time()
+    success = generate_image(
+        api_key=together_api_key(args),
+        prompt=prompt,
+        model=args.model,
+        negative_prompt=args.negative_prompt,
+        height=args.height,
+        width=args.width,
+        steps=steps,
+        guidance=args.guidance,
+        output_format=args.format,
+        response_format=args.response_format,
+        seed=args.seed,
+        n=args.n,
+        save_path=args.output,
+        reference_image=args.reference_image,
+        postprocess=args.postprocess or None,
+    )
+    files = [path for path in (image_file_path(args.output, i, args.n, args.format) for i in range(args.n))
+             if os.path.exists(path)]
+    variants = wait_for_postprocess() if args.postprocess else []
+    return [{"ok": success, "prompt": prompt, "model": args.model, "files": files, "variants": variants,
+             "latency": round(time.time() - started, 3)}]
+
+def cmd_audio(args):
+    """
+    Synthesize speech from text.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        list: A single result dict with the path of the audio file
+    """
+    from audio_gen import generate_audio, generate_long_audio, LONG_TEXT_THRESHOLD
+
+    text = read_prompt(args)
+    extension = AUDIO_FORMATS[args.format]["extension"]
+    output_file = args.output or f"output{extension}"
+    if not output_file.lower().endswith(extension):
+        output_file += extension
+
+    started = time.time()
+    if len(text) > LONG_TEXT_THRESHOLD:
+        success = generate_long_audio(together_api_key(args), text, args.model, args.voice, output_file,
+                                      audio_format=args.format, normalize=args.normalize, use_cache=not args.no_cache)
+    else:
+        success = generate_audio(together_api_key(args), text, args.model, args.voice, output_file,
+                                 use_cache=not args.no_cache, audio_format=args.format, normalize=args.normalize)
+    output_path = os.path.join("Audio", output_file)
+    return [{"ok": success, "text": text, "model": args.model, "voice": args.voice, "format": args.format,
+             "file": output_path if success else None,
+             "bytes": os.path.getsize(output_path) if success and os.path.exists(output_path) else None,
+             "latency": round(time.time() - started, 3)}]
+
+def cmd_models(args):
+    """
+    List the famous models, or the models available on Together AI with --remote.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        list: One dict per model
+    """
+    if args.remote:
+        from model_selection import list_together_models
+        model_data = list_together_models(together_api_key(args))
+        if args.pricing == "free":
+            names = model_data["free_models"]
+        elif args.pricing == "paid":
+            names = model_data["paid_models"]
+        else:
+            names = model_data["all_models"]
+        return [model_data["model_details"].get(name, {"id": name}) for name in names]
+
+    categories = [MODEL_CATEGORIES[args.category]] if args.category else list(FAMOUS_MODELS)
+    models = []
+    for category in categories:
+        for model in FAMOUS_MODELS[category]:
+            if args.pricing and model.get("is_free", True) != (args.pricing == "free"):
+                continue
+            models.append(dict(model, category=category))
+    return models
+
+def build_parser():
+    """
+    Build the argument parser with its subcommands.
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(description="Run KMTSAI features without interactive prompts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_prompt_args(subparser, what):
+        subparser.add_argument("--prompt", help=f"The {what}")
+        subparser.add_argument("--prompt-file", help=f"Read the {what} from a file ('-' for stdin)")
+        subparser.add_argument("--api-key", help="API key, read from the provider's environment variable if not given")
+
+    def add_llm_args(subparser):
+        subparser.add_argument("--provider", choices=list(PROVIDERS), default="together",
+                               help="together uses the OpenAI-compatible API (default: together)")
+        subparser.add_argument("--model", help="The model, defaults to the provider's default chat model")
+        subparser.add_argument("--api", choices=["chat", "completions"], default="chat",
+                               help="OpenAI-compatible API interface (default: chat)")
+        subparser.add_argument("--temperature", type=float, default=0)
+        subparser.add_argument("--max-tokens", type=int, default=1000)
+
+    chat = subparsers.add_parser("chat", help="Get a response to a prompt")
+    add_prompt_args(chat, "message")
+    add_llm_args(chat)
+    chat.add_argument("--system", help="System instruction")
+    chat.add_argument("--lines", action="store_true", help="Treat each input line as a separate prompt")
+
+    agents = subparsers.add_parser("agents", help="Run the planner, coder and critic agents on a request")
+    add_prompt_args(agents, "coding request")
+    add_llm_args(agents)
+
+    image = subparsers.add_parser("image", help="Generate images")
+    add_prompt_args(image, "image prompt")
+    image.add_argument("--model", default="black-forest-labs/FLUX.1-schnell")
+    image.add_argument("--negative-prompt")
+    image.add_argument("--width", type=int, default=1024)
+    image.add_argument("--height", type=int, default=1024)
+    image.add_argument("--steps", type=int, help="Generation steps (default: 10 for FLUX.1-schnell, otherwise 20)")
+    image.add_argument("--guidance", type=float, default=3.5)
+    image.add_argument("--seed", type=int)
+    image.add_argument("--n", type=int, default=1, help="Number of images")
+    image.add_argument("--format", choices=["jpeg", "png"], default="jpeg")
+    image.add_argument("--response-format", choices=["base64", "url"], default="base64")
+    image.add_argument("--reference-image", help="Reference image path or URL (FLUX.1-depth)")
+    image.add_argument("--output", default="output_image", help="Base file name inside Images/")
+    image.add_argument("--postprocess", action="store_true", help="Also render thumbnails and WebP variants")
+
+    audio = subparsers.add_parser("audio", help="Synthesize speech")
+    add_prompt_args(audio, "text to speak")
+    audio.add_argument("--model", default="cartesia/sonic-2")
+    audio.add_argument("--voice", choices=AVAILABLE_VOICES, default=AVAILABLE_VOICES[0])
+    audio.add_argument("--format", choices=list(AUDIO_FORMATS), default="mp3")
+    audio.add_argument("--output", help="File name inside Audio/ (default: output.<ext>)")
+    audio.add_argument("--normalize", action="store_true", help="Normalize loudness and trim silence (mp3 only)")
+    audio.add_argument("--no-cache", action="store_true", help="Always synthesize, bypassing the TTS cache")
+
+    models = subparsers.add_parser("models", help="List models")
+    models.add_argument("--category", choices=list(MODEL_CATEGORIES))
+    models.add_argument("--pricing", choices=["free", "paid"])
+    models.add_argument("--remote", action="store_true", help="List the models available on Together AI")
+    models.add_argument("--api-key", help="Together AI API key for --remote")
+
+    return parser
+
+COMMANDS = {
+    "chat": cmd_chat,
+    "agents": cmd_agents,
+    "image": cmd_image,
+    "audio": cmd_audio,
+    "models": cmd_models,
+}
+
+def main(argv=None):
+    """
+    Run a subcommand and write its results to stdout as JSON lines.
+
+    Args:
+        argv (list, optional): The arguments, defaults to sys.argv[1:]
+
+    Returns:
+        int: The exit code, 0 if every result succeeded and 1 otherwise
+    """
+    args = build_parser().parse_args(argv)
+    # Image and audio requests use the shared session; connect while the prompt is read and modules load
+    if args.command in ("image", "audio"):
+        prewarm_connections(PREWARM_HOSTS[f"{args.command}_generation"])
+    try:
+        # Everything the features print is progress output; keep stdout for results
+        with redirect_stdout(sys.stderr):
+            results = COMMANDS[args.command](args)
+    except SystemExit as e:
+        results = [{"ok": False, "error": f"{args.command} aborted (exit code {e.code})"}]
+    except Exception as e:
+        results = [{"ok": False, "error": str(e)}]
+
+    for result in results:
+        print(json.dumps(result, default=str))
+    return 0 if all(result.get("ok", True) for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Request coalescing module.
+
+This module lets concurrent callers that make the same request share one
+upstream call: the first caller runs it and every caller that arrives while
+it is in flight waits for it and receives the same result or exception.
+Nothing is kept once the call finishes, so results are never stale; only
+in-flight work is shared.
+"""
+
+import json
+import hashlib
+import threading
+import functools
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+class _Call:
+    """
+    One in-flight call and the outcome its waiters receive.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome with concurrent callers.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.upstream = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run a function, or wait for the in-flight run with the same key.
+
+        Args:
+            key (hashable): Identifies identical requests
+            func (callable): The function to run
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+
+        Returns:
+            The function's result, shared by all callers with the same key
+
+        Raises:
+            Exception: Whatever the shared run raised
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.upstream += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """
+        Report how many calls were made and how many of them shared an upstream call.
+
+        Returns:
+            dict: The calls, upstream calls, coalesced calls and calls in flight
+        """
+        with self._lock:
+            return {"calls": self.calls, "upstream": self.upstream, "coalesced": self.coalesced,
+                    "in_flight": len(self._calls)}
+
+def single_flight(name):
+    """
+    Get the coalescing group with a name, creating it on first use.
+
+    Args:
+        name (str): The group name, e.g. "chat"
+
+    Returns:
+        SingleFlight: The group
+    """
+    if name not in _groups:
+        with _groups_lock:
+            if name not in _groups:
+                _groups[name] = SingleFlight(name)
+    return _groups[name]
+
+def request_key(*parts):
+    """
+    Build a coalescing key from JSON-serializable request parts.
+
+    Args:
+        *parts: The parts that make two requests identical, e.g. the URL and payload
+
+    Returns:
+        str: A digest of the parts
+    """
+    encoded = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+def coalesce(name):
+    """
+    Decorate a function so concurrent calls with the same arguments share one run.
+
+    Args:
+        name (str): The coalescing group of the function
+
+    Returns:
+        callable: The decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = request_key(func.__module__, func.__qualname__, args, kwargs)
+            return single_flight(name).do(key, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def coalesce_stats():
+    """
+    Report every coalescing group.
+
+    Returns:
+        dict: Group name to SingleFlight.stats()
+    """
+    return {name: group.stats() for name, group in list(_groups.items())}
@@ -0,0 +1,249 @@
+"""
+Download utilities module.
+
+This module provides a pooled, concurrent download pipeline for files
+returned as URLs by the generation APIs. Downloads stream to disk in chunks,
+resume from where they stopped after a failure, and verify the content length.
+A partial file is only resumed for the URL it was started from, and only if
+the server still has the same version of it (If-Range).
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from api_utils import get_session
+from scheduler import submit_with_context
+from tracing import span
+
+DOWNLOAD_WORKERS = 4
+CHUNK_SIZE = 64 * 1024
+MAX_ATTEMPTS = 3
+# Seconds waited before the next attempt, doubling from 2 up to this
+MAX_BACKOFF = 10
+# Client errors that may succeed when asked again; any other 4xx fails the download at once
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+_executor = None
+_pending = []
+_pending_lock = threading.Lock()
+
+def _get_executor():
+    """
+    Get the shared download executor, creating it on first use.
+
+    Returns:
+        ThreadPoolExecutor: The executor running downloads
+    """
+    global _executor
+    with _pending_lock:
+        if _executor is None:
+            # concurrent.futures is imported on first use so importing this module stays cheap
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+        return _executor
+
+def _expected_total(response, offset):
+    """
+    Work out the full size of a download from the response headers.
+
+    Args:
+        response: The streaming HTTP response
+        offset (int): The number of bytes already on disk
+
+    Returns:
+        int or None: The total size in bytes, or None if the server did not say
+    """
+    content_range = response.headers.get("Content-Range", "")
+    match = re.search(r"/(\d+)$", content_range)
+    if match:
+        return int(match.group(1))
+    content_length = response.headers.get("Content-Length")
+    if content_length is not None:
+        return offset + int(content_length)
+    return None
+
+def _read_source(source_path):
+    """
+    Read the sidecar recording which URL and version a partial file holds.
+
+    Returns:
+        dict: The URL, ETag and Last-Modified of the partial, or an empty dict
+    """
+    try:
+        with open(source_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_source(source_path, url, response):
+    """
+    Record the URL and version validators of the partial file being written.
+    """
+    with open(source_path, "w") as f:
+        json.dump({"url": url, "etag": response.headers.get("ETag"),
+                   "last_modified": response.headers.get("Last-Modified")}, f)
+
+def _resume_headers(part_path, source_path, url):
+    """
+    Decide whether a partial file can be resumed and build the request headers for it.
+
+    A partial left by another URL (e.g. an earlier run with the same save
+    path) is discarded so its bytes are never joined to the new file.
+
+    Returns:
+        tuple: The number of bytes to resume from and the request headers
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if not offset:
+        return 0, {}
+    source = _read_source(source_path)
+    if source.get("url") != url:
+        os.remove(part_path)
+        return 0, {}
+    headers = {"Range": f"bytes={offset}-"}
+    validator = source.get("etag") or source.get("last_modified")
+    if validator:
+        # The server answers 200 with the whole file if it changed since the partial was written
+        headers["If-Range"] = validator
+    return offset, headers
+
+def download_file(url, file_path, chunk_size=CHUNK_SIZE, max_attempts=MAX_ATTEMPTS):
+    """
+    Download a URL to a file, streaming in chunks and resuming after failures.
+
+    Data is written to a ".part" file that is renamed into place only once the
+    expected number of bytes has arrived.
+
+    Args:
+        url (str): The URL to download
+        file_path (str): Where to save the file
+        chunk_size (int): Size of each chunk written to disk
+        max_attempts (int): Number of attempts before giving up
+
+    Returns:
+        bool: True if the download completed and verified, False otherwise
+    """
+    with span("http.download", url=url, path=file_path) as download:
+        ok = _download_file(url, file_path, chunk_size, max_attempts)
+        download.set(ok=ok, bytes=os.path.getsize(file_path) if ok else None)
+        return ok
+
+def _download_file(url, file_path, chunk_size, max_attempts):
+    """
+    Download a URL to a file, see download_file.
+    """
+    part_path = file_path + ".part"
+    source_path = part_path + ".src"
+    session = get_session()
+
+    for attempt in range(1, max_attempts + 1):
+        offset, headers = _resume_headers(part_path, source_path, url)
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                if response.status_code == 416 and offset:
+                    # The partial file already holds everything the server has
+                    os.replace(part_path, file_path)
+                    _remove_quietly(source_path)
+                    return True
+                if response.status_code not in (200, 206):
+                    print(f"⚠️ Error downloading {url}: {response.status_code}")
+                    if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+                        # The request itself is wrong or forbidden; asking again gets the same answer
+                        return False
+                    _backoff(attempt, max_attempts)
+                    continue
+                if response.status_code == 200:
+                    # Server ignored the range request or the file changed, start over
+                    offset = 0
+                if not offset:
+                    _write_source(source_path, url, response)
+
+                total = _expected_total(response, offset)
+                with open(part_path, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+
+            size = os.path.getsize(part_path)
+            if total is not None and size != total:
+                print(f"⚠️ Incomplete download of {file_path}: {size}/{total} bytes, retrying")
+                if size > total:
+                    os.remove(part_path)
+                _backoff(attempt, max_attempts)
+                continue
+
+            os.replace(part_path, file_path)
+            _remove_quietly(source_path)
+            return True
+        except Exception as e:
+            print(f"⚠️ Download attempt {attempt} for {file_path} failed: {e}")
+            _backoff(attempt, max_attempts)
+
+    print(f"⚠️ Giving up on {file_path} after {max_attempts} attempts")
+    return False
+
+def _backoff(attempt, max_attempts):
+    """
+    Wait before the next attempt of a download, longer after each failure; not after the last one.
+    """
+    if attempt < max_attempts:
+        time.sleep(min(2 ** attempt, MAX_BACKOFF))
+
+def _remove_quietly(path):
+    """
+    Remove a file if it exists.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _forget(future):
+    """
+    Drop a finished download from the pending list.
+    """
+    with _pending_lock:
+        if future in _pending:
+            _pending.remove(future)
+
+def submit_download(url, file_path):
+    """
+    Queue a download on the shared pool without waiting for it.
+
+    Args:
+        url (str): The URL to download
+        file_path (str): Where to save the file
+
+    Returns:
+        Future: A future resolving to the result of download_file
+    """
+    future = submit_with_context(_get_executor(), download_file, url, file_path)
+    with _pending_lock:
+        _pending.append(future)
+    # Finished downloads leave the list even if nobody waits for them
+    future.add_done_callback(_forget)
+    return future
+
+def wait_for_downloads(futures=None, timeout=None):
+    """
+    Wait for queued downloads to finish.
+
+    Args:
+        futures (list, optional): Specific futures to wait for; defaults to all pending downloads
+        timeout (float, optional): Maximum number of seconds to wait
+
+    Returns:
+        tuple: The number of successful and failed downloads
+    """
+    with _pending_lock:
+        if futures is None:
+            futures = list(_pending)
+    if not futures:
+        return 0, 0
+
+    from concurrent.futures import wait
+    done, _ = wait(futures, timeout=timeout)
+    succeeded = sum(1 for future in done if not future.exception() and future.result())
+    return succeeded, len(futures) - succeeded
@@ -0,0 +1,328 @@
+"""
+Request handlers module.
+
+This module runs chat completions, the multi-agent system, image generation
+and speech synthesis from plain parameter dicts. The HTTP service and the job
+queue share these handlers, so a request behaves the same whether it is
+answered directly or processed later by a worker.
+
+Concurrent identical requests (same body, apart from its priority) share one
+upstream run through the coalescing groups "chat", "agents", "images",
+"audio" and "multimodal"; streamed requests always run on their own.
+"""
+
+import os
+import json
+import time
+import uuid
+from models_config import AVAILABLE_VOICES, AUDIO_FORMATS
+from llm_providers import (PROVIDERS, DEFAULT_MODELS, DEFAULT_SYSTEM_INSTRUCTION, build_llm,
+                           provider_api_key, chat_completions_url)
+from api_utils import provider_request
+from coalesce import single_flight, request_key
+
+def _coalesced(group, func, body):
+    """
+    Run a handler, sharing the run with concurrent calls for an identical body.
+
+    Args:
+        group (str): The coalescing group
+        func (callable): The handler, called with the body
+        body (dict): The request body
+
+    Returns:
+        The handler's result
+    """
+    fields = {key: value for key, value in body.items() if key != "priority"}
+    return single_flight(group).do(request_key(fields), func, body)
+
+def _chat_request(body):
+    """
+    Build the upstream Chat Completions request for a chat body.
+
+    Args:
+        body (dict): The request body
+
+    Returns:
+        tuple: The URL, headers and JSON payload
+
+    Raises:
+        ValueError: If the provider is unknown or has no API key
+    """
+    provider = body.get("provider", "together")
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider '{provider}'. Choose one of: {', '.join(PROVIDERS)}")
+    api_key = provider_api_key(provider)
+    if not api_key:
+        raise ValueError(f"{PROVIDERS[provider]} is not configured on the server")
+
+    messages = body.get("messages") or [
+        {"role": "system", "content": body.get("system") or DEFAULT_SYSTEM_INSTRUCTION},
+        {"role": "user", "content": body["prompt"]},
+    ]
+    payload = {
+        "model": body.get("model") or DEFAULT_MODELS[provider],
+        "messages": messages,
+        "temperature": body.get("temperature", 0.7),
+        "max_tokens": body.get("max_tokens", 1000),
+    }
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+    return chat_completions_url(provider), headers, payload
+
+def chat_completion(body):
+    """
+    Get a complete chat response from the provider.
+
+    Args:
+        body (dict): The request body
+
+    Returns:
+        dict: The response text, model, token usage and latency
+    """
+    return _coalesced("chat", _chat_completion, body)
+
+def _chat_completion(body):
+    """
+    Get a complete chat response from the provider, without coalescing.
+    """
+    url, headers, payload = _chat_request(body)
+    started = time.time()
+    response = provider_request("POST", url, headers=headers, json=payload, timeout=60)
+    if response.status_code != 200:
+        raise ValueError(f"Error code: {response.status_code} - {response.text[:200]}")
+    data = response.json()
+    return {"ok": True, "model": payload["model"], "response": data["choices"][0]["message"]["content"],
+            "usage": data.get("usage"), "key": response.key_id, "latency": round(time.time() - started, 3)}
+
+def stream_chat_completion(body, sink):
+    """
+    Stream a chat response from the provider as NDJSON delta events.
+
+    Args:
+        body (dict): The request body
+        sink: Object with a write_event(dict) method the events are written to
+    """
+    url, headers, payload = _chat_request(body)
+    payload["stream"] = True
+    if body.get("provider") == "openai":
+        # Together sends the token usage in the last chunk on its own, OpenAI only when asked
+        payload["stream_options"] = {"include_usage": True}
+    with provider_request("POST", url, headers=headers, json=payload, timeout=60, stream=True) as response:
+        if response.status_code != 200:
+            raise ValueError(f"Error code: {response.status_code} - {response.text[:200]}")
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("usage"):
+                # Recorded in the usage ledger when the response closes
+                response.usage = chunk["usage"]
+            choices = chunk.get("choices") or [{}]
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                sink.write_event({"event": "delta", "content": delta})
+    sink.write_event({"event": "done", "model": payload["model"]})
+
+def run_agents(body, sink=None):
+    """
+    Run the planner, coder and critic agents, optionally streaming each step.
+
+    Args:
+        body (dict): The request body
+        sink (optional): Object with a write_event(dict) method step events are written to
+
+    Returns:
+        dict: The request with the plan, code and review
+    """
+    if sink is None:
+        return _coalesced("agents", _run_agents, body)
+    return _run_agents(body, sink)
+
+def _run_agents(body, sink=None):
+    """
+    Run the planner, coder and critic for a request body, without coalescing.
+    """
+    from agent_system_direct import planner_agent, coder_agent, critic_agent
+
+    llm = build_llm(body.get("provider", "together"), body.get("model"), api=body.get("api", "chat"))
+    result = {"ok": True, "request": body["request"]}
+    started = time.time()
+    step_input = body["request"]
+    for step, agent in (("plan", planner_agent), ("code", coder_agent), ("review", critic_agent)):
+        step_input = result[step] = agent(llm, step_input)
+        if sink is not None:
+            sink.write_event({"event": step, "content": step_input})
+    result["latency"] = round(time.time() - started, 3)
+    if sink is not None:
+        sink.write_event({"event": "done", "latency": result["latency"]})
+    return result
+
+def generate_images(body):
+    """
+    Generate images for a request body.
+
+    Args:
+        body (dict): The request body
+
+    Returns:
+        dict: Whether it succeeded, the saved files and the latency
+    """
+    return _coalesced("images", _generate_images, body)
+
+def image_params(body):
+    """
+    Validate the file names and reference image of an image request.
+
+    Args:
+        body (dict): The request body
+
+    Returns:
+        dict: output_format, save_path (a file name inside Images/) and reference_image
+
+    Raises:
+        ValueError: If the format is not supported, save_path names no file or
+            reference_image is not an http(s) URL
+    """
+    output_format = body.get("output_format", "jpeg")
+    if output_format not in ("jpeg", "png"):
+        raise ValueError(f"Unsupported output_format '{output_format}'. Choose one of: jpeg, png")
+    # Clients only choose a file name; images are always written inside Images/
+    save_path = os.path.basename(str(body.get("save_path") or f"api_{uuid.uuid4().hex[:12]}"))
+    if save_path in ("", ".", ".."):
+        raise ValueError("save_path must be a file name")
+    # A local path would let clients upload any file on the server to the provider
+    reference_image = body.get("reference_image")
+    if reference_image and not str(reference_image).startswith(("http://", "https://")):
+        raise ValueError("reference_image must be an http(s) URL")
+    return {"output_format": output_format, "save_path": save_path, "reference_image": reference_image}
+
+def _generate_images(body):
+    """
+    Generate images for a request body, without coalescing.
+    """
+    from image_gen import generate_image, image_file_path
+
+    params = image_params(body)
+    model = body.get("model", "black-forest-labs/FLUX.1-schnell")
+    n = int(body.get("n", 1))
+    output_format = params["output_format"]
+    save_path = params["save_path"]
+    started = time.time()
+    success = generate_image(
+        api_key=provider_api_key("together"),
+        prompt=body["prompt"],
+        model=model,
+        negative_prompt=body.get("negative_prompt"),
+        height=int(body.get("height", 1024)),
+        width=int(body.get("width", 1024)),
+        steps=int(body.get("steps") or (10 if "FLUX.1-schnell" in model else 20)),
+        guidance=float(body.get("guidance", 3.5)),
+        output_format=output_format,
+        seed=body.get("seed"),
+        n=n,
+        save_path=save_path,
+        reference_image=params["reference_image"],
+    )
+    files = [path for path in (image_file_path(save_path, i, n, output_format) for i in range(n))
+             if os.path.exists(path)]
+    return {"ok": success, "model": model, "files": files, "latency": round(time.time() - started, 3)}
+
+def run_multimodal(body):
+    """
+    Run the agents and narrate and illustrate their plan in parallel for a request body.
+
+    Args:
+        body (dict): The request body: "request", and optionally "provider", "model", "api",
+            "voice", "audio_model", "image_model", "steps", "format", "narration", "image_prompt"
+
+    Returns:
+        dict: The result of multimodal_job.run_multimodal_job
+    """
+    return _coalesced("multimodal", _run_multimodal, body)
+
+def _run_multimodal(body):
+    """
+    Run a multimodal job for a request body, without coalescing.
+    """
+    from multimodal_job import run_multimodal_job, DEFAULT_AUDIO_MODEL, DEFAULT_IMAGE_MODEL
+
+    audio_format = body.get("format", "mp3")
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported format '{audio_format}'. Choose one of: {', '.join(AUDIO_FORMATS)}")
+    voice = body.get("voice", AVAILABLE_VOICES[0])
+    if voice not in AVAILABLE_VOICES:
+        raise ValueError(f"Unknown voice '{voice}'")
+    llm = build_llm(body.get("provider", "together"), body.get("model"), api=body.get("api", "chat"))
+    return run_multimodal_job(
+        llm, provider_api_key("together"), body["request"], voice=voice,
+        audio_model=body.get("audio_model", DEFAULT_AUDIO_MODEL),
+        image_model=body.get("image_model", DEFAULT_IMAGE_MODEL),
+        narration=body.get("narration"), image_prompt=body.get("image_prompt"),
+        audio_format=audio_format, steps=body.get("steps"),
+    )
+
+def audio_params(body):
+    """
+    Validate and fill in the parameters of an audio request.
+
+    Args:
+        body (dict): The request body
+
+    Returns:
+        dict: model, voice, format and output file name
+
+    Raises:
+        ValueError: If the voice or format is not supported
+    """
+    audio_format = body.get("format", "mp3")
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported format '{audio_format}'. Choose one of: {', '.join(AUDIO_FORMATS)}")
+    voice = body.get("voice", AVAILABLE_VOICES[0])
+    if voice not in AVAILABLE_VOICES:
+        raise ValueError(f"Unknown voice '{voice}'")
+    extension = AUDIO_FORMATS[audio_format]["extension"]
+    output_file = os.path.basename(body.get("output") or f"api_{uuid.uuid4().hex[:12]}")
+    if not output_file.lower().endswith(extension):
+        output_file += extension
+    return {"model": body.get("model", "cartesia/sonic-2"), "voice": voice, "format": audio_format,
+            "output_file": output_file}
+
+def generate_speech(body, player=None):
+    """
+    Synthesize speech for a request body.
+
+    Args:
+        body (dict): The request body
+        player (optional): Object whose stdin receives the audio while it is synthesized
+
+    Returns:
+        dict: Whether it succeeded, the saved file, its size and the latency
+    """
+    if player is None:
+        return _coalesced("audio", _generate_speech, body)
+    return _generate_speech(body, player)
+
+def _generate_speech(body, player=None):
+    """
+    Synthesize speech for a request body, without coalescing.
+    """
+    from audio_gen import generate_audio, generate_long_audio, LONG_TEXT_THRESHOLD
+
+    params = audio_params(body)
+    api_key = provider_api_key("together")
+    started = time.time()
+    if len(body["text"]) > LONG_TEXT_THRESHOLD and player is None:
+        success = generate_long_audio(api_key, body["text"], params["model"], params["voice"], params["output_file"],
+                                      audio_format=params["format"], normalize=bool(body.get("normalize")))
+    else:
+        success = generate_audio(api_key, body["text"], params["model"], params["voice"], params["output_file"],
+                                 audio_format=params["format"], normalize=bool(body.get("normalize")),
+                                 player=player)
+    output_path = os.path.join("Audio", params["output_file"])
+    return {"ok": success, "model": params["model"], "voice": params["voice"], "format": params["format"],
+            "file": output_path if success else None,
+            "bytes": os.path.getsize(output_path) if success and os.path.exists(output_path) else None,
+            "latency": round(time.time() - started, 3)}
@@ -8,37 +8,184 @@ Developed by Blackbeard (https://blackbeard.one | https://tentitanics.com | http
 © 2023-2024 Blackbeard. All rights reserved.
 """
 
-import requests
 import os
+import io
 import base64
+import hashlib
+import threading
+from functools import partial
 from models_config import FAMOUS_MODELS
+from api_utils import provider_request
+from download_utils import submit_download, wait_for_downloads
+from output_index import record_output
+from image_postprocess import submit_postprocess
+from navigation import select_next_action, AGAIN
+from tracing import span, traced, current_span
+import time
 import sys
 
-def generate_image(api_key, prompt, model="black-forest-labs/FLUX.1-schnell", 
-                  negative_prompt=None, height=1024, width=1024, steps=20, 
-                  guidance=3.5, output_format="jpeg", response_format="base64", 
-                  seed=None, n=1, save_path="output_image", reference_image=None):
+import importlib.util
+
+# Pillow is optional; without it references are sent as-is. It is imported on first use.
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+# Encoded reference payloads, keyed by (content hash, mtime, target size)
+_reference_cache = {}
+# Content hashes of reference files, keyed by (path, mtime, size) to skip re-hashing
+_reference_digests = {}
+_reference_lock = threading.Lock()
+REFERENCE_CACHE_SIZE = 16
+
+# Magic bytes used to label reference images when they cannot be re-encoded
+_IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"RIFF", "image/webp"),
+]
+
+def _detect_image_mime(img_bytes):
     """
-    Generate an image from a text prompt using Together AI's image generation API.
+    Detect the MIME type of an encoded image from its leading bytes.
+
+    Args:
+        img_bytes (bytes): The encoded image
+
+    Returns:
+        str: The MIME type, defaulting to image/jpeg
+    """
+    for signature, mime in _IMAGE_SIGNATURES:
+        if img_bytes.startswith(signature):
+            if mime == "image/webp" and img_bytes[8:12] != b"WEBP":
+                continue
+            return mime
+    return "image/jpeg"
+
+def _encode_reference_image(img_bytes, max_side):
+    """
+    Downsize and re-encode a reference image so its longest side fits max_side.
+
+    Args:
+        img_bytes (bytes): The original encoded image
+        max_side (int): The largest dimension the model will use
+
+    Returns:
+        tuple: The encoded bytes and their MIME type
+    """
+    mime = _detect_image_mime(img_bytes)
+    if not HAS_PIL:
+        return img_bytes, mime
+
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(img_bytes)) as img:
+        img = ImageOps.exif_transpose(img)
+        resized = max(img.size) > max_side
+        if resized:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            img.save(buffer, format="PNG", optimize=True)
+            encoded, encoded_mime = buffer.getvalue(), "image/png"
+        else:
+            img.convert("RGB").save(buffer, format="JPEG", quality=90, optimize=True)
+            encoded, encoded_mime = buffer.getvalue(), "image/jpeg"
+
+    # Keep the original when re-encoding alone would not make it smaller
+    if not resized and len(encoded) >= len(img_bytes):
+        return img_bytes, mime
+    return encoded, encoded_mime
+
+def prepare_reference_image(path, max_side=1024):
+    """
+    Build the data URL for a local reference image, reusing cached payloads.
+
+    The file is downsized to the generation size and re-encoded once; later calls
+    with the same file content and modification time reuse the encoded payload.
+
+    Args:
+        path (str): Path to the local reference image
+        max_side (int): The largest dimension of the image being generated
+
+    Returns:
+        str: A base64 data URL for the reference image
+    """
+    stat = os.stat(path)
+    stat_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    with span("cache.lookup", cache="reference") as lookup:
+        with _reference_lock:
+            digest = _reference_digests.get(stat_key)
+            cached = _reference_cache.get((digest, stat.st_mtime_ns, max_side)) if digest else None
+        if not cached:
+            with open(path, "rb") as img_file:
+                img_bytes = img_file.read()
+            digest = hashlib.sha256(img_bytes).hexdigest()
+            cache_key = (digest, stat.st_mtime_ns, max_side)
+
+            with _reference_lock:
+                _reference_digests[stat_key] = digest
+                cached = _reference_cache.get(cache_key)
+        lookup.set(hit=bool(cached))
+    if cached:
+        return cached
+
+    encoded, mime = _encode_reference_image(img_bytes, max_side)
+    data_url = f"data:{mime};base64,{base64.b64encode(encoded).decode('utf-8')}"
+    print(f"Reference image prepared: {len(img_bytes)} -> {len(encoded)} bytes ({mime})")
+
+    with _reference_lock:
+        _reference_cache[cache_key] = data_url
+        while len(_reference_cache) > REFERENCE_CACHE_SIZE:
+            _reference_cache.pop(next(iter(_reference_cache)))
+        while len(_reference_digests) > REFERENCE_CACHE_SIZE * 4:
+            _reference_digests.pop(next(iter(_reference_digests)))
+    return data_url
+
+def _index_download(file_path, params, latency, postprocess, future):
+    """
+    Record a downloaded image in the output index once its download succeeds.
     
     Args:
-        api_key (str): The Together AI API key
-        prompt (str): The text prompt describing the desired image
-        model (str): The model to use for image generation
-        negative_prompt (str, optional): The prompt or prompts not to guide the image generation
-        height (int): Height of the image to generate in pixels
-        width (int): Width of the image to generate in pixels
-        steps (int): Number of generation steps
-        guidance (float): Adjusts the alignment of the generated image with the input prompt
-        output_format (str): The format of the image response (jpeg or png)
-        response_format (str): Format of the image response (base64 or url)
-        seed (int, optional): Seed used for generation
-        n (int): Number of image results to generate
-        save_path (str): Base path to save the generated images
-        reference_image (str, optional): Path to a reference image (required for FLUX.1-depth model)
+        file_path (str): Where the image was saved
+        params (dict): The generation parameters
+        latency (float): Generation latency in seconds
+        postprocess (list or bool): Variants to render for the image, if any
+        future (Future): The finished download
+    """
+    if future.exception() is None and future.result():
+        record_output(file_path, "image", params, latency)
+        if postprocess:
+            submit_postprocess(None, file_path, postprocess if isinstance(postprocess, list) else None)
+
+def image_file_path(save_path, index, n, output_format):
+    """
+    Build the path an image result is saved to.
+    
+    Args:
+        save_path (str): Base name for the generated images
+        index (int): Zero-based index of the image in the response
+        n (int): Number of images requested
+        output_format (str): The image format (jpeg or png)
         
     Returns:
-        bool: True if image generation was successful, False otherwise
+        str: The file path inside the Images directory
+    """
+    file_extension = output_format.lower()
+    file_name = f"{save_path}_{index+1}.{file_extension}" if n > 1 else f"{save_path}.{file_extension}"
+    return os.path.join("Images", file_name)
+
+IMAGES_URL = "https://api.together.xyz/v1/images/generations"
+
+def _image_request(api_key, prompt, model, negative_prompt, height, width, steps, guidance, output_format,
+                   response_format, seed, n, reference_image):
+    """
+    Build the image generation request and the parameters recorded with its images.
+    
+    Returns:
+        tuple or None: The headers, JSON payload and index parameters, or None if the
+            reference image could not be read
     """
     # Ensure Images directory exists
     images_dir = "Images"
@@ -77,74 +224,217 @@ def generate_image(api_key, prompt, model="black-forest-labs/FLUX.1-schnell",
         if reference_image.startswith(('http://', 'https://')):
             data["image_url"] = {"url": reference_image}
         else:
-            # For local files, we need to encode them as base64
+            # For local files, downsize and encode them once, then reuse the payload
             try:
-                with open(reference_image, "rb") as img_file:
-                    import base64
-                    img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-                    data["image_url"] = {"url": f"data:image/jpeg;base64,{img_base64}"}
+                data["image_url"] = {"url": prepare_reference_image(reference_image, max(width, height))}
             except Exception as e:
                 print(f"⚠️ Error reading reference image: {e}")
-                return False
+                return None
+    
+    # Parameters recorded in the output index alongside each saved image
+    index_params = {key: value for key, value in data.items() if key != "image_url"}
+    if reference_image:
+        index_params["reference_image"] = reference_image
+    return headers, data, index_params
+
+def _save_images(response_data, save_path, n, output_format, response_format, index_params, latency, postprocess):
+    """
+    Save the images of a successful response.
+    
+    Base64 images are written at once; URL images are queued on the shared download pool.
+    
+    Returns:
+        list: The futures of the queued downloads
+    """
+    downloads = []
+    for i, image_data in enumerate(response_data.get("data", [])):
+        file_path = image_file_path(save_path, i, n, output_format)
+        if response_format == "base64" and "b64_json" in image_data:
+            # Save base64 image to file
+            import base64 as b64  # Import locally to avoid namespace issues
+            with span("image.decode", encoded_bytes=len(image_data["b64_json"])):
+                img_data = b64.b64decode(image_data["b64_json"])
+            
+            with span("file.write", path=file_path, bytes=len(img_data)):
+                with open(file_path, "wb") as f:
+                    f.write(img_data)
+            print(f"✅ Image {i+1} saved to {file_path}")
+            record_output(file_path, "image", index_params, latency, content=img_data)
+            if postprocess:
+                submit_postprocess(img_data, file_path, postprocess if isinstance(postprocess, list) else None)
+        elif response_format == "url" and "url" in image_data:
+            # Stream the image to disk on the shared download pool
+            print(f"✅ Image {i+1} URL: {image_data['url']}")
+            download = submit_download(image_data["url"], file_path)
+            download.add_done_callback(partial(_index_download, file_path, index_params, latency, postprocess))
+            downloads.append(download)
+    return downloads
+
+def _report_downloads(succeeded, failed):
+    """
+    Print the outcome of the downloads of a generation.
+    
+    Returns:
+        bool: True if every download succeeded
+    """
+    print(f"✅ Downloaded {succeeded} image(s) to Images")
+    if failed:
+        print(f"⚠️ {failed} image download(s) failed")
+        return False
+    return True
+
+def _report_image_error(response, model):
+    """
+    Print why an image generation request failed, with hints for common errors.
+    """
+    print(f"⚠️ Error generating image: {response.status_code}")
+    try:
+        error_data = response.json()
+        print(f"Error details: {error_data}")
+        
+        # Provide more helpful error messages
+        if response.status_code == 400:
+            if "FLUX.1-depth" in model and "reference image is missing" in str(error_data):
+                print("\nThe FLUX.1-depth model requires a valid reference image.")
+                print("Please try again with a valid image URL or file path.")
+            elif "invalid_request_error" in str(error_data):
+                print("\nThere was an issue with your request parameters.")
+                print("Please check your prompt, dimensions, and other settings.")
+        elif response.status_code == 500:
+            print("\nThe server encountered an internal error.")
+            print("This might be a temporary issue with the Together AI service.")
+            print("You can try again later or use a different model.")
+            
+            if "FLUX.1-depth" in model:
+                print("\nFor FLUX.1-depth model, try using a different reference image.")
+                print("The image should be a clear, well-lit photo with good resolution.")
+    except:
+        print(f"Response content: {response.text[:200]}...")
+
+@traced("image.generate")
+def generate_image(api_key, prompt, model="black-forest-labs/FLUX.1-schnell", 
+                  negative_prompt=None, height=1024, width=1024, steps=20, 
+                  guidance=3.5, output_format="jpeg", response_format="base64", 
+                  seed=None, n=1, save_path="output_image", reference_image=None,
+                  wait_downloads=True, postprocess=None):
+    """
+    Generate an image from a text prompt using Together AI's image generation API.
+    
+    Args:
+        api_key (str): The Together AI API key
+        prompt (str): The text prompt describing the desired image
+        model (str): The model to use for image generation
+        negative_prompt (str, optional): The prompt or prompts not to guide the image generation
+        height (int): Height of the image to generate in pixels
+        width (int): Width of the image to generate in pixels
+        steps (int): Number of generation steps
+        guidance (float): Adjusts the alignment of the generated image with the input prompt
+        output_format (str): The format of the image response (jpeg or png)
+        response_format (str): Format of the image response (base64 or url)
+        seed (int, optional): Seed used for generation
+        n (int): Number of image results to generate
+        save_path (str): Base path to save the generated images
+        reference_image (str, optional): Path to a reference image (required for FLUX.1-depth model)
+        wait_downloads (bool): For url responses, wait for the downloads to finish before returning;
+            pass False to let them overlap with the next generation (see download_utils.wait_for_downloads)
+        postprocess (list or bool, optional): Variants to render in the background after saving
+            (True for image_postprocess.DEFAULT_VARIANTS); drain with image_postprocess.wait_for_postprocess
+        
+    Returns:
+        bool: True if image generation was successful, False otherwise
+    """
+    current_span().set(model=model, n=n, width=width, height=height, response_format=response_format)
+    request = _image_request(api_key, prompt, model, negative_prompt, height, width, steps, guidance,
+                             output_format, response_format, seed, n, reference_image)
+    if request is None:
+        return False
+    headers, data, index_params = request
     
     try:
-        response = requests.post(
-            "https://api.together.xyz/v1/images/generations",
+        started = time.time()
+        response = provider_request(
+            "POST",
+            IMAGES_URL,
             headers=headers,
             json=data,
             timeout=60  # Image generation might take longer
         )
         
         if response.status_code == 200:
-            response_data = response.json()
+            with span("image.parse", bytes=len(response.content)):
+                response_data = response.json()
+            latency = time.time() - started
             
             # Process and save the generated images
-            for i, image_data in enumerate(response_data.get("data", [])):
-                if response_format == "base64" and "b64_json" in image_data:
-                    # Save base64 image to file
-                    import base64 as b64  # Import locally to avoid namespace issues
-                    img_data = b64.b64decode(image_data["b64_json"])
-                    file_extension = output_format.lower()
-                    file_name = f"{save_path}_{i+1}.{file_extension}" if n > 1 else f"{save_path}.{file_extension}"
-                    file_path = os.path.join("Images", file_name)
-                    
-                    with open(file_path, "wb") as f:
-                        f.write(img_data)
-                    print(f"✅ Image {i+1} saved to {file_path}")
-                elif response_format == "url" and "url" in image_data:
-                    # Just display the URL
-                    print(f"✅ Image {i+1} URL: {image_data['url']}")
-            
+            downloads = _save_images(response_data, save_path, n, output_format, response_format,
+                                     index_params, latency, postprocess)
+            if downloads and wait_downloads:
+                return _report_downloads(*wait_for_downloads(downloads))
             return True
         else:
-            print(f"⚠️ Error generating image: {response.status_code}")
-            try:
-                error_data = response.json()
-                print(f"Error details: {error_data}")
-                
-                # Provide more helpful error messages
-                if response.status_code == 400:
-                    if "FLUX.1-depth" in model and "reference image is missing" in str(error_data):
-                        print("\nThe FLUX.1-depth model requires a valid reference image.")
-                        print("Please try again with a valid image URL or file path.")
-                    elif "invalid_request_error" in str(error_data):
-                        print("\nThere was an issue with your request parameters.")
-                        print("Please check your prompt, dimensions, and other settings.")
-                elif response.status_code == 500:
-                    print("\nThe server encountered an internal error.")
-                    print("This might be a temporary issue with the Together AI service.")
-                    print("You can try again later or use a different model.")
-                    
-                    if "FLUX.1-depth" in model:
-                        print("\nFor FLUX.1-depth model, try using a different reference image.")
-                        print("The image should be a clear, well-lit photo with good resolution.")
-            except:
-                print(f"Response content: {response.text[:200]}...")
+            _report_image_error(response, model)
             return False
     except Exception as e:
         print(f"⚠️ Exception while generating image: {e}")
         return False
 
+async def agenerate_image(api_key, prompt, model="black-forest-labs/FLUX.1-schnell",
+                          negative_prompt=None, height=1024, width=1024, steps=20,
+                          guidance=3.5, output_format="jpeg", response_format="base64",
+                          seed=None, n=1, save_path="output_image", reference_image=None,
+                          postprocess=None, priority=None):
+    """
+    Generate an image like generate_image, awaiting the provider instead of blocking a thread.
+    
+    URL results are downloaded on the shared download pool and awaited before returning.
+    Encoding the reference image, parsing and decoding the response and writing the
+    files run in a worker thread, so the event loop keeps serving other tasks.
+    
+    Args:
+        api_key (str): The Together AI API key
+        prompt (str): The text prompt describing the desired image
+        priority (str, optional): The priority class of the call, defaults to the current priority
+        Other arguments are as for generate_image.
+        
+    Returns:
+        bool: True if image generation was successful, False otherwise
+    """
+    import asyncio
+    from async_providers import aprovider_request
+    
+    with span("image.generate", model=model, n=n, width=width, height=height,
+              response_format=response_format):
+        request = await asyncio.to_thread(_image_request, api_key, prompt, model, negative_prompt, height,
+                                          width, steps, guidance, output_format, response_format, seed, n,
+                                          reference_image)
+        if request is None:
+            return False
+        headers, data, index_params = request
+    
+        try:
+            started = time.time()
+            response = await aprovider_request("POST", IMAGES_URL, priority, headers=headers, json=data, timeout=60)
+            if response.status_code != 200:
+                _report_image_error(response, model)
+                return False
+        
+            def save():
+                with span("image.parse", bytes=len(response.content)):
+                    response_data = response.json()
+                return _save_images(response_data, save_path, n, output_format, response_format,
+                                    index_params, time.time() - started, postprocess)
+
+            downloads = await asyncio.to_thread(save)
+            if downloads:
+                results = await asyncio.gather(*(asyncio.wrap_future(download) for download in downloads),
+                                               return_exceptions=True)
+                succeeded = sum(1 for result in results if result and not isinstance(result, BaseException))
+                return _report_downloads(succeeded, len(results) - succeeded)
+            return True
+        except Exception as e:
+            print(f"⚠️ Exception while generating image: {e}")
+            return False
+
 def run_image_generation_mode(api_key, model_name=None):
     """
     Run the image generation mode, allowing the user to generate images from text prompts.
@@ -152,6 +442,28 @@ def run_image_generation_mode(api_key, model_name=None):
     Args:
         api_key (str): The Together AI API key
         model_name (str, optional): Pre-selected model name from previous step
+        
+    Returns:
+        str: The navigation action chosen by the user (PREVIOUS_MENU, MAIN_MENU or EXIT)
+    """
+    while True:
+        _image_generation_round(api_key, model_name)
+        action = select_next_action("image")
+        if action != AGAIN:
+            return action
+        # The model is chosen again for each new image
+        model_name = None
+
+def _image_generation_round(api_key, model_name=None):
+    """
+    Prompt for the settings of one image generation and run it.
+    
+    Args:
+        api_key (str): The Together AI API key
+        model_name (str, optional): Pre-selected model name from previous step
+        
+    Returns:
+        bool: True if image generation was successful, False otherwise
     """
     print("\n=== IMAGE GENERATION MODE ===")
     
@@ -340,31 +652,4 @@ def run_image_generation_mode(api_key, model_name=None):
         print(f"Images are saved in the 'Images' folder. You can view them in your file explorer.")
     else:
         print("\n⚠️ Image generation failed.")
-    
-    # Add options to return to previous menu, main menu, or exit
-    print("\nWhat would you like to do next?")
-    print("1. Generate another image")
-    print("2. Return to previous menu")
-    print("3. Return to main menu")
-    print("4. Exit")
-    
-    next_choice = input("Enter your choice (1-4): ")
-    
-    if next_choice == "1":
-        # Run image generation mode again
-        return run_image_generation_mode(api_key)
-    elif next_choice == "2":
-        # Return to previous menu - this will be handled by the calling function
-        return "previous_menu"
-    elif next_choice == "3":
-        # Return to main menu - this will be handled by the calling function
-        return "main_menu"
-    elif next_choice == "4":
-        # Exit
-        print("Exiting program.")
-        import sys
-        sys.exit(0)
-    else:
-        # Default to returning to previous menu
-        print("Invalid choice. Returning to previous menu.")
-        return "previous_menu"
+    return success
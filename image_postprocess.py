@@ -0,0 +1,146 @@
+"""
+Image post-processing module.
+
+This module produces resized variants and thumbnails of generated images in a
+pool of worker processes. Variants are rendered from the decoded bytes already
+in memory, and the work runs in the background so it overlaps with the next
+generation request.
+"""
+
+import io
+import os
+import threading
+import importlib.util
+from collections import deque
+
+# Pillow is optional; post-processing is skipped without it. It is imported in the workers.
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+POSTPROCESS_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Variants produced when post-processing is enabled without a custom list
+DEFAULT_VARIANTS = [
+    {"suffix": "thumb", "max_size": 256, "format": "webp", "quality": 80},
+    {"suffix": "web", "format": "webp", "quality": 85},
+]
+
+_FORMAT_EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp"}
+
+# Written paths kept for wait_for_postprocess; the interactive menu and the server
+# never wait, so only the most recent ones are kept and older ones are only counted
+MAX_WRITTEN_PATHS = 4096
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+# Notified whenever a rendering finishes; guards _pending, _written and _dropped
+_finished = threading.Condition(_pending_lock)
+_written = deque(maxlen=MAX_WRITTEN_PATHS)
+_dropped = 0
+
+def render_variants(img_bytes, file_path, variants):
+    """
+    Render the configured variants of an image and save them next to it.
+
+    Each variant is a dict with a "suffix", a "format" (jpeg, png or webp) and
+    optionally "max_size" (longest side in pixels) and "quality".
+
+    Args:
+        img_bytes (bytes or None): The encoded image; read from file_path if None
+        file_path (str): Path of the original image
+        variants (list): The variants to produce
+
+    Returns:
+        list: Paths of the files written
+    """
+    from PIL import Image
+
+    if img_bytes is None:
+        with open(file_path, "rb") as f:
+            img_bytes = f.read()
+
+    base, _ = os.path.splitext(file_path)
+    written = []
+    with Image.open(io.BytesIO(img_bytes)) as original:
+        original.load()
+        for variant in variants:
+            img = original.copy()
+            max_size = variant.get("max_size")
+            if max_size and max(img.size) > max_size:
+                img.thumbnail((max_size, max_size), Image.LANCZOS)
+
+            image_format = variant.get("format", "webp").lower()
+            if image_format == "jpeg" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            variant_path = f"{base}_{variant['suffix']}.{_FORMAT_EXTENSIONS.get(image_format, image_format)}"
+            save_args = {"quality": variant["quality"]} if "quality" in variant else {}
+            img.save(variant_path, format=image_format.upper(), **save_args)
+            written.append(variant_path)
+    return written
+
+def submit_postprocess(img_bytes, file_path, variants=None):
+    """
+    Queue variant rendering for an image on the process pool without waiting.
+
+    Args:
+        img_bytes (bytes or None): The encoded image; read from file_path if None
+        file_path (str): Path of the original image
+        variants (list, optional): The variants to produce, defaults to DEFAULT_VARIANTS
+
+    Returns:
+        Future or None: A future resolving to the written paths, or None if Pillow is not installed
+    """
+    global _executor
+    if not HAS_PIL:
+        print("⚠️ Pillow is not installed; skipping image post-processing.")
+        return None
+
+    with _pending_lock:
+        if _executor is None:
+            # Imported on first use: multiprocessing is slow to import and most runs never post-process
+            from concurrent.futures import ProcessPoolExecutor
+            _executor = ProcessPoolExecutor(max_workers=POSTPROCESS_WORKERS)
+        future = _executor.submit(render_variants, img_bytes, file_path, variants or DEFAULT_VARIANTS)
+        _pending.add(future)
+    future.add_done_callback(_collect)
+    return future
+
+def _collect(future):
+    """
+    Move a finished rendering from the pending list to the written paths.
+    """
+    if future.cancelled() or future.exception():
+        print(f"⚠️ Image post-processing failed: {'cancelled' if future.cancelled() else future.exception()}")
+        written = []
+    else:
+        written = future.result()
+    global _dropped
+    with _finished:
+        _dropped += max(0, len(_written) + len(written) - MAX_WRITTEN_PATHS)
+        _written.extend(written)
+        _pending.discard(future)
+        _finished.notify_all()
+
+def wait_for_postprocess(timeout=None):
+    """
+    Wait for all queued post-processing to finish.
+
+    Args:
+        timeout (float, optional): Maximum number of seconds to wait
+
+    Returns:
+        list: Paths of the variant files written since the last call, at most the
+            MAX_WRITTEN_PATHS most recent ones
+    """
+    global _dropped
+    with _finished:
+        queued = set(_pending)
+        _finished.wait_for(lambda: _pending.isdisjoint(queued), timeout)
+        written = list(_written)
+        dropped = _dropped
+        _written.clear()
+        _dropped = 0
+    if dropped:
+        print(f"⚠️ {dropped} older post-processed variant(s) were written but are not listed")
+    return written
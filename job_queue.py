@@ -0,0 +1,534 @@
+"""
+Job queue module.
+
+This module keeps a durable queue of long-running generations (images,
+speech, multi-agent runs, multimodal bundles) in SQLite and processes it with a pool of worker
+processes. Submitting a job returns its id immediately; workers claim jobs
+with a visibility timeout that they extend while a job runs, so a crashed
+worker's job becomes visible again and is retried. Jobs that fail too many
+times are moved to the dead-letter state for inspection.
+
+Usage:
+    python job_queue.py enqueue image '{"prompt": "A lighthouse at dusk"}'
+    python job_queue.py work --workers 4
+    python job_queue.py status <job id>
+    python job_queue.py list --state dead
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import socket
+import sqlite3
+import threading
+import multiprocessing
+from scheduler import priority, BULK
+from usage_ledger import usage_job, flush as flush_usage
+from tracing import span, flush_trace
+
+QUEUE_DB_PATH = "jobs.db"
+VISIBILITY_TIMEOUT = 300
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 10
+POLL_INTERVAL = 1.0
+QUEUE_WORKERS = 2
+
+JOB_KINDS = ["image", "audio", "agents", "multimodal"]
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    visible_at REAL NOT NULL,
+    locked_by TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state_visible ON jobs (state, visible_at);
+"""
+
+# Databases whose schema and WAL mode this process has already set up
+_initialized = set()
+_initialized_lock = threading.Lock()
+
+def _handlers():
+    """
+    Get the function that runs each kind of job.
+
+    Returns:
+        dict: Job kind to handler; each handler takes the payload and returns a result dict with "ok"
+    """
+    from handlers import generate_images, generate_speech, run_agents, run_multimodal
+    return {"image": generate_images, "audio": generate_speech, "agents": run_agents,
+            "multimodal": run_multimodal}
+
+def _connect(db_path=None):
+    """
+    Open the queue database, creating the schema on the first connection of the process.
+
+    Args:
+        db_path (str, optional): Path to the database, defaults to QUEUE_DB_PATH
+
+    Returns:
+        sqlite3.Connection: The open connection, in autocommit mode
+    """
+    db_path = os.path.abspath(db_path or QUEUE_DB_PATH)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if db_path not in _initialized:
+        with _initialized_lock:
+            if db_path not in _initialized:
+                # WAL mode is stored in the database file, so it only needs setting once
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _initialized.add(db_path)
+    return conn
+
+def _job_dict(row):
+    """
+    Convert a job row to a dictionary with decoded JSON fields.
+
+    Args:
+        row (sqlite3.Row): The job row
+
+    Returns:
+        dict: The job
+    """
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def enqueue(kind, payload, max_attempts=MAX_ATTEMPTS, db_path=None):
+    """
+    Add a job to the queue.
+
+    Args:
+        kind (str): "image", "audio", "agents" or "multimodal"
+        payload (dict): The job parameters, as accepted by the handler for the kind
+        max_attempts (int): Attempts before the job is dead-lettered
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        str: The job id
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind '{kind}'. Choose one of: {', '.join(JOB_KINDS)}")
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, payload, state, max_attempts, visible_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), QUEUED, max_attempts, now, now, now)
+        )
+    finally:
+        conn.close()
+    return job_id
+
+def status(job_id, db_path=None):
+    """
+    Get a job.
+
+    Args:
+        job_id (str): The job id
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        dict or None: The job, or None if it does not exist
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _job_dict(row) if row else None
+
+def result(job_id, timeout=None, db_path=None):
+    """
+    Get the result of a job, optionally waiting for it to finish.
+
+    Args:
+        job_id (str): The job id
+        timeout (float, optional): Seconds to wait for the job to finish; 0 or None returns at once
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        dict or None: The handler's result, or None if the job has not finished successfully
+    """
+    deadline = time.time() + (timeout or 0)
+    while True:
+        job = status(job_id, db_path)
+        if job is None or job["state"] in (DONE, DEAD) or time.time() >= deadline:
+            return job["result"] if job and job["state"] == DONE else None
+        time.sleep(POLL_INTERVAL)
+
+def list_jobs(state=None, limit=100, db_path=None):
+    """
+    List jobs, newest first.
+
+    Args:
+        state (str, optional): Only jobs in this state
+        limit (int): Maximum number of jobs
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        list: The jobs
+    """
+    query, args = "SELECT * FROM jobs", []
+    if state:
+        query += " WHERE state = ?"
+        args.append(state)
+    query += f" ORDER BY created_at DESC LIMIT {int(limit)}"
+    conn = _connect(db_path)
+    try:
+        return [_job_dict(row) for row in conn.execute(query, args)]
+    finally:
+        conn.close()
+
+def counts(db_path=None):
+    """
+    Count the jobs in each state.
+
+    Args:
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        dict: State to number of jobs
+    """
+    conn = _connect(db_path)
+    try:
+        found = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+    finally:
+        conn.close()
+    return {state: found.get(state, 0) for state in (QUEUED, RUNNING, DONE, DEAD)}
+
+def requeue(job_id, db_path=None):
+    """
+    Move a dead-lettered job back to the queue with a fresh set of attempts.
+
+    Args:
+        job_id (str): The job id
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        bool: True if the job was requeued, False if it is not dead-lettered
+    """
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET state = ?, attempts = 0, visible_at = ?, locked_by = NULL, updated_at = ? "
+            "WHERE id = ? AND state = ?",
+            (QUEUED, now, now, job_id, DEAD)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def claim(worker_id, visibility_timeout=VISIBILITY_TIMEOUT, db_path=None):
+    """
+    Claim the oldest visible job.
+
+    A running job whose visibility timeout expired (its worker died or hung)
+    is visible again; if it has used up its attempts it is dead-lettered
+    instead of being claimed.
+
+    Args:
+        worker_id (str): Identifies the claiming worker
+        visibility_timeout (float): Seconds the job stays hidden from other workers
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        dict or None: The claimed job, or None if no job is visible
+    """
+    conn = _connect(db_path)
+    try:
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state IN (?, ?) AND visible_at <= ? ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["attempts"] >= row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, locked_by = NULL, updated_at = ?, "
+                    "error = COALESCE(error, 'visibility timeout expired') WHERE id = ?",
+                    (DEAD, now, row["id"])
+                )
+                conn.execute("COMMIT")
+                continue
+            conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, visible_at = ?, locked_by = ?, updated_at = ? "
+                "WHERE id = ?",
+                (RUNNING, now + visibility_timeout, worker_id, now, row["id"])
+            )
+            conn.execute("COMMIT")
+            job = _job_dict(row)
+            job.update(state=RUNNING, attempts=row["attempts"] + 1, locked_by=worker_id)
+            return job
+    finally:
+        conn.close()
+
+def extend_visibility(job_id, worker_id, visibility_timeout=VISIBILITY_TIMEOUT, db_path=None):
+    """
+    Keep a running job hidden from other workers for another visibility timeout.
+
+    Args:
+        job_id (str): The job id
+        worker_id (str): The worker holding the job
+        visibility_timeout (float): Seconds from now the job stays hidden
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        bool: True if the worker still holds the job
+    """
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET visible_at = ?, updated_at = ? WHERE id = ? AND locked_by = ? AND state = ?",
+            (now + visibility_timeout, now, job_id, worker_id, RUNNING)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def complete(job_id, worker_id, job_result, db_path=None):
+    """
+    Record the result of a job that succeeded.
+
+    Args:
+        job_id (str): The job id
+        worker_id (str): The worker holding the job
+        job_result (dict): The handler's result
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        bool: True if the result was recorded, False if the worker no longer held the job
+    """
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET state = ?, result = ?, error = NULL, locked_by = NULL, updated_at = ? "
+            "WHERE id = ? AND locked_by = ? AND state = ?",
+            (DONE, json.dumps(job_result, default=str), time.time(), job_id, worker_id, RUNNING)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def fail(job_id, worker_id, error, retry_delay=RETRY_DELAY, db_path=None):
+    """
+    Record a failed attempt, retrying the job later or dead-lettering it.
+
+    Args:
+        job_id (str): The job id
+        worker_id (str): The worker holding the job
+        error (str): What went wrong
+        retry_delay (float): Base delay before a retry, doubled for each attempt
+        db_path (str, optional): Path to the queue database
+
+    Returns:
+        str or None: The job's new state, or None if the worker no longer held the job
+    """
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND locked_by = ? AND state = ?",
+                           (job_id, worker_id, RUNNING)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        state = DEAD if row["attempts"] >= row["max_attempts"] else QUEUED
+        conn.execute(
+            "UPDATE jobs SET state = ?, error = ?, visible_at = ?, locked_by = NULL, updated_at = ? WHERE id = ?",
+            (state, error, now + retry_delay * 2 ** (row["attempts"] - 1), now, job_id)
+        )
+        conn.execute("COMMIT")
+        return state
+    finally:
+        conn.close()
+
+def _run_job(job, worker_id, handlers, visibility_timeout, db_path):
+    """
+    Run one claimed job, extending its visibility while it runs.
+
+    Args:
+        job (dict): The claimed job
+        worker_id (str): The worker holding the job
+        handlers (dict): Job kind to handler
+        visibility_timeout (float): Seconds a job stays hidden per extension
+        db_path (str): Path to the queue database
+    """
+    stop = threading.Event()
+
+    def keep_alive():
+        while not stop.wait(visibility_timeout / 3):
+            if not extend_visibility(job["id"], worker_id, visibility_timeout, db_path):
+                return
+
+    heartbeat = threading.Thread(target=keep_alive, daemon=True)
+    heartbeat.start()
+    try:
+        with priority(BULK), usage_job(job["id"]), span("job.run", id=job["id"], kind=job["kind"]):
+            job_result = handlers[job["kind"]](job["payload"])
+        error = None if job_result.get("ok", True) else job_result.get("error", "handler reported failure")
+    except (Exception, SystemExit) as e:
+        job_result, error = None, str(e) or type(e).__name__
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    if error is None:
+        complete(job["id"], worker_id, job_result, db_path)
+        print(f"✅ Job {job['id']} ({job['kind']}) done")
+    else:
+        state = fail(job["id"], worker_id, error, db_path=db_path)
+        print(f"⚠️ Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed: {error}"
+              + (" - moved to dead letters" if state == DEAD else ""))
+
+def worker_loop(worker_id, db_path=None, visibility_timeout=VISIBILITY_TIMEOUT, poll_interval=POLL_INTERVAL,
+                exit_when_empty=False):
+    """
+    Claim and run jobs until stopped.
+
+    SIGINT and SIGTERM stop the worker after its current job.
+
+    Args:
+        worker_id (str): Identifies this worker
+        db_path (str, optional): Path to the queue database
+        visibility_timeout (float): Seconds a claimed job stays hidden per extension
+        poll_interval (float): Seconds to wait when no job is visible
+        exit_when_empty (bool): Stop once no job is visible instead of polling
+
+    Returns:
+        int: The number of jobs run
+    """
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    handlers = _handlers()
+    processed = 0
+    while not stopping.is_set():
+        job = claim(worker_id, visibility_timeout, db_path)
+        if job is None:
+            if exit_when_empty:
+                break
+            stopping.wait(poll_interval)
+            continue
+        _run_job(job, worker_id, handlers, visibility_timeout, db_path)
+        processed += 1
+    # Worker processes exit without running atexit hooks, so write the buffered usage and spans now
+    flush_usage()
+    flush_trace()
+    return processed
+
+def run_workers(workers=QUEUE_WORKERS, db_path=None, visibility_timeout=VISIBILITY_TIMEOUT,
+                exit_when_empty=False):
+    """
+    Process the queue with a pool of worker processes until they stop.
+
+    Args:
+        workers (int): Number of worker processes
+        db_path (str, optional): Path to the queue database
+        visibility_timeout (float): Seconds a claimed job stays hidden per extension
+        exit_when_empty (bool): Stop the workers once the queue has no visible jobs
+
+    Returns:
+        dict: The number of jobs in each state afterwards
+    """
+    _connect(db_path).close()
+    host = socket.gethostname()
+    processes = [
+        multiprocessing.Process(
+            target=worker_loop,
+            args=(f"{host}-{os.getpid()}-{i}", db_path, visibility_timeout, POLL_INTERVAL, exit_when_empty),
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"Started {workers} worker(s). Press Ctrl+C to stop after the current jobs.")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # The workers received the SIGINT too and finish their current job
+        for process in processes:
+            process.join()
+    return counts(db_path)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Durable queue for long-running generations.")
+    parser.add_argument("--db", help=f"Path to the queue database (default: {QUEUE_DB_PATH})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    enqueue_parser = subparsers.add_parser("enqueue", help="Submit a job and print its id")
+    enqueue_parser.add_argument("kind", choices=JOB_KINDS)
+    enqueue_parser.add_argument("payload", help="JSON parameters for the job ('-' to read them from stdin)")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    status_parser = subparsers.add_parser("status", help="Show a job as JSON")
+    status_parser.add_argument("job_id")
+    result_parser = subparsers.add_parser("result", help="Print a job's result, optionally waiting for it")
+    result_parser.add_argument("job_id")
+    result_parser.add_argument("--wait", type=float, default=0, help="Seconds to wait for the job to finish")
+    list_parser = subparsers.add_parser("list", help="List jobs as JSON lines")
+    list_parser.add_argument("--state", choices=[QUEUED, RUNNING, DONE, DEAD])
+    list_parser.add_argument("--limit", type=int, default=100)
+    requeue_parser = subparsers.add_parser("requeue", help="Retry a dead-lettered job")
+    requeue_parser.add_argument("job_id")
+    work_parser = subparsers.add_parser("work", help="Process jobs with a pool of worker processes")
+    work_parser.add_argument("--workers", type=int, default=QUEUE_WORKERS)
+    work_parser.add_argument("--visibility-timeout", type=float, default=VISIBILITY_TIMEOUT)
+    work_parser.add_argument("--exit-when-empty", action="store_true", help="Stop once the queue is empty")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        payload = json.loads(sys.stdin.read() if args.payload == "-" else args.payload)
+        print(enqueue(args.kind, payload, args.max_attempts, args.db))
+    elif args.command == "status":
+        job = status(args.job_id, args.db)
+        print(json.dumps(job))
+        sys.exit(0 if job else 1)
+    elif args.command == "result":
+        job_result = result(args.job_id, args.wait, args.db)
+        print(json.dumps(job_result))
+        sys.exit(0 if job_result is not None else 1)
+    elif args.command == "list":
+        for job in list_jobs(args.state, args.limit, args.db):
+            print(json.dumps(job))
+    elif args.command == "requeue":
+        requeued = requeue(args.job_id, args.db)
+        print(f"✅ Job {args.job_id} requeued" if requeued else f"⚠️ Job {args.job_id} is not dead-lettered")
+        sys.exit(0 if requeued else 1)
+    else:
+        final_counts = run_workers(args.workers, args.db, args.visibility_timeout, args.exit_when_empty)
+        print("Jobs: " + ", ".join(f"{count} {state}" for state, count in final_counts.items()))
@@ -0,0 +1,291 @@
+"""
+Key pool module.
+
+This module spreads provider requests over several API keys of the same
+provider. Keys are read from TOGETHER_API_KEYS / OPENAI_API_KEYS (comma
+separated) in addition to TOGETHER_API_KEY / OPENAI_API_KEY. Each request
+goes to the available key with the most remaining quota, as reported by the
+provider's rate-limit headers; keys answered with 401/403 or 429 are taken
+out of rotation for a while. Keys are identified in metrics by a short
+fingerprint, never by the key itself.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+# Service name -> (environment variable with several keys, environment variable with one key)
+KEY_ENV_VARS = {
+    "together": ("TOGETHER_API_KEYS", "TOGETHER_API_KEY"),
+    "openai": ("OPENAI_API_KEYS", "OPENAI_API_KEY"),
+}
+
+# Seconds a key stays out of rotation after a 429, doubled for each 429 in a row
+RATE_LIMIT_COOLDOWN = 30
+MAX_RATE_LIMIT_COOLDOWN = 300
+# Seconds a key stays out of rotation after a 401 or 403
+UNAUTHORIZED_COOLDOWN = 600
+
+UNAUTHORIZED_STATUSES = (401, 403)
+RATE_LIMITED_STATUS = 429
+
+# Response headers carrying the requests left in the current window, checked in order
+REMAINING_HEADERS = ("x-ratelimit-remaining-requests", "x-ratelimit-remaining")
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def key_id(service, api_key):
+    """
+    Get the identity of an API key as shown in metrics.
+
+    Args:
+        service (str): "together" or "openai"
+        api_key (str): The API key
+
+    Returns:
+        str: The service and a fingerprint of the key, e.g. "together-3f9a1c2e"
+    """
+    return f"{service}-{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]}"
+
+def service_for_url(url):
+    """
+    Get the service a provider URL belongs to.
+
+    Args:
+        url (str): The request URL
+
+    Returns:
+        str or None: "together", "openai", or None for other hosts
+    """
+    host = urlparse(url).hostname or ""
+    if host.endswith("together.xyz") or host.endswith("together.ai"):
+        return "together"
+    if host.endswith("openai.com"):
+        return "openai"
+    return None
+
+def _retry_after(headers):
+    """
+    Read the Retry-After header of a response in seconds, if it holds a number.
+    """
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _remaining(headers):
+    """
+    Read the requests left in the rate-limit window from response headers, if reported.
+    """
+    for name in REMAINING_HEADERS:
+        try:
+            return int(float(headers.get(name)))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+class KeyPool:
+    """
+    The API keys of one service and their quota, load and health.
+    """
+
+    def __init__(self, service, keys):
+        self.service = service
+        self.keys = list(dict.fromkeys(key for key in keys if key))
+        self._lock = threading.Lock()
+        self._state = {key: {"id": key_id(service, key), "remaining": None, "in_flight": 0,
+                             "cooldown_until": 0.0, "rate_limited_in_row": 0, "last_used": 0.0,
+                             "requests": 0, "errors": 0, "rate_limited": 0, "unauthorized": 0,
+                             "latency": 0.0}
+                       for key in self.keys}
+
+    def __contains__(self, api_key):
+        return api_key in self._state
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _available(self, exclude=()):
+        """
+        Get the keys in rotation that are not excluded. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        return [key for key in self.keys
+                if key not in exclude and self._state[key]["cooldown_until"] <= now]
+
+    def _score(self, key):
+        """
+        Rank a key for the next request: most quota left, then fewest in flight, then least recently used.
+        """
+        state = self._state[key]
+        known = [s["remaining"] for s in self._state.values() if s["remaining"] is not None]
+        # A key that has not reported its quota yet is assumed to have as much as the best known one
+        remaining = state["remaining"] if state["remaining"] is not None else max(known, default=0)
+        return (remaining - state["in_flight"], -state["in_flight"], -state["last_used"])
+
+    def has_available(self, exclude=()):
+        """
+        Check whether a key not in exclude is in rotation.
+
+        Args:
+            exclude (iterable): Keys already tried
+
+        Returns:
+            bool: True if another key can be used
+        """
+        with self._lock:
+            return bool(self._available(exclude))
+
+    def best_key(self):
+        """
+        Get the key the next request would use, without reserving it.
+
+        Returns:
+            str or None: The key, or None if every key is out of rotation
+        """
+        with self._lock:
+            available = self._available()
+            return max(available, key=self._score) if available else None
+
+    def acquire(self, preferred=None, exclude=()):
+        """
+        Reserve a key for a request.
+
+        Args:
+            preferred (str, optional): Use this key instead of choosing one
+            exclude (iterable): Keys not to choose, e.g. ones already tried
+
+        Returns:
+            str or None: The key, or None if no key is in rotation
+        """
+        with self._lock:
+            if preferred is not None:
+                key = preferred
+            else:
+                available = self._available(exclude)
+                if not available:
+                    return None
+                key = max(available, key=self._score)
+            state = self._state[key]
+            state["in_flight"] += 1
+            state["requests"] += 1
+            state["last_used"] = time.monotonic()
+            return key
+
+    def release(self, api_key, status=None, headers=None, latency=None):
+        """
+        Record the outcome of a request made with a reserved key.
+
+        Args:
+            api_key (str): The key returned by acquire()
+            status (int, optional): The HTTP status, or None if the request failed without one
+            headers (Mapping, optional): The response headers
+            latency (float, optional): Seconds until the response headers arrived
+        """
+        headers = headers or {}
+        with self._lock:
+            state = self._state[api_key]
+            state["in_flight"] -= 1
+            if latency is not None:
+                state["latency"] += latency
+            remaining = _remaining(headers)
+            if remaining is not None:
+                state["remaining"] = remaining
+            if status is None or status >= 400:
+                state["errors"] += 1
+
+            if status == RATE_LIMITED_STATUS:
+                state["rate_limited"] += 1
+                state["rate_limited_in_row"] += 1
+                cooldown = _retry_after(headers) or min(
+                    RATE_LIMIT_COOLDOWN * 2 ** (state["rate_limited_in_row"] - 1), MAX_RATE_LIMIT_COOLDOWN)
+                state["cooldown_until"] = time.monotonic() + cooldown
+                state["remaining"] = 0
+                print(f"⚠️ Key {state['id']} is rate limited, out of rotation for {cooldown:.0f}s")
+            elif status in UNAUTHORIZED_STATUSES:
+                state["unauthorized"] += 1
+                state["cooldown_until"] = time.monotonic() + UNAUTHORIZED_COOLDOWN
+                print(f"⚠️ Key {state['id']} was rejected ({status}), out of rotation for {UNAUTHORIZED_COOLDOWN}s")
+            elif status is not None and status < 400:
+                state["rate_limited_in_row"] = 0
+
+    def suspend(self, api_key, seconds=UNAUTHORIZED_COOLDOWN):
+        """
+        Take a key out of rotation, e.g. after it failed verification.
+
+        Args:
+            api_key (str): The key
+            seconds (float): How long the key stays out of rotation
+        """
+        with self._lock:
+            if api_key in self._state:
+                self._state[api_key]["cooldown_until"] = time.monotonic() + seconds
+
+    def stats(self):
+        """
+        Report the load and health of each key.
+
+        Returns:
+            dict: Per key id, the requests made, in flight and failed, the 429s and 401/403s,
+                the last reported remaining quota, the seconds left out of rotation and the
+                mean latency in milliseconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                state["id"]: {
+                    "requests": state["requests"],
+                    "in_flight": state["in_flight"],
+                    "errors": state["errors"],
+                    "rate_limited": state["rate_limited"],
+                    "unauthorized": state["unauthorized"],
+                    "remaining": state["remaining"],
+                    "cooling_for_s": round(max(0.0, state["cooldown_until"] - now), 1),
+                    "latency_ms": (round(state["latency"] / state["requests"] * 1000, 1)
+                                   if state["requests"] else None),
+                }
+                for state in self._state.values()
+            }
+
+def load_keys(service):
+    """
+    Read the API keys of a service from the environment.
+
+    Args:
+        service (str): "together" or "openai"
+
+    Returns:
+        list: The keys, without duplicates
+    """
+    many, one = KEY_ENV_VARS[service]
+    keys = [key.strip() for key in os.environ.get(many, "").split(",")]
+    keys.append(os.environ.get(one, "").strip())
+    return list(dict.fromkeys(key for key in keys if key))
+
+def get_key_pool(service):
+    """
+    Get the key pool of a service, loading its keys from the environment on first use.
+
+    Args:
+        service (str): "together" or "openai"
+
+    Returns:
+        KeyPool: The pool, possibly empty
+    """
+    if service not in _pools:
+        with _pools_lock:
+            if service not in _pools:
+                _pools[service] = KeyPool(service, load_keys(service))
+    return _pools[service]
+
+def key_pool_stats():
+    """
+    Report the keys of every pool that has been loaded.
+
+    Returns:
+        dict: Service name to KeyPool.stats()
+    """
+    return {service: pool.stats() for service, pool in list(_pools.items())}
@@ -0,0 +1,120 @@
+"""
+LLM providers module.
+
+This module builds LangChain language models for the supported providers
+without any prompts, so they can be created from menus, scripts and the
+command-line interface alike.
+"""
+
+import os
+from models_config import FAMOUS_MODELS
+from key_pool import get_key_pool
+
+TOGETHER_API_BASE = "https://api.together.xyz/v1"
+OPENAI_API_BASE = "https://api.openai.com/v1"
+
+DEFAULT_SYSTEM_INSTRUCTION = ("You are a helpful AI assistant. Provide clear, concise, and accurate responses "
+                              "to the user's questions.")
+
+# Provider name -> environment variable holding its API key
+PROVIDERS = {
+    "openai": "OPENAI_API_KEY",
+    "together": "TOGETHER_API_KEY",
+    "together-native": "TOGETHER_API_KEY",
+}
+
+DEFAULT_MODELS = {
+    "openai": "gpt-3.5-turbo",
+    "together": FAMOUS_MODELS["Chat Models"][0]["name"],
+    "together-native": FAMOUS_MODELS["Chat Models"][0]["name"],
+}
+
+def provider_api_key(provider, api_key=None):
+    """
+    Resolve the API key for a provider.
+
+    Args:
+        provider (str): A key of PROVIDERS
+        api_key (str, optional): An explicit key, used as is when given
+
+    Returns:
+        str or None: The API key, or None if none is configured. Without an explicit key or
+            the provider's environment variable, the key pool's best key is used
+    """
+    service = "openai" if provider == "openai" else "together"
+    return api_key or os.environ.get(PROVIDERS[provider]) or get_key_pool(service).best_key()
+
+def discard_api_key(provider, api_key):
+    """
+    Stop using an API key that failed verification.
+
+    The provider's environment variable is cleared and the key is taken out of
+    the key pool's rotation, so the next provider_api_key() call returns another
+    configured key or None.
+
+    Args:
+        provider (str): A key of PROVIDERS
+        api_key (str): The rejected key
+    """
+    os.environ.pop(PROVIDERS[provider], None)
+    get_key_pool("openai" if provider == "openai" else "together").suspend(api_key)
+
+def chat_completions_url(provider):
+    """
+    Get the Chat Completions endpoint of a provider.
+
+    Args:
+        provider (str): A key of PROVIDERS
+
+    Returns:
+        str: The endpoint URL
+    """
+    return f"{OPENAI_API_BASE if provider == 'openai' else TOGETHER_API_BASE}/chat/completions"
+
+def build_llm(provider, model=None, api_key=None, api="chat", temperature=0, max_tokens=1000):
+    """
+    Build a language model for a provider.
+
+    The model's requests wait for a scheduler slot, and when the key belongs to the
+    provider's key pool each request uses the pool's best key, moving on to the next
+    one after a 401/403 or 429.
+
+    Args:
+        provider (str): "openai", "together" (OpenAI-compatible API) or "together-native"
+        model (str, optional): The model name, defaults to DEFAULT_MODELS[provider]
+        api_key (str, optional): The API key, read from the provider's environment variable if not given
+        api (str): "chat" for the Chat Completions API or "completions" for the Completions API
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum number of tokens to generate
+
+    Returns:
+        The initialized language model
+
+    Raises:
+        ValueError: If the provider is unknown or no API key is configured
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider '{provider}'. Choose one of: {', '.join(PROVIDERS)}")
+    api_key = provider_api_key(provider, api_key)
+    if not api_key:
+        raise ValueError(f"{PROVIDERS[provider]} must be set to use the {provider} provider")
+    model = model or DEFAULT_MODELS[provider]
+
+    # LangChain and httpx are imported here so callers that never build an LLM do not pay for them.
+    # Either way the model's requests wait for a scheduler slot like every other provider call
+    from usage_ledger import langchain_callback
+    from llm_transport import scheduled_http_clients, scheduled_together
+    if provider == "together-native":
+        return scheduled_together(model=model, temperature=temperature, max_tokens=max_tokens,
+                                  together_api_key=api_key)
+
+    from langchain_openai import ChatOpenAI, OpenAI
+    llm_class = OpenAI if api == "completions" else ChatOpenAI
+    kind = "completion" if api == "completions" else "chat"
+    http_client, http_async_client = scheduled_http_clients()
+    kwargs = {"temperature": temperature, "model_name": model, "openai_api_key": api_key,
+              "http_client": http_client, "http_async_client": http_async_client,
+              "callbacks": [langchain_callback(provider, model, api_key, kind=kind)]}
+    if provider == "together":
+        kwargs.update(openai_api_base=TOGETHER_API_BASE, max_tokens=max_tokens)
+    return llm_class(**kwargs)
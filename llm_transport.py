@@ -0,0 +1,239 @@
+"""
+LLM transport module.
+
+This module sends the HTTP requests of LangChain language models through the
+priority scheduler, like provider_request does for direct calls. ChatOpenAI
+and OpenAI get httpx clients whose transports wait for a slot of the current
+priority class before each request and keep it until the response body is
+closed. The transports also draw each request's key from the key pool and
+report its outcome, so a 401/403 or 429 takes the key out of rotation and
+the request is retried with the next one. Together's own LLM class, which
+posts with requests and aiohttp, is replaced by a subclass that calls
+provider_request and aprovider_request. Chat and agent sessions thereby
+queue with the batches and rotate keys like them instead of bypassing both.
+"""
+
+import time
+import threading
+import httpx
+from scheduler import get_scheduler
+from tracing import span
+from api_utils import request_key_pool, choose_key, should_retry_with_another_key
+
+def _once(func):
+    """
+    Wrap a function so only its first call runs, from whichever thread makes it.
+    """
+    lock = threading.Lock()
+    done = []
+
+    def run():
+        with lock:
+            if done:
+                return
+            done.append(True)
+        func()
+    return run
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """
+    A response body that gives back its scheduler slot when it is closed.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """
+    An async response body that gives back its scheduler slot when it is closed.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+def _hold_until_closed(response, stream_class, release):
+    """
+    Run release once the body of a response is closed, or now if the body is already in memory.
+    """
+    if isinstance(response.stream, httpx.ByteStream):
+        release()
+    else:
+        response.stream = stream_class(response.stream, _once(release))
+    return response
+
+def _use_pooled_key(request, pool, caller_key, tried):
+    """
+    Put the key the pool picks for the next attempt in a request's Authorization header.
+
+    Returns:
+        str: The key the attempt uses
+    """
+    if pool is None:
+        return caller_key
+    api_key = choose_key(pool, caller_key, tried)
+    request.headers["Authorization"] = f"Bearer {api_key}"
+    return api_key
+
+class ScheduledTransport(httpx.BaseTransport):
+    """
+    An httpx transport that admits each request through the priority scheduler and the key pool.
+    """
+
+    def __init__(self, transport=None):
+        self._transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        scheduler = get_scheduler()
+        _, caller_key, pool = request_key_pool(str(request.url), request.headers)
+        tried = set()
+        while True:
+            api_key = _use_pooled_key(request, pool, caller_key, tried)
+            with span("scheduler.acquire") as acquired:
+                cls = scheduler.acquire()
+                acquired.set(priority=cls)
+            started = time.time()
+            try:
+                response = self._transport.handle_request(request)
+            except BaseException:
+                scheduler.release(cls)
+                if pool is not None:
+                    pool.release(api_key)
+                raise
+            if pool is not None:
+                pool.release(api_key, response.status_code, response.headers, time.time() - started)
+                if should_retry_with_another_key(pool, response.status_code, tried):
+                    response.close()
+                    scheduler.release(cls)
+                    continue
+            return _hold_until_closed(response, _ReleasingStream, lambda: scheduler.release(cls))
+
+    def close(self):
+        self._transport.close()
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    """
+    The asyncio counterpart of ScheduledTransport.
+    """
+
+    def __init__(self, transport=None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        scheduler = get_scheduler()
+        _, caller_key, pool = request_key_pool(str(request.url), request.headers)
+        tried = set()
+        while True:
+            api_key = _use_pooled_key(request, pool, caller_key, tried)
+            with span("scheduler.acquire") as acquired:
+                cls = await scheduler.acquire_async()
+                acquired.set(priority=cls)
+            started = time.time()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except BaseException:
+                scheduler.release(cls)
+                if pool is not None:
+                    pool.release(api_key)
+                raise
+            if pool is not None:
+                pool.release(api_key, response.status_code, response.headers, time.time() - started)
+                if should_retry_with_another_key(pool, response.status_code, tried):
+                    await response.aclose()
+                    scheduler.release(cls)
+                    continue
+            return _hold_until_closed(response, _AsyncReleasingStream, lambda: scheduler.release(cls))
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def scheduled_http_clients():
+    """
+    Build the HTTP clients of an OpenAI-compatible LangChain model.
+
+    Returns:
+        tuple: An httpx.Client and an httpx.AsyncClient, for the http_client and
+            http_async_client arguments of ChatOpenAI and OpenAI
+    """
+    return httpx.Client(transport=ScheduledTransport()), httpx.AsyncClient(transport=AsyncScheduledTransport())
+
+def _check_together_status(status, text):
+    """
+    Raise the errors langchain_together raises for a non-200 completion.
+    """
+    if status >= 500:
+        raise Exception(f"Together Server: Error {status}")
+    if status >= 400:
+        raise ValueError(f"Together received an invalid payload: {text}")
+    if status != 200:
+        raise Exception(f"Together returned an unexpected response with status {status}: {text}")
+
+_together_class = None
+
+def scheduled_together(**kwargs):
+    """
+    Build a langchain_together Together model whose calls go through provider_request.
+
+    The calls are recorded in the usage ledger by provider_request, with the
+    token usage the provider reports, so the model needs no usage callback.
+
+    Args:
+        **kwargs: Arguments for langchain_together.Together
+
+    Returns:
+        The initialized language model
+    """
+    global _together_class
+    if _together_class is None:
+        _together_class = _define_scheduled_together()
+    return _together_class(**kwargs)
+
+def _define_scheduled_together():
+    """
+    Define the Together subclass, on first use since it imports LangChain.
+    """
+    from langchain_together import Together
+
+    class ScheduledTogether(Together):
+        def _request(self, prompt, stop, params):
+            stop_to_use = stop[0] if stop and len(stop) == 1 else stop
+            payload = {**self.default_params, "prompt": prompt, "stop": stop_to_use, **params}
+            headers = {"Authorization": f"Bearer {self.together_api_key.get_secret_value()}",
+                       "Content-Type": "application/json"}
+            return {"headers": headers, "json": {k: v for k, v in payload.items() if v is not None}}
+
+        def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+            from api_utils import provider_request
+
+            response = provider_request("POST", self.base_url, **self._request(prompt, stop, kwargs))
+            _check_together_status(response.status_code, response.text)
+            return self._format_output(response.json())
+
+        async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+            from async_providers import aprovider_request
+
+            response = await aprovider_request("POST", self.base_url, **self._request(prompt, stop, kwargs))
+            _check_together_status(response.status_code, response.text)
+            return self._format_output(response.json())
+
+    return ScheduledTogether
@@ -9,26 +9,24 @@ Developed by Blackbeard (https://blackbeard.one | https://tentitanics.com | http
 © 2023-2024 Blackbeard. All rights reserved.
 """
 
-from langchain_openai import ChatOpenAI, OpenAI
-from langchain_together import Together
-from langchain_community.callbacks.manager import get_openai_callback
 import os
 import sys
 
-# Import modules
-from models_config import FAMOUS_MODELS
-from api_utils import verify_openai_key, verify_together_key
-from audio_gen import run_audio_generation_mode, generate_audio
-from image_gen import run_image_generation_mode, generate_image
-from agent_system_direct import run_multi_agent_system, talk_to_ai
-from model_selection import display_famous_models_menu, list_together_models
+# Import modules. LangChain and the feature modules are imported where they are
+# used, so startup only pays for the mode that is actually run.
+from models_config import FAMOUS_MODELS, AVAILABLE_VOICES
+from api_utils import verify_openai_key, verify_together_key, prewarm_connections, PREWARM_HOSTS
+from llm_providers import build_llm, provider_api_key, discard_api_key
+from navigation import select_next_action, run_state_machine, AGAIN, PREVIOUS_MENU, MAIN_MENU, EXIT
+from scheduler import priority, INTERACTIVE
+from tracing import current_span
 
 def select_mode():
     """
     Select the mode of operation.
     
     Returns:
-        str: The selected mode
+        str: The selected mode, or EXIT
     """
     print("\n=== SELECT MODE ===")
     print("1. Test LLM Provider")
@@ -43,7 +41,7 @@ def select_mode():
         return "talk_to_ai"
     elif choice == "3":
         print("Exiting program.")
-        sys.exit(0)
+        return EXIT
     else:
         print("Invalid choice. Defaulting to Test LLM Provider.")
         return "test_llm"
@@ -53,7 +51,7 @@ def select_test_llm_option():
     Select the test option for LLM Provider.
     
     Returns:
-        str: The selected test option
+        str: The selected test option, PREVIOUS_MENU or MAIN_MENU
     """
     print("\n=== TEST LLM PROVIDER ===")
     print("1. General Chat/Instructions (3-Step Process)")
@@ -72,11 +70,9 @@ def select_test_llm_option():
         return "image_generation"
     elif choice == "4":
         # Return to previous menu (main menu in this case)
-        return select_mode()
+        return PREVIOUS_MENU
     elif choice == "5":
-        # Return to main menu
-        main()
-        sys.exit(0)
+        return MAIN_MENU
     else:
         print("Invalid choice. Defaulting to General Chat/Instructions.")
         return "general_chat"
@@ -86,7 +82,7 @@ def select_talk_to_ai_option():
     Select the option for Talk to AI.
     
     Returns:
-        str: The selected option
+        str: The selected option, PREVIOUS_MENU or MAIN_MENU
     """
     print("\n=== TALK TO AI ===")
     print("1. General Chat/Instructions")
@@ -105,11 +101,9 @@ def select_talk_to_ai_option():
         return "image_generation"
     elif choice == "4":
         # Return to previous menu (main menu in this case)
-        return select_mode()
+        return PREVIOUS_MENU
     elif choice == "5":
-        # Return to main menu
-        main()
-        sys.exit(0)
+        return MAIN_MENU
     else:
         print("Invalid choice. Defaulting to General Chat/Instructions.")
         return "general_chat"
@@ -122,8 +116,18 @@ def initialize_llm(mode="general_chat"):
         mode (str): The current mode (general_chat, audio_generation, or image_generation)
         
     Returns:
-        tuple: The initialized language model, the API key, and the selected model name (for image/audio generation)
+        tuple or str: The initialized language model, the API key, and the selected model name
+            (for image/audio generation), or a navigation action: AGAIN to choose the provider
+            again, PREVIOUS_MENU, MAIN_MENU or EXIT
     """
+    from model_selection import display_famous_models_menu, list_together_models
+    
+    def make_llm(provider, model_name, api_key, api="chat"):
+        # Image and audio modes only need the API key and model, so LangChain is not loaded for them
+        if mode in ("image_generation", "audio_generation"):
+            return None
+        return build_llm(provider, model_name, api_key, api=api)
+    
     # Ask user to choose between OpenAI and Together AI
     print("Choose an LLM provider:")
     print("1. OpenAI")
@@ -136,7 +140,7 @@ def initialize_llm(mode="general_chat"):
     if choice == "1":
         # OpenAI option
         while True:
-            openai_api_key = os.environ.get("OPENAI_API_KEY")
+            openai_api_key = provider_api_key("openai")
             if not openai_api_key:
                 openai_api_key = input("Please enter your OpenAI API key: ")
                 if not openai_api_key:
@@ -145,15 +149,15 @@ def initialize_llm(mode="general_chat"):
             print("Verifying OpenAI API key...")
             if verify_openai_key(openai_api_key):
                 print("OpenAI API key is valid!")
-                return ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo", openai_api_key=openai_api_key), openai_api_key, None
+                return make_llm("openai", "gpt-3.5-turbo", openai_api_key), openai_api_key, None
             else:
                 print("Invalid OpenAI API key. Please try again.")
-                os.environ.pop("OPENAI_API_KEY", None)  # Clear the environment variable if it exists
+                discard_api_key("openai", openai_api_key)  # Clear the environment variable and pooled key
     
     elif choice == "2":
         # Together AI option (native API)
         while True:
-            together_api_key = os.environ.get("TOGETHER_API_KEY")
+            together_api_key = provider_api_key("together")
             if not together_api_key:
                 together_api_key = input("Please enter your Together AI API key: ")
                 if not together_api_key:
@@ -186,19 +190,11 @@ def initialize_llm(mode="general_chat"):
                 elif filter_choice == "4":
                     # Return to previous menu
                     print("Returning to previous menu...")
-                    if mode == "general_chat":
-                        return select_test_llm_option(), None, None
-                    elif mode == "audio_generation":
-                        return select_test_llm_option(), None, None
-                    elif mode == "image_generation":
-                        return select_test_llm_option(), None, None
-                    else:
-                        return select_mode(), None, None
+                    return PREVIOUS_MENU
                 elif filter_choice == "5":
                     # Return to main menu
                     print("Returning to main menu...")
-                    main()
-                    sys.exit(0)
+                    return MAIN_MENU
                 else:
                     filtered_models = all_models
                     print("\nShowing ALL models:")
@@ -236,29 +232,25 @@ def initialize_llm(mode="general_chat"):
                     print(f"Pricing: {'Free' if details['is_free'] else 'Paid'}")
                 
                 try:
-                    return Together(
-                        model=model_name,
-                        temperature=0,
-                        max_tokens=1000,  # Set a higher max_tokens value to avoid truncation
-                        together_api_key=together_api_key
-                    ), together_api_key, None
+                    # max_tokens defaults to 1000 to avoid truncation
+                    return make_llm("together-native", model_name, together_api_key), together_api_key, None
                 except Exception as e:
                     print(f"\n⚠️ ERROR: Failed to initialize Together AI model: {e}")
                     print("Would you like to try another provider? (y/n)")
                     retry = input().lower()
                     if retry == 'y':
-                        return initialize_llm()
+                        return AGAIN
                     else:
                         print("Exiting program.")
-                        sys.exit(1)
+                        return EXIT
             else:
                 print("Invalid Together AI API key. Please try again.")
-                os.environ.pop("TOGETHER_API_KEY", None)  # Clear the environment variable if it exists
+                discard_api_key("together", together_api_key)  # Clear the environment variable and pooled key
     
     elif choice == "3":
         # Together AI via OpenAI-compatible API
         while True:
-            together_api_key = os.environ.get("TOGETHER_API_KEY")
+            together_api_key = provider_api_key("together")
             if not together_api_key:
                 together_api_key = input("Please enter your Together AI API key: ")
                 if not together_api_key:
@@ -291,19 +283,11 @@ def initialize_llm(mode="general_chat"):
                 elif filter_choice == "4":
                     # Return to previous menu
                     print("Returning to previous menu...")
-                    if mode == "general_chat":
-                        return select_test_llm_option(), None
-                    elif mode == "audio_generation":
-                        return select_test_llm_option(), None
-                    elif mode == "image_generation":
-                        return select_test_llm_option(), None
-                    else:
-                        return select_mode(), None
+                    return PREVIOUS_MENU
                 elif filter_choice == "5":
                     # Return to main menu
                     print("Returning to main menu...")
-                    main()
-                    sys.exit(0)
+                    return MAIN_MENU
                 else:
                     filtered_models = all_models
                     print("\nShowing ALL models:")
@@ -359,46 +343,35 @@ def initialize_llm(mode="general_chat"):
                 try:
                     if api_choice == "2":
                         # Use OpenAI Completions API
-                        from langchain_openai import OpenAI
                         print("Using OpenAI Completions API with Together AI backend")
                         print("API Base: https://api.together.xyz/v1")
                         
-                        return OpenAI(
-                            temperature=0,
-                            model_name=model_name,
-                            openai_api_key=together_api_key,
-                            openai_api_base="https://api.together.xyz/v1",
-                            max_tokens=1000
-                        ), together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
+                        return make_llm("together", model_name, together_api_key, api="completions"), \
+                            together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
                     else:
                         # Use OpenAI Chat Completions API (default)
                         print("Using OpenAI Chat Completions API with Together AI backend")
                         print("API Base: https://api.together.xyz/v1")
                         
-                        return ChatOpenAI(
-                            temperature=0,
-                            model_name=model_name,
-                            openai_api_key=together_api_key,
-                            openai_api_base="https://api.together.xyz/v1",
-                            max_tokens=1000
-                        ), together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
+                        return make_llm("together", model_name, together_api_key), \
+                            together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
                 except Exception as e:
                     print(f"\n⚠️ ERROR: Failed to initialize Together AI model: {e}")
                     print("Would you like to try another provider? (y/n)")
                     retry = input().lower()
                     if retry == 'y':
-                        return initialize_llm()
+                        return AGAIN
                     else:
                         print("Exiting program.")
-                        sys.exit(1)
+                        return EXIT
             else:
                 print("Invalid Together AI API key. Please try again.")
-                os.environ.pop("TOGETHER_API_KEY", None)  # Clear the environment variable if it exists
+                discard_api_key("together", together_api_key)  # Clear the environment variable and pooled key
     
     elif choice == "4":
         # Famous & Preferred Models
         while True:
-            together_api_key = os.environ.get("TOGETHER_API_KEY")
+            together_api_key = provider_api_key("together")
             if not together_api_key:
                 together_api_key = input("Please enter your Together AI API key: ")
                 if not together_api_key:
@@ -438,13 +411,11 @@ def initialize_llm(mode="general_chat"):
                     # Check if user wants to return to previous menu
                     if model_index == len(all_famous_models):
                         print("Returning to previous menu...")
-                        return initialize_llm(mode)
+                        return AGAIN
                     # Check if user wants to return to main menu
                     elif model_index == len(all_famous_models) + 1:
                         print("Returning to main menu...")
-                        # Re-run the main function
-                        main()
-                        sys.exit(0)
+                        return MAIN_MENU
                     # Otherwise, select a model
                     elif 0 <= model_index < len(all_famous_models):
                         model_info = all_famous_models[model_index]
@@ -482,45 +453,34 @@ def initialize_llm(mode="general_chat"):
                 try:
                     if api_choice == "2":
                         # Use OpenAI Completions API
-                        from langchain_openai import OpenAI
                         print("Using OpenAI Completions API with Together AI backend")
                         print("API Base: https://api.together.xyz/v1")
                         
-                        return OpenAI(
-                            temperature=0,
-                            model_name=model_name,
-                            openai_api_key=together_api_key,
-                            openai_api_base="https://api.together.xyz/v1",
-                            max_tokens=1000
-                        ), together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
+                        return make_llm("together", model_name, together_api_key, api="completions"), \
+                            together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
                     else:
                         # Use OpenAI Chat Completions API (default)
                         print("Using OpenAI Chat Completions API with Together AI backend")
                         print("API Base: https://api.together.xyz/v1")
                         
-                        return ChatOpenAI(
-                            temperature=0,
-                            model_name=model_name,
-                            openai_api_key=together_api_key,
-                            openai_api_base="https://api.together.xyz/v1",
-                            max_tokens=1000
-                        ), together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
+                        return make_llm("together", model_name, together_api_key), \
+                            together_api_key, model_name if mode in ["image_generation", "audio_generation"] else None
                 except Exception as e:
                     print(f"\n⚠️ ERROR: Failed to initialize Together AI model: {e}")
                     print("Would you like to try another provider? (y/n)")
                     retry = input().lower()
                     if retry == 'y':
-                        return initialize_llm()
+                        return AGAIN
                     else:
                         print("Exiting program.")
-                        sys.exit(1)
+                        return EXIT
             else:
                 print("Invalid Together AI API key. Please try again.")
-                os.environ.pop("TOGETHER_API_KEY", None)  # Clear the environment variable if it exists
+                discard_api_key("together", together_api_key)  # Clear the environment variable and pooled key
     
     else:
-        print("Invalid choice. Defaulting to OpenAI.")
-        return initialize_llm()
+        print("Invalid choice. Please choose a provider again.")
+        return AGAIN
 
 def run_test_llm_general_chat(llm, *args):
     """
@@ -529,6 +489,10 @@ def run_test_llm_general_chat(llm, *args):
     Args:
         llm: The language model to use
     """
+    from langchain_openai import ChatOpenAI, OpenAI
+    from langchain_community.callbacks.manager import get_openai_callback
+    from agent_system_direct import run_multi_agent_system
+    
     # Define a specific task that will be consistent across all agents
     user_prompt = "Write a Python function called 'is_prime' that checks if a number is prime"
     
@@ -548,11 +512,34 @@ def run_test_llm_general_chat(llm, *args):
 
 def run_test_llm_audio_generation(api_key, model_name=None):
     """
-    Run the test LLM audio generation with preconstructed text.
+    Run the test LLM audio generation with preconstructed text until the user leaves.
     
     Args:
         api_key: The API key to use
+        model_name: The model name to use (if already selected)
+        
+    Returns:
+        str: The navigation action chosen by the user (PREVIOUS_MENU, MAIN_MENU or EXIT)
+    """
+    while True:
+        model_name = _test_audio_round(api_key, model_name)
+        action = select_next_action("audio file")
+        if action != AGAIN:
+            return action
+
+def _test_audio_round(api_key, model_name=None):
     """
+    Generate one audio file from the preconstructed text.
+    
+    Args:
+        api_key: The API key to use
+        model_name: The model name to use (if already selected)
+        
+    Returns:
+        str: The model that was used
+    """
+    from audio_gen import generate_audio
+    
     # Preconstructed text for audio generation
     text = "Hi this is Ten Titanics. Welcome aboard!"
     
@@ -615,43 +602,38 @@ def run_test_llm_audio_generation(api_key, model_name=None):
         print(f"You can play this file with your default audio player.")
     else:
         print("\n⚠️ Audio generation failed.")
-        
-    # Add options to return to previous menu, main menu, or exit
-    print("\nWhat would you like to do next?")
-    print("1. Generate another audio file")
-    print("2. Return to previous menu")
-    print("3. Return to main menu")
-    print("4. Exit")
-    
-    next_choice = input("Enter your choice (1-4): ")
-    
-    if next_choice == "1":
-        # Run audio generation again
-        return run_test_llm_audio_generation(api_key, model_name)
-    elif next_choice == "2":
-        # Return to previous menu - this will be handled by the calling function
-        return "previous_menu"
-    elif next_choice == "3":
-        # Return to main menu - this will be handled by the calling function
-        return "main_menu"
-    elif next_choice == "4":
-        # Exit
-        print("Exiting program.")
-        import sys
-        sys.exit(0)
-    else:
-        # Default to returning to previous menu
-        print("Invalid choice. Returning to previous menu.")
-        return "previous_menu"
+    return model_name
 
 def run_test_llm_image_generation(api_key, model_name=None):
     """
-    Run the test LLM image generation with preconstructed prompt.
+    Run the test LLM image generation with preconstructed prompt until the user leaves.
+    
+    Args:
+        api_key: The API key to use
+        model_name: The model name to use (if already selected)
+        
+    Returns:
+        str: The navigation action chosen by the user (PREVIOUS_MENU, MAIN_MENU or EXIT)
+    """
+    while True:
+        model_name = _test_image_round(api_key, model_name)
+        action = select_next_action("image")
+        if action != AGAIN:
+            return action
+
+def _test_image_round(api_key, model_name=None):
+    """
+    Generate one image from the preconstructed prompt.
     
     Args:
         api_key: The API key to use
         model_name: The model name to use (if already selected)
+        
+    Returns:
+        str: The model that was used
     """
+    from image_gen import generate_image
+    
     # Preconstructed prompt for image generation
     prompt = "Anime photo of Donald Trump"
     
@@ -716,103 +698,116 @@ def run_test_llm_image_generation(api_key, model_name=None):
         print(f"Images are saved in the 'Images' folder. You can view them in your file explorer.")
     else:
         print("\n⚠️ Image generation failed.")
+    return model_name
+
+# Menus shown for each mode, and the function run for each of their options
+MODE_MENUS = {
+    "test_llm": select_test_llm_option,
+    "talk_to_ai": select_talk_to_ai_option,
+}
+
+def _run_option(menu, option, llm, api_key, model_name):
+    """
+    Run the selected option of a mode.
+    
+    Args:
+        menu (str): The mode, "test_llm" or "talk_to_ai"
+        option (str): The option, "general_chat", "audio_generation" or "image_generation"
+        llm: The initialized language model (general chat only)
+        api_key (str): The API key
+        model_name (str): The selected model name (image/audio generation only)
         
-    # Add options to return to previous menu, main menu, or exit
-    print("\nWhat would you like to do next?")
-    print("1. Generate another image")
-    print("2. Return to previous menu")
-    print("3. Return to main menu")
-    print("4. Exit")
+    Returns:
+        str or None: The navigation action chosen by the user, if any
+    """
+    if option == "general_chat":
+        if menu == "test_llm":
+            return run_test_llm_general_chat(llm)
+        from agent_system_direct import talk_to_ai
+        return talk_to_ai(llm)
+    if option == "audio_generation":
+        if menu == "test_llm":
+            return run_test_llm_audio_generation(api_key, model_name)
+        from audio_gen import run_audio_generation_mode
+        return run_audio_generation_mode(api_key, model_name)
+    if menu == "test_llm":
+        return run_test_llm_image_generation(api_key, model_name)
+    from image_gen import run_image_generation_mode
+    return run_image_generation_mode(api_key, model_name)
+
+def main_menu_state(context):
+    """
+    Show the main menu.
     
-    next_choice = input("Enter your choice (1-4): ")
+    Args:
+        context (dict): The navigation state
+        
+    Returns:
+        str: The next state
+    """
+    mode = select_mode()
+    if mode == EXIT:
+        return EXIT
+    context["menu"] = mode
+    return "mode_menu"
+
+def mode_menu_state(context):
+    """
+    Show the menu of the selected mode.
     
-    if next_choice == "1":
-        # Run image generation again
-        return run_test_llm_image_generation(api_key, model_name)
-    elif next_choice == "2":
-        # Return to previous menu - this will be handled by the calling function
-        return "previous_menu"
-    elif next_choice == "3":
-        # Return to main menu - this will be handled by the calling function
-        return "main_menu"
-    elif next_choice == "4":
-        # Exit
-        print("Exiting program.")
-        import sys
-        sys.exit(0)
-    else:
-        # Default to returning to previous menu
-        print("Invalid choice. Returning to previous menu.")
-        return "previous_menu"
+    Args:
+        context (dict): The navigation state
+        
+    Returns:
+        str: The next state
+    """
+    option = MODE_MENUS[context["menu"]]()
+    if option in (PREVIOUS_MENU, MAIN_MENU):
+        return MAIN_MENU
+    context["option"] = option
+    # Connect to the option's provider hosts while the provider and model are being chosen
+    prewarm_connections(PREWARM_HOSTS[option])
+    return "run_option"
+
+def run_option_state(context):
+    """
+    Choose a provider and model, then run the selected option.
+    
+    Args:
+        context (dict): The navigation state
+        
+    Returns:
+        str: The next state
+    """
+    result = initialize_llm(context["option"])
+    if result == AGAIN:
+        return "run_option"
+    if result == PREVIOUS_MENU:
+        return "mode_menu"
+    if result in (MAIN_MENU, EXIT):
+        return result
+    
+    llm, api_key, model_name = result
+    current_span().set(menu=context["menu"], option=context["option"], model=model_name)
+    action = _run_option(context["menu"], context["option"], llm, api_key, model_name)
+    if action in (MAIN_MENU, EXIT):
+        return action
+    return "mode_menu"
+
+STATES = {
+    MAIN_MENU: main_menu_state,
+    "mode_menu": mode_menu_state,
+    "run_option": run_option_state,
+}
 
 def main():
     """
     Main function to run the multi-agent system.
     """
     try:
-        # Select mode
-        mode = select_mode()
-        
-        if mode == "test_llm":
-            # Test LLM Provider mode
-            test_option = select_test_llm_option()
-            
-            if test_option == "general_chat":
-                # Initialize the LLM based on user choice
-                llm, _, _ = initialize_llm("general_chat")
-                # Run the test LLM general chat
-                run_test_llm_general_chat(llm)
-            elif test_option == "audio_generation":
-                # Initialize the LLM based on user choice
-                _, api_key, model_name = initialize_llm("audio_generation")
-                # Run the test LLM audio generation and handle the return value
-                result = run_test_llm_audio_generation(api_key, model_name)
-                if result == "main_menu":
-                    # Re-run the main function
-                    main()
-                    sys.exit(0)
-                # If result is "previous_menu" or None, the function will return and the flow will continue
-            elif test_option == "image_generation":
-                # Initialize the LLM based on user choice
-                _, api_key, model_name = initialize_llm("image_generation")
-                # Run the test LLM image generation and handle the return value
-                result = run_test_llm_image_generation(api_key, model_name)
-                if result == "main_menu":
-                    # Re-run the main function
-                    main()
-                    sys.exit(0)
-                # If result is "previous_menu" or None, the function will return and the flow will continue
-        
-        elif mode == "talk_to_ai":
-            # Talk to AI mode
-            talk_option = select_talk_to_ai_option()
-            
-            if talk_option == "general_chat":
-                # Initialize the LLM based on user choice
-                llm, _, _ = initialize_llm("general_chat")
-                # Run the talk to AI general chat
-                talk_to_ai(llm)
-            elif talk_option == "audio_generation":
-                # Initialize the LLM based on user choice
-                _, api_key, model_name = initialize_llm("audio_generation")
-                # Run the audio generation mode and handle the return value
-                result = run_audio_generation_mode(api_key, model_name)
-                if result == "main_menu":
-                    # Re-run the main function
-                    main()
-                    sys.exit(0)
-                # If result is "previous_menu" or None, the function will return and the flow will continue
-            elif talk_option == "image_generation":
-                # Initialize the LLM based on user choice
-                _, api_key, model_name = initialize_llm("image_generation")
-                # Run the image generation mode and handle the return value
-                result = run_image_generation_mode(api_key, model_name)
-                if result == "main_menu":
-                    # Re-run the main function
-                    main()
-                    sys.exit(0)
-                # If result is "previous_menu" or None, the function will return and the flow will continue
-    
+        # Everything started from the menus has a user waiting on it
+        with priority(INTERACTIVE):
+            run_state_machine(STATES, MAIN_MENU)
     except KeyboardInterrupt:
         print("\n\nOperation cancelled by user.")
         sys.exit(0)
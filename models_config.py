@@ -35,3 +35,21 @@ AVAILABLE_VOICES = [
     "storyteller lady",
     "friendly sidekick"
 ]
+
+# Audio output formats for text-to-speech. "wav" variants are requested as raw PCM
+# and wrapped in a WAV header locally so streamed files always have correct sizes.
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_FORMATS = {
+    "mp3": {"extension": ".mp3", "response_format": "mp3", "playable": True,
+            "description": "MP3 - compressed, smallest files"},
+    "wav": {"extension": ".wav", "response_format": "raw", "encoding": "pcm_s16le", "bits": 16,
+            "container": "wav", "wav_format_tag": 1, "segment_format": "pcm", "playable": True,
+            "description": "WAV - 16-bit PCM, no decoding needed"},
+    "wav_ulaw": {"extension": ".wav", "response_format": "raw", "encoding": "pcm_mulaw", "bits": 8,
+                 "container": "wav", "wav_format_tag": 7, "segment_format": "ulaw", "playable": True,
+                 "description": "WAV - 8-bit mu-law, half the size of PCM"},
+    "pcm": {"extension": ".pcm", "response_format": "raw", "encoding": "pcm_s16le", "bits": 16, "playable": False,
+            "description": "Raw 16-bit little-endian PCM for streaming into other tools"},
+    "ulaw": {"extension": ".ulaw", "response_format": "raw", "encoding": "pcm_mulaw", "bits": 8, "playable": False,
+             "description": "Raw 8-bit mu-law"}
+}
@@ -0,0 +1,448 @@
+"""
+MP3 utilities module.
+
+This module provides frame-level MP3 helpers: parsing frame headers, iterating
+over the audio frames of a file without decoding them, concatenating several
+MP3 files into one without re-encoding, and normalizing level and trimming
+silence by rewriting the Layer III global gain fields.
+"""
+
+import os
+
+# Bitrates in kbit/s by bitrate index, for Layer III
+_BITRATES = {
+    "1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates in Hz by version and sample rate index
+_SAMPLE_RATES = {
+    "1": [44100, 48000, 32000],
+    "2": [22050, 24000, 16000],
+    "2.5": [11025, 12000, 8000],
+}
+_VERSIONS = {0: "2.5", 2: "2", 3: "1"}
+
+READ_SIZE = 64 * 1024
+
+# Normalization settings. Global gain is in 1.5 dB steps; the target is the
+# median gain of non-silent granules, which tracks the perceived level of speech.
+TARGET_GAIN = 150
+MAX_BOOST_STEPS = 6
+SILENCE_GAIN = 100
+TRIM_PAD_FRAMES = 2
+
+def parse_frame_header(header):
+    """
+    Parse a 4-byte MPEG audio Layer III frame header.
+
+    Args:
+        header (bytes): The four header bytes
+
+    Returns:
+        dict or None: The frame properties, or None if the bytes are not a valid header
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version = _VERSIONS.get((header[1] >> 3) & 0x03)
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version is None or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = _BITRATES["1" if version == "1" else "2"][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    channels = 1 if (header[3] >> 6) == 3 else 2
+    samples = 1152 if version == "1" else 576
+    frame_length = (samples // 8) * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "protected": not (header[1] & 0x01),
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "samples": samples,
+        "frame_length": frame_length,
+    }
+
+def side_info_offset(info):
+    """
+    Get the offset of the side information in a frame.
+
+    Args:
+        info (dict): The parsed frame header
+
+    Returns:
+        int: Offset in bytes from the start of the frame
+    """
+    return 4 + (2 if info["protected"] else 0)
+
+def side_info_length(info):
+    """
+    Get the length of the Layer III side information in a frame.
+
+    Args:
+        info (dict): The parsed frame header
+
+    Returns:
+        int: Length in bytes
+    """
+    if info["version"] == "1":
+        return 17 if info["channels"] == 1 else 32
+    return 9 if info["channels"] == 1 else 17
+
+def is_info_frame(frame, info):
+    """
+    Check whether a frame is a Xing/Info/VBRI header frame rather than audio.
+
+    Args:
+        frame (bytes): The complete frame
+        info (dict): The parsed frame header
+
+    Returns:
+        bool: True if the frame only carries stream metadata
+    """
+    offset = side_info_offset(info) + side_info_length(info)
+    return frame[offset:offset + 4] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+def _id3v2_size(data):
+    """
+    Get the total size of an ID3v2 tag at the start of the data.
+
+    Args:
+        data (bytes): The first bytes of the file
+
+    Returns:
+        int: Size of the tag in bytes, or 0 if there is none
+    """
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+def iter_frames(path, skip_info=True):
+    """
+    Iterate over the audio frames of an MP3 file without decoding them.
+
+    The file is read in fixed-size blocks, so memory use does not depend on
+    its length. ID3 tags and junk between frames are skipped.
+
+    Args:
+        path (str): Path to the MP3 file
+        skip_info (bool): Whether to skip Xing/Info/VBRI header frames
+
+    Yields:
+        tuple: The frame bytes and the parsed frame header
+    """
+    with open(path, "rb") as f:
+        buffer = f.read(READ_SIZE)
+        tag_size = _id3v2_size(buffer)
+        if tag_size:
+            f.seek(tag_size)
+            buffer = f.read(READ_SIZE)
+
+        position = 0
+        eof = False
+        while True:
+            if len(buffer) - position < 4 + 1441 * 2 and not eof:
+                chunk = f.read(READ_SIZE)
+                buffer = buffer[position:] + chunk
+                position = 0
+                eof = not chunk
+            if len(buffer) - position < 4:
+                return
+
+            info = parse_frame_header(buffer[position:position + 4])
+            if info is None:
+                if buffer[position:position + 3] == b"TAG" and len(buffer) - position == 128:
+                    return  # ID3v1 tag at the end of the file
+                position += 1
+                continue
+
+            end = position + info["frame_length"]
+            if end > len(buffer):
+                if eof:
+                    return  # truncated final frame
+                continue
+
+            frame = buffer[position:end]
+            position = end
+            if skip_info and is_info_frame(frame, info):
+                continue
+            yield frame, info
+
+def concat_mp3(input_paths, output_path):
+    """
+    Concatenate MP3 files into one at the frame level, without re-encoding.
+
+    Per-file ID3 tags and Xing/Info headers are dropped so the result is a
+    single continuous stream.
+
+    Args:
+        input_paths (list): The MP3 files to join, in order
+        output_path (str): Where to write the combined file
+
+    Returns:
+        int: The number of frames written
+    """
+    frames = 0
+    part_path = output_path + ".part"
+    with open(part_path, "wb") as out:
+        for path in input_paths:
+            frames += append_frames(path, out)
+    os.replace(part_path, output_path)
+    return frames
+
+def append_frames(path, out, start=0, stop=None):
+    """
+    Append the audio frames of an MP3 file to an open output file.
+
+    Args:
+        path (str): The MP3 file to read
+        out: The binary file object to write to
+        start (int): Index of the first frame to copy
+        stop (int, optional): Index of the frame to stop before
+
+    Returns:
+        int: The number of frames written
+    """
+    frames = 0
+    for index, (frame, _) in enumerate(iter_frames(path)):
+        if stop is not None and index >= stop:
+            break
+        if index >= start:
+            out.write(frame)
+            frames += 1
+    return frames
+
+def _read_bits(data, bit_offset, count):
+    """
+    Read an unsigned big-endian bit field.
+
+    Args:
+        data (bytes): The buffer
+        bit_offset (int): Offset of the first bit
+        count (int): Number of bits
+
+    Returns:
+        int: The field value
+    """
+    value = 0
+    for i in range(bit_offset, bit_offset + count):
+        value = (value << 1) | ((data[i >> 3] >> (7 - (i & 7))) & 1)
+    return value
+
+def _write_bits(data, bit_offset, count, value):
+    """
+    Write an unsigned big-endian bit field in place.
+
+    Args:
+        data (bytearray): The buffer
+        bit_offset (int): Offset of the first bit
+        count (int): Number of bits
+        value (int): The value to write
+    """
+    for i in range(count):
+        position = bit_offset + i
+        bit = (value >> (count - 1 - i)) & 1
+        mask = 1 << (7 - (position & 7))
+        if bit:
+            data[position >> 3] |= mask
+        else:
+            data[position >> 3] &= ~mask
+
+def granules(frame, info):
+    """
+    Locate the granules of a Layer III frame in its side information.
+
+    Args:
+        frame (bytes): The complete frame
+        info (dict): The parsed frame header
+
+    Returns:
+        list: (part2_3_length, global_gain, global_gain_bit_offset) for each granule and channel
+    """
+    bit = side_info_offset(info) * 8
+    channels = info["channels"]
+    if info["version"] == "1":
+        bit += 9 + (5 if channels == 1 else 3) + 4 * channels
+        granule_count, granule_bits = 2, 59
+    else:
+        bit += 8 + (1 if channels == 1 else 2)
+        granule_count, granule_bits = 1, 63
+
+    result = []
+    for _ in range(granule_count * channels):
+        part2_3_length = _read_bits(frame, bit, 12)
+        result.append((part2_3_length, _read_bits(frame, bit + 21, 8), bit + 21))
+        bit += granule_bits
+    return result
+
+def _crc16(data, bit_count):
+    """
+    Compute the MPEG audio CRC-16 over the first bit_count bits of data.
+
+    Args:
+        data (bytes): The protected bits
+        bit_count (int): Number of bits covered
+
+    Returns:
+        int: The CRC value
+    """
+    crc = 0xFFFF
+    for i in range(bit_count):
+        bit = (data[i >> 3] >> (7 - (i & 7))) & 1
+        carry = (crc >> 15) & 1
+        crc = (crc << 1) & 0xFFFF
+        if carry ^ bit:
+            crc ^= 0x8005
+    return crc
+
+def is_silent_frame(frame, info, silence_gain=SILENCE_GAIN):
+    """
+    Check whether every granule of a frame is silent.
+
+    A granule counts as silent when it carries no Huffman data or its global
+    gain is below silence_gain.
+
+    Args:
+        frame (bytes): The complete frame
+        info (dict): The parsed frame header
+        silence_gain (int): Global gain at or below which a granule is silent
+
+    Returns:
+        bool: True if the frame is silent
+    """
+    return all(length == 0 or gain <= silence_gain for length, gain, _ in granules(frame, info))
+
+def adjust_frame_gain(frame, info, steps):
+    """
+    Change the level of a frame by rewriting its global gain fields.
+
+    Each step is 1.5 dB. The audio data is not decoded; only the side
+    information (and the CRC, if present) is rewritten.
+
+    Args:
+        frame (bytes): The complete frame
+        info (dict): The parsed frame header
+        steps (int): Gain change in 1.5 dB steps
+
+    Returns:
+        bytes: The adjusted frame
+    """
+    if not steps:
+        return frame
+    adjusted = bytearray(frame)
+    for length, gain, bit_offset in granules(frame, info):
+        if length:
+            _write_bits(adjusted, bit_offset, 8, max(0, min(255, gain + steps)))
+
+    if info["protected"]:
+        protected = bytes(adjusted[2:4]) + bytes(adjusted[6:6 + side_info_length(info)])
+        crc = _crc16(protected, len(protected) * 8)
+        adjusted[4:6] = crc.to_bytes(2, "big")
+    return bytes(adjusted)
+
+def analyze_mp3(path, silence_gain=SILENCE_GAIN):
+    """
+    Measure the level and the silent lead-in and tail of an MP3 file.
+
+    The file is read frame by frame; only a gain histogram and a few counters
+    are kept, so memory use does not depend on the length of the file.
+
+    Args:
+        path (str): Path to the MP3 file
+        silence_gain (int): Global gain at or below which a granule is silent
+
+    Returns:
+        dict: Frame count, first and last non-silent frame index and the median global gain of non-silent granules
+    """
+    histogram = [0] * 256
+    frames = 0
+    first_active = None
+    last_active = None
+
+    for frame, info in iter_frames(path):
+        silent = True
+        for length, gain, _ in granules(frame, info):
+            if length and gain > silence_gain:
+                histogram[gain] += 1
+                silent = False
+        if not silent:
+            if first_active is None:
+                first_active = frames
+            last_active = frames
+        frames += 1
+
+    median_gain = None
+    total = sum(histogram)
+    if total:
+        running = 0
+        for gain, count in enumerate(histogram):
+            running += count
+            if running * 2 >= total:
+                median_gain = gain
+                break
+
+    return {"frames": frames, "first_active": first_active, "last_active": last_active, "median_gain": median_gain}
+
+def gain_steps_for(analysis, target_gain=TARGET_GAIN, max_boost_steps=MAX_BOOST_STEPS):
+    """
+    Work out the gain change that brings a file to the target level.
+
+    Args:
+        analysis (dict): The result of analyze_mp3
+        target_gain (int): The median global gain to aim for
+        max_boost_steps (int): Largest increase allowed, to limit the risk of clipping
+
+    Returns:
+        int: Gain change in 1.5 dB steps
+    """
+    if analysis["median_gain"] is None:
+        return 0
+    return min(target_gain - analysis["median_gain"], max_boost_steps)
+
+def normalize_mp3(input_path, output_path=None, target_gain=TARGET_GAIN, trim=True,
+                  pad_frames=TRIM_PAD_FRAMES, silence_gain=SILENCE_GAIN):
+    """
+    Normalize the level of an MP3 file and trim its leading and trailing silence.
+
+    Works in two streaming passes (analysis, then rewrite) over the frames,
+    without decoding, so it can run on hour-long files with bounded memory.
+
+    Args:
+        input_path (str): The MP3 file to process
+        output_path (str, optional): Where to write the result, defaults to replacing the input
+        target_gain (int): The median global gain to aim for
+        trim (bool): Whether to drop silent frames at the start and end
+        pad_frames (int): Silent frames kept before and after the audio when trimming
+        silence_gain (int): Global gain at or below which a granule is silent
+
+    Returns:
+        dict: The analysis, the gain change applied and the number of frames written
+    """
+    analysis = analyze_mp3(input_path, silence_gain)
+    steps = gain_steps_for(analysis, target_gain)
+
+    start, stop = 0, analysis["frames"]
+    if trim and analysis["first_active"] is not None:
+        start = max(0, analysis["first_active"] - pad_frames)
+        stop = min(analysis["frames"], analysis["last_active"] + 1 + pad_frames)
+
+    output_path = output_path or input_path
+    part_path = output_path + ".part"
+    written = 0
+    with open(part_path, "wb") as out:
+        for index, (frame, info) in enumerate(iter_frames(input_path)):
+            if index >= stop:
+                break
+            if index >= start:
+                out.write(adjust_frame_gain(frame, info, steps))
+                written += 1
+    os.replace(part_path, output_path)
+
+    return {"analysis": analysis, "gain_steps": steps, "frames": written}
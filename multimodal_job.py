@@ -0,0 +1,224 @@
+"""
+Multimodal job module.
+
+This module produces a content bundle in one run: the planner, coder and
+critic agents, a spoken narration of the plan and a cover image. As soon as
+the plan exists, three branches run in parallel: coding followed by
+critique, narration (summary, then speech) and the cover (image prompt, then
+image). The end-to-end time is therefore close to the plan plus the longest
+branch, and the report names that critical path.
+
+Usage:
+    python multimodal_job.py "Write a function that checks if a number is prime" [--provider together]
+        [--voice "laidback woman"] [--image-model black-forest-labs/FLUX.1-schnell] [--output bundle]
+
+Developed by Blackbeard (https://blackbeard.one | https://tentitanics.com | https://github.com/blackbeardONE)
+© 2023-2024 Blackbeard. All rights reserved.
+"""
+
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from models_config import AVAILABLE_VOICES
+from scheduler import submit_with_context
+from usage_ledger import usage_job, current_job
+from tracing import span
+
+NARRATION_INSTRUCTION = ("Summarize the following implementation plan in two or three plain sentences that "
+                         "will be read aloud. Do not use lists, markdown or code.")
+COVER_INSTRUCTION = ("Describe a cover illustration for a project with the following implementation plan in one "
+                     "sentence, as a prompt for an image generation model. Reply with the prompt only.")
+
+DEFAULT_AUDIO_MODEL = "cartesia/sonic-2"
+DEFAULT_IMAGE_MODEL = "black-forest-labs/FLUX.1-schnell"
+
+# The branches that start once the plan exists, and the stages each runs in order
+BRANCHES = {
+    "code": ("code", "review"),
+    "narration": ("summary", "speech"),
+    "cover": ("cover_prompt", "image"),
+}
+
+def _timed(timings, stage, started, func, *args, **kwargs):
+    """
+    Run one stage and record when it started and finished, relative to the start of the job.
+
+    Args:
+        timings (dict): Stage name to {"start", "end", "duration"} in seconds
+        stage (str): The stage name
+        started (float): When the job started
+        func (callable): The stage function
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        The function's result
+    """
+    begin = time.time()
+    try:
+        with span(f"multimodal.{stage}"):
+            return func(*args, **kwargs)
+    finally:
+        end = time.time()
+        timings[stage] = {"start": round(begin - started, 3), "end": round(end - started, 3),
+                          "duration": round(end - begin, 3)}
+
+def critical_path(timings):
+    """
+    Find the branch that determined the end-to-end time of a job.
+
+    Args:
+        timings (dict): The stage timings of the job
+
+    Returns:
+        dict: The critical branch and its stages, the critical-path time, the time the stages
+            would take one after another and the time saved by running the branches in parallel
+    """
+    branch_times = {name: sum(timings[stage]["duration"] for stage in stages if stage in timings)
+                    for name, stages in BRANCHES.items()}
+    critical = max(branch_times, key=branch_times.get)
+    plan = timings.get("plan", {}).get("duration", 0.0)
+    sequential = sum(stage["duration"] for stage in timings.values())
+    path_time = plan + branch_times[critical]
+    return {
+        "branch": critical,
+        "stages": ["plan", *BRANCHES[critical]],
+        "time": round(path_time, 3),
+        "branch_times": {name: round(value, 3) for name, value in branch_times.items()},
+        "sequential_time": round(sequential, 3),
+        "saved": round(sequential - path_time, 3),
+    }
+
+def run_multimodal_job(llm, api_key, request, voice=AVAILABLE_VOICES[0], audio_model=DEFAULT_AUDIO_MODEL,
+                       image_model=DEFAULT_IMAGE_MODEL, output_name=None, narration=None, image_prompt=None,
+                       audio_format="mp3", steps=None):
+    """
+    Run the agents and produce a narration and a cover image for their plan, in parallel.
+
+    Args:
+        llm: The language model used by the agents and to write the narration and image prompt
+        api_key (str): The Together AI API key used for speech and images
+        request (str): The user's request for the agents
+        voice (str): The narration voice
+        audio_model (str): The text-to-speech model
+        image_model (str): The image generation model
+        output_name (str, optional): Base name of the audio and image files, random if not given
+        narration (str, optional): Text to narrate instead of a summary of the plan
+        image_prompt (str, optional): Prompt for the cover instead of one written from the plan
+        audio_format (str): The narration format, a key of AUDIO_FORMATS
+        steps (int, optional): Image generation steps, defaults to 10 for FLUX.1-schnell and 20 otherwise
+
+    Returns:
+        dict: The plan, code, review, narration and cover with their files, the stage timings,
+            the critical path and the total time
+    """
+    output_name = output_name or f"bundle_{uuid.uuid4().hex[:12]}"
+    # The job's provider calls are costed under its output name unless it runs inside another job
+    with usage_job(current_job() or output_name):
+        return _run_multimodal_job(llm, api_key, request, voice, audio_model, image_model, output_name, narration,
+                                   image_prompt, audio_format, steps)
+
+def _run_multimodal_job(llm, api_key, request, voice, audio_model, image_model, output_name, narration,
+                        image_prompt, audio_format, steps):
+    """
+    Run a multimodal job, see run_multimodal_job.
+    """
+    from agent_system_direct import planner_agent, coder_agent, critic_agent, ask_ai
+    from audio_gen import generate_audio, generate_long_audio, LONG_TEXT_THRESHOLD
+    from image_gen import generate_image, image_file_path
+    from models_config import AUDIO_FORMATS
+
+    steps = steps or (10 if "FLUX.1-schnell" in image_model else 20)
+    timings = {}
+    started = time.time()
+
+    print(f"📌 User Request: {request}")
+    print("\n🔧 Planning the task...")
+    plan = _timed(timings, "plan", started, planner_agent, llm, request)
+
+    def code_branch():
+        code = _timed(timings, "code", started, coder_agent, llm, plan)
+        review = _timed(timings, "review", started, critic_agent, llm, code)
+        return {"code": code, "review": review}
+
+    def narration_branch():
+        text = narration or _timed(timings, "summary", started, ask_ai, llm, plan, NARRATION_INSTRUCTION)
+        audio_file = f"{output_name}{AUDIO_FORMATS[audio_format]['extension']}"
+        synthesize = generate_long_audio if len(text) > LONG_TEXT_THRESHOLD else generate_audio
+        success = _timed(timings, "speech", started, synthesize, api_key, text, audio_model, voice, audio_file,
+                         audio_format=audio_format)
+        return {"narration": text, "audio": os.path.join("Audio", audio_file) if success else None}
+
+    def cover_branch():
+        prompt = image_prompt or _timed(timings, "cover_prompt", started, ask_ai, llm, plan, COVER_INSTRUCTION)
+        success = _timed(timings, "image", started, generate_image, api_key, prompt.strip(), model=image_model,
+                         steps=steps, save_path=output_name)
+        return {"cover_prompt": prompt, "image": image_file_path(output_name, 0, 1, "jpeg") if success else None}
+
+    print("\n🚀 Coding, narrating and drawing the cover in parallel...")
+    result = {"ok": True, "request": request, "plan": plan}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=len(BRANCHES), thread_name_prefix="multimodal") as executor:
+        futures = {name: submit_with_context(executor, branch)
+                   for name, branch in (("code", code_branch), ("narration", narration_branch),
+                                        ("cover", cover_branch))}
+        for name, future in futures.items():
+            try:
+                result.update(future.result())
+            except (Exception, SystemExit) as e:
+                errors[name] = str(e) or type(e).__name__
+
+    result["total_time"] = round(time.time() - started, 3)
+    result["timings"] = timings
+    result["critical_path"] = critical_path(timings)
+    if errors:
+        result["errors"] = errors
+    result["ok"] = not errors and bool(result.get("audio")) and bool(result.get("image"))
+    return result
+
+def print_timeline(result):
+    """
+    Print the stage timings and the critical path of a multimodal job.
+
+    Args:
+        result (dict): The result of run_multimodal_job
+    """
+    print("\n=== TIMELINE ===")
+    for stage, timing in sorted(result["timings"].items(), key=lambda item: item[1]["start"]):
+        print(f"{stage:<13} {timing['start']:>7.2f}s → {timing['end']:>7.2f}s  ({timing['duration']:.2f}s)")
+    path = result["critical_path"]
+    print(f"\nCritical path: {' → '.join(path['stages'])} ({path['time']:.2f}s)")
+    print(f"Total: {result['total_time']:.2f}s, {path['sequential_time']:.2f}s if run one after another "
+          f"({path['saved']:.2f}s saved)")
+
+if __name__ == "__main__":
+    import sys
+    import json
+    import argparse
+    from llm_providers import PROVIDERS, build_llm, provider_api_key
+
+    parser = argparse.ArgumentParser(description="Run the agents and narrate and illustrate their plan in parallel.")
+    parser.add_argument("request", help="The request for the agents")
+    parser.add_argument("--provider", choices=list(PROVIDERS), default="together")
+    parser.add_argument("--model", help="The chat model, defaults to the provider's default")
+    parser.add_argument("--voice", default=AVAILABLE_VOICES[0], choices=AVAILABLE_VOICES)
+    parser.add_argument("--audio-model", default=DEFAULT_AUDIO_MODEL)
+    parser.add_argument("--image-model", default=DEFAULT_IMAGE_MODEL)
+    parser.add_argument("--steps", type=int, help="Image generation steps")
+    parser.add_argument("--output", help="Base name of the audio and image files")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+
+    api_key = provider_api_key("together")
+    if not api_key:
+        print("TOGETHER_API_KEY or TOGETHER_API_KEYS must be set for speech and images.")
+        sys.exit(1)
+    job = run_multimodal_job(build_llm(args.provider, args.model), api_key, args.request, voice=args.voice,
+                             audio_model=args.audio_model, image_model=args.image_model,
+                             output_name=args.output, steps=args.steps)
+    if args.json:
+        print(json.dumps(job, default=str, indent=2))
+    else:
+        print_timeline(job)
+    sys.exit(0 if job["ok"] else 1)
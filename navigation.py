@@ -0,0 +1,73 @@
+"""
+Navigation module.
+
+This module provides the navigation actions shared by the interactive menus
+and a small state-machine runner. Menus and modes return an action or the
+name of the next state instead of calling each other, so a session of any
+length runs at a constant stack depth.
+"""
+
+from tracing import span
+
+# Navigation actions returned by menus and modes
+AGAIN = "again"
+PREVIOUS_MENU = "previous_menu"
+MAIN_MENU = "main_menu"
+EXIT = "exit"
+
+def select_next_action(item):
+    """
+    Ask what to do after a generation finished.
+
+    Args:
+        item (str): What was generated, e.g. "image" or "audio file"
+
+    Returns:
+        str: AGAIN, PREVIOUS_MENU, MAIN_MENU or EXIT
+    """
+    print("\nWhat would you like to do next?")
+    print(f"1. Generate another {item}")
+    print("2. Return to previous menu")
+    print("3. Return to main menu")
+    print("4. Exit")
+
+    next_choice = input("Enter your choice (1-4): ")
+
+    if next_choice == "1":
+        return AGAIN
+    elif next_choice == "2":
+        return PREVIOUS_MENU
+    elif next_choice == "3":
+        return MAIN_MENU
+    elif next_choice == "4":
+        print("Exiting program.")
+        return EXIT
+    else:
+        # Default to returning to previous menu
+        print("Invalid choice. Returning to previous menu.")
+        return PREVIOUS_MENU
+
+def run_state_machine(states, start, context=None, max_steps=None):
+    """
+    Run state handlers until one of them returns EXIT.
+
+    Each handler takes the shared context dict and returns the name of the
+    next state.
+
+    Args:
+        states (dict): State name to handler function
+        start (str): The initial state
+        context (dict, optional): State shared between handlers
+        max_steps (int, optional): Stop after this many steps, e.g. in tests
+
+    Returns:
+        list: The states visited, in order
+    """
+    context = {} if context is None else context
+    history = []
+    state = start
+    while state != EXIT and (max_steps is None or len(history) < max_steps):
+        history.append(state)
+        with span(f"menu.{state}"):
+            state = states[state](context)
+    return history
@@ -0,0 +1,305 @@
+"""
+Output index module.
+
+This module keeps a local SQLite index of every file written to the Images
+and Audio directories, with the parameters that produced it, its size, its
+generation latency and a content hash, so outputs can be queried without
+scanning the directories.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from tracing import traced
+
+INDEX_DB_PATH = "outputs_index.db"
+OUTPUT_DIRS = {"Images": "image", "Audio": "audio"}
+
+# Parameters promoted to their own columns so they can be filtered efficiently
+_COLUMNS = ["model", "prompt", "voice", "seed", "guidance", "steps", "width", "height", "format"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    model TEXT,
+    prompt TEXT,
+    voice TEXT,
+    seed INTEGER,
+    guidance REAL,
+    steps INTEGER,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    bytes INTEGER,
+    latency REAL,
+    sha256 TEXT,
+    mtime REAL,
+    created_at REAL,
+    params TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outputs_kind_model ON outputs (kind, model);
+CREATE INDEX IF NOT EXISTS idx_outputs_voice ON outputs (voice);
+CREATE INDEX IF NOT EXISTS idx_outputs_sha256 ON outputs (sha256);
+"""
+
+# Absolute paths of the databases whose schema this process already created
+_initialized = set()
+_initialized_lock = threading.Lock()
+
+def _connect(db_path=None):
+    """
+    Open the index database, creating the schema on the first connection of the process.
+
+    Args:
+        db_path (str, optional): Path to the database, defaults to INDEX_DB_PATH
+
+    Returns:
+        sqlite3.Connection: The open connection, to be closed by the caller
+    """
+    db_path = os.path.abspath(db_path or INDEX_DB_PATH)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if db_path not in _initialized:
+        with _initialized_lock:
+            if db_path not in _initialized:
+                # WAL mode is stored in the database file, so it only needs setting once
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _initialized.add(db_path)
+    return conn
+
+def _file_sha256(path):
+    """
+    Hash a file in chunks.
+
+    Args:
+        path (str): The file to hash
+
+    Returns:
+        str: The hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _build_row(path, kind, params, latency, sha256, stat):
+    """
+    Build the index row for a file.
+
+    Args:
+        path (str): Path of the file
+        kind (str): "image" or "audio"
+        params (dict): The generation parameters
+        latency (float or None): Generation latency in seconds
+        sha256 (str): Hex digest of the file content
+        stat (os.stat_result): The file's stat result
+
+    Returns:
+        dict: Column values for the outputs table
+    """
+    row = {
+        "path": os.path.normpath(path),
+        "kind": kind,
+        "bytes": stat.st_size,
+        "latency": latency,
+        "sha256": sha256,
+        "mtime": stat.st_mtime,
+        "created_at": time.time(),
+        "params": json.dumps(params, default=str),
+    }
+    for column in _COLUMNS:
+        row[column] = params.get(column)
+    return row
+
+def _upsert(conn, row):
+    """
+    Insert or replace an index row.
+
+    Args:
+        conn (sqlite3.Connection): The open index connection
+        row (dict): Column values for the outputs table
+    """
+    conn.execute(
+        f"INSERT OR REPLACE INTO outputs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+        list(row.values())
+    )
+
+@traced("index.record")
+def record_output(path, kind, params=None, latency=None, content=None, sha256=None, db_path=None):
+    """
+    Record a generated file in the index, replacing any previous entry for the path.
+
+    Args:
+        path (str): Path of the written file
+        kind (str): "image" or "audio"
+        params (dict, optional): The generation parameters (model, prompt or text, voice, seed, ...)
+        latency (float, optional): Generation latency in seconds
+        content (bytes, optional): The file content, to avoid re-reading the file for hashing
+        sha256 (str, optional): Digest computed while the file was written, to avoid hashing again
+        db_path (str, optional): Path to the index database
+
+    Returns:
+        bool: True if the file was recorded, False otherwise
+    """
+    params = dict(params or {})
+    if "text" in params and "prompt" not in params:
+        params["prompt"] = params["text"]
+    if "output_format" in params and "format" not in params:
+        params["format"] = params["output_format"]
+    try:
+        stat = os.stat(path)
+        if sha256 is None:
+            sha256 = hashlib.sha256(content).hexdigest() if content is not None else _file_sha256(path)
+        conn = _connect(db_path)
+        try:
+            with conn:
+                _upsert(conn, _build_row(path, kind, params, latency, sha256, stat))
+        finally:
+            conn.close()
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not index {path}: {e}")
+        return False
+
+def find_outputs(kind=None, model=None, voice=None, min_guidance=None, max_guidance=None,
+                 prompt=None, limit=None, db_path=None):
+    """
+    Query the index.
+
+    Args:
+        kind (str, optional): "image" or "audio"
+        model (str, optional): Substring of the model name, e.g. "schnell"
+        voice (str, optional): Exact voice name
+        min_guidance (float, optional): Only outputs with guidance greater than this
+        max_guidance (float, optional): Only outputs with guidance less than this
+        prompt (str, optional): Substring of the prompt or text
+        limit (int, optional): Maximum number of results
+        db_path (str, optional): Path to the index database
+
+    Returns:
+        list: Matching outputs as dictionaries, newest first
+    """
+    clauses, args = [], []
+    if kind:
+        clauses.append("kind = ?")
+        args.append(kind)
+    if model:
+        clauses.append("model LIKE ?")
+        args.append(f"%{model}%")
+    if voice:
+        clauses.append("voice = ?")
+        args.append(voice)
+    if min_guidance is not None:
+        clauses.append("guidance > ?")
+        args.append(min_guidance)
+    if max_guidance is not None:
+        clauses.append("guidance < ?")
+        args.append(max_guidance)
+    if prompt:
+        clauses.append("prompt LIKE ?")
+        args.append(f"%{prompt}%")
+
+    query = "SELECT * FROM outputs"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY created_at DESC"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(query, args).fetchall()
+    finally:
+        conn.close()
+    results = []
+    for row in rows:
+        result = dict(row)
+        result["params"] = json.loads(result["params"] or "{}")
+        results.append(result)
+    return results
+
+def reindex(directories=None, db_path=None):
+    """
+    Bring the index up to date with the files on disk.
+
+    Only files that are new or whose size or modification time changed are
+    re-hashed. Files that were already indexed keep their parameters, and
+    entries for files that no longer exist are removed.
+
+    Args:
+        directories (dict, optional): Directory to kind mapping, defaults to Images and Audio
+        db_path (str, optional): Path to the index database
+
+    Returns:
+        dict: Number of files added, updated, unchanged and removed
+    """
+    directories = directories or OUTPUT_DIRS
+    stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+
+    conn = _connect(db_path)
+    try:
+        with conn:
+            known = {row["path"]: row for row in conn.execute("SELECT * FROM outputs")}
+            seen = set()
+
+            for directory, kind in directories.items():
+                if not os.path.isdir(directory):
+                    continue
+                for name in sorted(os.listdir(directory)):
+                    path = os.path.normpath(os.path.join(directory, name))
+                    if not os.path.isfile(path) or name.startswith(".") or name.endswith((".part", ".tmp")):
+                        continue
+                    seen.add(path)
+                    stat = os.stat(path)
+                    existing = known.get(path)
+                    if existing and existing["bytes"] == stat.st_size and existing["mtime"] == stat.st_mtime:
+                        stats["unchanged"] += 1
+                        continue
+
+                    params = json.loads(existing["params"]) if existing else {"format": os.path.splitext(name)[1].lstrip(".")}
+                    row = _build_row(path, existing["kind"] if existing else kind, params,
+                                     existing["latency"] if existing else None, _file_sha256(path), stat)
+                    if existing:
+                        row["created_at"] = existing["created_at"]
+                    _upsert(conn, row)
+                    stats["updated" if existing else "added"] += 1
+
+            for path in set(known) - seen:
+                if not os.path.exists(path):
+                    conn.execute("DELETE FROM outputs WHERE path = ?", (path,))
+                    stats["removed"] += 1
+    finally:
+        conn.close()
+
+    print(f"Index updated: {stats['added']} added, {stats['updated']} updated, "
+          f"{stats['unchanged']} unchanged, {stats['removed']} removed")
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain and query the index of generated outputs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("reindex", help="Index new or changed files in Images/ and Audio/")
+    query_parser = subparsers.add_parser("query", help="List indexed outputs as JSON lines")
+    query_parser.add_argument("--kind", choices=["image", "audio"])
+    query_parser.add_argument("--model", help="Substring of the model name")
+    query_parser.add_argument("--voice")
+    query_parser.add_argument("--min-guidance", type=float)
+    query_parser.add_argument("--max-guidance", type=float)
+    query_parser.add_argument("--prompt", help="Substring of the prompt or text")
+    query_parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if args.command == "reindex":
+        reindex()
+    else:
+        for output in find_outputs(args.kind, args.model, args.voice, args.min_guidance,
+                                   args.max_guidance, args.prompt, args.limit):
+            print(json.dumps(output))
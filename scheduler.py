@@ -0,0 +1,313 @@
+"""
+Scheduler module.
+
+This module decides which provider call runs next when more calls are
+waiting than the process allows at once. Calls belong to a priority class
+(interactive, normal or bulk); waiting calls are served by weighted fair
+queuing between the classes, and part of the capacity is reserved for
+interactive calls so background batches can never take every slot.
+
+The priority of the calls made by a piece of code is set with the
+priority() context manager and travels with the current context. Threads
+wait with acquire() and asyncio tasks with acquire_async(); both share the
+same queues.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from key_pool import get_key_pool, KEY_ENV_VARS
+
+INTERACTIVE = "interactive"
+NORMAL = "normal"
+BULK = "bulk"
+
+# Share of the capacity each class gets while all of them have calls waiting
+CLASS_WEIGHTS = {INTERACTIVE: 8, NORMAL: 3, BULK: 1}
+
+# Provider calls in flight at once per API key of the largest key pool, about what
+# a Together AI or OpenAI key serves concurrently before answering with 429s; the
+# PROVIDER_CONCURRENCY environment variable overrides it. A batch at its default
+# concurrency next to a long-form synthesis fills it, so the class weights and the
+# interactive reserve decide who goes next
+SCHEDULER_CAPACITY = 8
+# Slots per API key only interactive calls may use
+RESERVED_INTERACTIVE = 2
+WAIT_SAMPLES = 1000
+
+_priority = contextvars.ContextVar("provider_priority", default=NORMAL)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+class _Ticket:
+    """
+    A call waiting for a slot, and how to wake it once the slot is granted.
+    """
+
+    def __init__(self, cls, wake):
+        self.cls = cls
+        self.wake = wake
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+def _resolve(future):
+    """
+    Complete a waiting future unless its task was cancelled meanwhile.
+    """
+    if not future.done():
+        future.set_result(None)
+
+class Scheduler:
+    """
+    Admits provider calls by priority class with weighted fair queuing.
+
+    Each class has a FIFO queue and a virtual time that advances by
+    1 / weight every time one of its calls is admitted; the waiting class
+    with the lowest virtual time goes next. Non-interactive classes may only
+    use capacity - reserved_interactive slots. Slots are granted to the
+    waiting tickets by whoever changes the load, so threads and event loops
+    can wait side by side.
+    """
+
+    def __init__(self, capacity=SCHEDULER_CAPACITY, reserved_interactive=RESERVED_INTERACTIVE,
+                 weights=None):
+        self.capacity = capacity
+        self.reserved_interactive = min(reserved_interactive, capacity - 1)
+        self.weights = dict(weights or CLASS_WEIGHTS)
+        self._lock = threading.Lock()
+        self._queues = {cls: deque() for cls in self.weights}
+        self._vtime = {cls: 0.0 for cls in self.weights}
+        self._clock = 0.0
+        self._in_flight = {cls: 0 for cls in self.weights}
+        self._admitted = {cls: 0 for cls in self.weights}
+        self._waits = {cls: deque(maxlen=WAIT_SAMPLES) for cls in self.weights}
+
+    def _next_ticket(self):
+        """
+        Get the ticket that may be admitted now, if any. Must be called with the lock held.
+        """
+        total = sum(self._in_flight.values())
+        if total >= self.capacity:
+            return None
+        shared_full = total >= self.capacity - self.reserved_interactive
+        eligible = [cls for cls, queue in self._queues.items()
+                    if queue and (cls == INTERACTIVE or not shared_full)]
+        if not eligible:
+            return None
+        cls = min(eligible, key=lambda name: self._vtime[name])
+        return self._queues[cls][0]
+
+    def _grant(self):
+        """
+        Admit waiting tickets while slots are free. Must be called with the lock held.
+        """
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            cls = ticket.cls
+            self._queues[cls].popleft()
+            self._clock = self._vtime[cls]
+            self._vtime[cls] += 1.0 / self.weights[cls]
+            self._in_flight[cls] += 1
+            self._admitted[cls] += 1
+            self._waits[cls].append(time.monotonic() - ticket.enqueued)
+            ticket.granted = True
+            ticket.wake()
+
+    def _enqueue(self, cls, wake):
+        """
+        Queue a ticket for a priority class and admit what can run.
+
+        Returns:
+            _Ticket: The queued ticket
+        """
+        cls = cls or current_priority()
+        if cls not in self._queues:
+            raise ValueError(f"Unknown priority class '{cls}'. Choose one of: {', '.join(self.weights)}")
+        ticket = _Ticket(cls, wake)
+        with self._lock:
+            if not self._queues[cls]:
+                # A class that was idle rejoins at the current virtual time instead of bursting
+                self._vtime[cls] = max(self._vtime[cls], self._clock)
+            self._queues[cls].append(ticket)
+            self._grant()
+        return ticket
+
+    def acquire(self, cls=None):
+        """
+        Wait until a call of a priority class may run.
+
+        Args:
+            cls (str, optional): The priority class, defaults to the current priority
+
+        Returns:
+            str: The priority class the slot was admitted under, to pass to release()
+        """
+        granted = threading.Event()
+        ticket = self._enqueue(cls, granted.set)
+        granted.wait()
+        return ticket.cls
+
+    async def acquire_async(self, cls=None):
+        """
+        Wait in an event loop until a call of a priority class may run.
+
+        Args:
+            cls (str, optional): The priority class, defaults to the current priority
+
+        Returns:
+            str: The priority class the slot was admitted under, to pass to release()
+        """
+        # asyncio is imported here so threaded callers do not pay for it at startup
+        import asyncio
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticket = self._enqueue(cls, lambda: loop.call_soon_threadsafe(_resolve, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if ticket.granted:
+                    self._in_flight[ticket.cls] -= 1
+                    self._grant()
+                else:
+                    self._queues[ticket.cls].remove(ticket)
+                    self._grant()
+            raise
+        return ticket.cls
+
+    def release(self, cls):
+        """
+        Give back a slot admitted by acquire() or acquire_async().
+
+        Args:
+            cls (str): The priority class returned by acquire()
+        """
+        with self._lock:
+            self._in_flight[cls] -= 1
+            self._grant()
+
+    @contextmanager
+    def slot(self, cls=None):
+        """
+        Hold a slot for the duration of a with block.
+
+        Args:
+            cls (str, optional): The priority class, defaults to the current priority
+        """
+        cls = self.acquire(cls)
+        try:
+            yield cls
+        finally:
+            self.release(cls)
+
+    def stats(self):
+        """
+        Report queue latency and load for each priority class.
+
+        Returns:
+            dict: Per class, the calls waiting and in flight, the calls admitted and the
+                p50, p95 and max queue wait in milliseconds over the recent calls
+        """
+        with self._lock:
+            report = {}
+            for cls in self.weights:
+                waits = sorted(self._waits[cls])
+                report[cls] = {
+                    "waiting": len(self._queues[cls]),
+                    "in_flight": self._in_flight[cls],
+                    "admitted": self._admitted[cls],
+                    "wait_p50_ms": _percentile(waits, 0.50),
+                    "wait_p95_ms": _percentile(waits, 0.95),
+                    "wait_max_ms": round(waits[-1] * 1000, 1) if waits else None,
+                }
+            return report
+
+def _percentile(sorted_values, fraction):
+    """
+    Get a percentile of sorted durations in milliseconds.
+
+    Args:
+        sorted_values (list): Durations in seconds, sorted
+        fraction (float): The percentile as a fraction, e.g. 0.95
+
+    Returns:
+        float or None: The percentile in milliseconds, or None without samples
+    """
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 1)
+
+def get_scheduler():
+    """
+    Get the scheduler shared by all provider calls in this process.
+
+    The capacity and the interactive reserve grow with the number of API keys,
+    since each key brings its own quota.
+
+    Returns:
+        Scheduler: The shared scheduler
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                keys = max(1, max(len(get_key_pool(service)) for service in KEY_ENV_VARS))
+                _scheduler = Scheduler(capacity=per_key_capacity() * keys,
+                                       reserved_interactive=RESERVED_INTERACTIVE * keys)
+    return _scheduler
+
+def per_key_capacity():
+    """
+    Get how many provider calls may be in flight at once per API key.
+
+    Returns:
+        int: The PROVIDER_CONCURRENCY environment variable, or SCHEDULER_CAPACITY if it is not set
+    """
+    return int(os.environ.get("PROVIDER_CONCURRENCY", SCHEDULER_CAPACITY))
+
+def current_priority():
+    """
+    Get the priority class of provider calls made from the current context.
+
+    Returns:
+        str: INTERACTIVE, NORMAL or BULK
+    """
+    return _priority.get()
+
+@contextmanager
+def priority(cls):
+    """
+    Run a block with its provider calls in a priority class.
+
+    Args:
+        cls (str): INTERACTIVE, NORMAL or BULK
+    """
+    if cls not in CLASS_WEIGHTS:
+        raise ValueError(f"Unknown priority class '{cls}'. Choose one of: {', '.join(CLASS_WEIGHTS)}")
+    token = _priority.set(cls)
+    try:
+        yield cls
+    finally:
+        _priority.reset(token)
+
+def submit_with_context(executor, func, *args, **kwargs):
+    """
+    Submit work to an executor so it runs with the caller's priority and other context.
+
+    Args:
+        executor (concurrent.futures.Executor): A thread pool
+        func (callable): The function to run
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        Future: The submitted work
+    """
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
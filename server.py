@@ -0,0 +1,465 @@
+"""
+HTTP service mode.
+
+This module serves the multi-agent system, chat completions, image generation
+and speech synthesis as JSON endpoints from one long-running process, so the
+imports, key checks and upstream connections are paid for once instead of on
+every request. Blocking work runs on a bounded thread pool that shares the
+pooled HTTP session, and chat, agent and audio responses can be streamed.
+
+Endpoints:
+    GET  /health    Liveness and load
+    GET  /models    The famous models, optionally filtered by ?category=chat|image|audio
+    POST /chat      {"prompt" or "messages", "provider", "model", "system", "stream"}
+    POST /agents    {"request", "provider", "model", "api", "stream"}
+    POST /images    {"prompt", "model", "width", "height", "steps", "n", ...}
+    POST /audio     {"text", "model", "voice", "format", "normalize", "stream"}
+    POST /jobs      {"kind": "image"|"audio"|"agents"|"multimodal", "payload", "max_attempts"}, processed by
+                    job_queue workers
+    GET  /jobs/{id} The state and result of a queued job
+
+Every request body may set "priority" to interactive, normal or bulk for
+its provider calls; chat and audio default to interactive, the rest to
+normal. /health reports the queue latency of each priority class and the
+requests, errors and remaining quota of each pooled API key. Concurrent
+identical non-streamed requests share one upstream call, and /health counts
+how many did.
+
+Streaming responses are newline-delimited JSON, except streamed audio which
+is sent as raw audio bytes while it is being synthesized.
+
+Usage:
+    python server.py [--host 127.0.0.1] [--port 8080] [--workers 8]
+
+Developed by Blackbeard (https://blackbeard.one | https://tentitanics.com | https://github.com/blackbeardONE)
+© 2023-2024 Blackbeard. All rights reserved.
+"""
+
+import json
+import asyncio
+import threading
+import functools
+import importlib
+import contextvars
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from models_config import FAMOUS_MODELS, AUDIO_FORMATS
+from api_utils import get_session, prewarm_connections, PREWARM_HOSTS
+from scheduler import get_scheduler, priority, CLASS_WEIGHTS, INTERACTIVE, NORMAL
+from key_pool import key_pool_stats
+from coalesce import coalesce_stats
+import job_queue
+from handlers import (chat_completion, stream_chat_completion, run_agents, generate_images,
+                      image_params, audio_params, generate_speech)
+
+SERVER_WORKERS = 8
+MAX_QUEUED_REQUESTS = 64
+
+MODEL_CATEGORIES = {"chat": "Chat Models", "image": "Image Models", "audio": "Audio Models"}
+
+AUDIO_CONTENT_TYPES = {"mp3": "audio/mpeg", "wav": "audio/wav", "wav_ulaw": "audio/wav"}
+
+# Chunks a streaming worker may get ahead of its client before its writes block
+SINK_MAX_CHUNKS = 64
+# Seconds between checks for a disconnected client while a write waits for room
+SINK_POLL_INTERVAL = 0.1
+
+class _QueueSink:
+    """
+    File-like object that hands chunks written from a worker thread to the event loop.
+
+    At most max_chunks chunks are buffered: a write waits while the client is
+    that far behind, and raises BrokenPipeError once the sink was cancelled
+    because the client went away, so the worker stops producing.
+    """
+
+    def __init__(self, loop, max_chunks=SINK_MAX_CHUNKS):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.cancelled = threading.Event()
+        self._room = threading.Semaphore(max_chunks)
+
+    def write(self, data):
+        while not self._room.acquire(timeout=SINK_POLL_INTERVAL):
+            if self.cancelled.is_set():
+                break
+        if self.cancelled.is_set():
+            raise BrokenPipeError("The client disconnected")
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, bytes(data))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.cancelled.is_set():
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def cancel(self):
+        """
+        Make the worker's next write fail, once the client is gone.
+        """
+        self.cancelled.set()
+
+    async def get(self):
+        """
+        Wait for the next chunk, or None once the worker closed the sink.
+        """
+        chunk = await self.queue.get()
+        if chunk is not None:
+            self._room.release()
+        return chunk
+
+    def write_event(self, event):
+        self.write((json.dumps(event, default=str) + "\n").encode("utf-8"))
+
+class BusyError(Exception):
+    """Raised when more requests are waiting than the server accepts."""
+
+async def admit(app):
+    """
+    Wait for a worker slot; the caller must pass it to _run_admitted or _release it.
+
+    Args:
+        app (web.Application): The application
+
+    Raises:
+        BusyError: If too many requests are already waiting for a worker
+    """
+    if app["waiting"] >= app["max_queue"]:
+        raise BusyError("Too many requests are waiting; try again later")
+    app["waiting"] += 1
+    try:
+        await app["limiter"].acquire()
+    finally:
+        app["waiting"] -= 1
+    app["active"] += 1
+
+def _release(app):
+    """
+    Give back a worker slot taken with admit.
+    """
+    app["active"] -= 1
+    app["limiter"].release()
+
+async def _run_admitted(app, func, *args, **kwargs):
+    """
+    Run a blocking function on the worker pool in a slot taken with admit.
+
+    The slot is held until the worker returns, even if the awaiting request is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    # The worker runs with the caller's context so it keeps the request priority
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    try:
+        future = loop.run_in_executor(app["executor"], call)
+    except BaseException:
+        _release(app)
+        raise
+    future.add_done_callback(lambda _: _release(app))
+    return await asyncio.shield(future)
+
+async def run_blocking(app, func, *args, **kwargs):
+    """
+    Run a blocking function on the worker pool, bounded by the concurrency limit.
+
+    Args:
+        app (web.Application): The application
+        func (callable): The function to run
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        The function's result
+
+    Raises:
+        BusyError: If too many requests are already waiting for a worker
+    """
+    await admit(app)
+    return await _run_admitted(app, func, *args, **kwargs)
+
+async def stream_blocking(request, func, content_type="application/x-ndjson"):
+    """
+    Run a blocking function that writes to a sink and stream what it writes to the client.
+
+    Headers are only sent once a worker slot is free, so a busy server still
+    answers with a 503 JSON error. The worker can only get SINK_MAX_CHUNKS
+    chunks ahead of the client. If the client disconnects, the sink is
+    cancelled so the worker's next write fails, and the worker frees its slot
+    once it returns.
+
+    Args:
+        request (web.Request): The request being answered
+        func (callable): Called with a _QueueSink; it must not close the sink itself
+        content_type (str): Content type of the streamed body
+
+    Returns:
+        web.StreamResponse: The finished response
+    """
+    sink = _QueueSink(asyncio.get_running_loop())
+
+    def produce():
+        try:
+            func(sink)
+        except (Exception, SystemExit) as e:
+            if content_type == "application/x-ndjson" and not sink.cancelled.is_set():
+                sink.write_event({"event": "error", "error": str(e) or type(e).__name__})
+        finally:
+            sink.close()
+
+    await admit(request.app)
+    response = web.StreamResponse(headers={"Content-Type": content_type})
+    try:
+        await response.prepare(request)
+    except BaseException:
+        _release(request.app)
+        raise
+    task = asyncio.ensure_future(_run_admitted(request.app, produce))
+    try:
+        while True:
+            chunk = await sink.get()
+            if chunk is None:
+                break
+            await response.write(chunk)
+        await task
+    except ConnectionResetError:
+        return response
+    finally:
+        # Stops the worker if the client went away or the request was cancelled
+        sink.cancel()
+        task.cancel()
+    await response.write_eof()
+    return response
+
+def json_error(status, message):
+    """
+    Build a JSON error response.
+
+    Args:
+        status (int): The HTTP status
+        message (str): The error message
+
+    Returns:
+        web.Response: The response
+    """
+    return web.json_response({"ok": False, "error": message}, status=status)
+
+async def read_json(request, required=()):
+    """
+    Read the JSON body of a request and check required fields.
+
+    Args:
+        request (web.Request): The request
+        required (tuple): Field names that must be present and non-empty
+
+    Returns:
+        dict: The body
+
+    Raises:
+        ValueError: If the body is not a JSON object or a field is missing (answered with a 400)
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ValueError("Body must be JSON")
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object")
+    missing = [field for field in required if not body.get(field)]
+    if missing:
+        raise ValueError(f"Missing field(s): {', '.join(missing)}")
+    return body
+
+def request_priority(body, default):
+    """
+    Get the priority class requested in a body.
+
+    Args:
+        body (dict): The request body
+        default (str): The class used when the body does not set one
+
+    Returns:
+        str: INTERACTIVE, NORMAL or BULK
+
+    Raises:
+        ValueError: If the body names an unknown class (answered with a 400)
+    """
+    cls = body.get("priority") or default
+    if cls not in CLASS_WEIGHTS:
+        raise ValueError(f"Unknown priority '{cls}'. Choose one of: {', '.join(CLASS_WEIGHTS)}")
+    return cls
+
+async def handle_health(request):
+    """
+    Report liveness, the number of active and waiting requests, the queue latency per priority class,
+    the load of each API key and the requests that shared an upstream call.
+    """
+    app = request.app
+    return web.json_response({"ok": True, "active": app["active"], "waiting": app["waiting"],
+                              "workers": app["workers"], "scheduler": get_scheduler().stats(),
+                              "keys": key_pool_stats(), "coalesced": coalesce_stats()})
+
+async def handle_models(request):
+    """
+    List the famous models, optionally filtered by category.
+    """
+    category = request.query.get("category")
+    if category and category not in MODEL_CATEGORIES:
+        return json_error(400, f"Unknown category '{category}'")
+    categories = [MODEL_CATEGORIES[category]] if category else list(FAMOUS_MODELS)
+    return web.json_response([dict(model, category=name) for name in categories for model in FAMOUS_MODELS[name]])
+
+async def handle_chat(request):
+    """
+    Answer a chat prompt, streaming delta events when "stream" is set.
+    """
+    body = await read_json(request)
+    if not body.get("prompt") and not body.get("messages"):
+        return json_error(400, "Missing field(s): prompt or messages")
+    with priority(request_priority(body, INTERACTIVE)):
+        if body.get("stream"):
+            return await stream_blocking(request, functools.partial(stream_chat_completion, body))
+        return web.json_response(await run_blocking(request.app, chat_completion, body))
+
+async def handle_agents(request):
+    """
+    Run the multi-agent system, streaming each step when "stream" is set.
+    """
+    body = await read_json(request, ("request",))
+    with priority(request_priority(body, NORMAL)):
+        if body.get("stream"):
+            return await stream_blocking(request, lambda sink: run_agents(body, sink))
+        return web.json_response(await run_blocking(request.app, run_agents, body))
+
+async def handle_images(request):
+    """
+    Generate images and return the saved files.
+    """
+    body = await read_json(request, ("prompt",))
+    with priority(request_priority(body, NORMAL)):
+        result = await run_blocking(request.app, generate_images, body)
+    return web.json_response(result, status=200 if result["ok"] else 502)
+
+async def handle_audio(request):
+    """
+    Synthesize speech, streaming the audio bytes when "stream" is set.
+    """
+    body = await read_json(request, ("text",))
+    params = audio_params(body)
+    with priority(request_priority(body, INTERACTIVE)):
+        if body.get("stream"):
+            if not AUDIO_FORMATS[params["format"]]["playable"]:
+                return json_error(400, f"Streaming is not available for {params['format']}")
+            body["output"] = params["output_file"]
+            content_type = AUDIO_CONTENT_TYPES.get(params["format"], "application/octet-stream")
+            return await stream_blocking(request, lambda sink: generate_speech(body, SimpleNamespace(stdin=sink)),
+                                         content_type=content_type)
+        result = await run_blocking(request.app, generate_speech, body)
+    return web.json_response(result, status=200 if result["ok"] else 502)
+
+async def handle_submit_job(request):
+    """
+    Queue a long-running job for the queue workers and return its id at once.
+    """
+    body = await read_json(request, ("kind", "payload"))
+    # File names and reference images are checked now, so a bad payload gets a 400 instead of a dead job
+    validate = {"image": image_params, "audio": audio_params}.get(body["kind"])
+    if validate is not None:
+        validate(body["payload"])
+    loop = asyncio.get_running_loop()
+    job_id = await loop.run_in_executor(None, functools.partial(
+        job_queue.enqueue, body["kind"], body["payload"], body.get("max_attempts", job_queue.MAX_ATTEMPTS)))
+    return web.json_response({"ok": True, "id": job_id}, status=202)
+
+async def handle_job_status(request):
+    """
+    Report the state, attempts and result of a queued job.
+    """
+    job = await asyncio.get_running_loop().run_in_executor(None, job_queue.status, request.match_info["job_id"])
+    if job is None:
+        return json_error(404, "Unknown job")
+    return web.json_response(job)
+
+@web.middleware
+async def error_middleware(request, handler):
+    """
+    Turn exceptions from handlers into JSON error responses.
+    """
+    try:
+        return await handler(request)
+    except web.HTTPException:
+        raise
+    except BusyError as e:
+        return json_error(503, str(e))
+    except (ValueError, KeyError) as e:
+        return json_error(400, str(e))
+    except (Exception, SystemExit) as e:
+        return json_error(500, str(e) or type(e).__name__)
+
+async def _preload(app):
+    """
+    Import the feature modules, create the shared session and open connections to every
+    provider host before serving requests.
+    """
+    def load():
+        get_session()
+        warming = prewarm_connections([host for hosts in PREWARM_HOSTS.values() for host in hosts])
+        # Imported only so the first requests do not pay for it
+        importlib.import_module("image_gen")
+        importlib.import_module("audio_gen")
+        try:
+            importlib.import_module("agent_system_direct")
+        except ImportError as e:
+            print(f"⚠️ Agents and chat defaults unavailable: {e}")
+        for thread in warming:
+            thread.join()
+    await asyncio.get_running_loop().run_in_executor(app["executor"], load)
+
+async def _shutdown(app):
+    """
+    Stop the worker pool.
+    """
+    app["executor"].shutdown(wait=False)
+
+def create_app(workers=SERVER_WORKERS, max_queue=MAX_QUEUED_REQUESTS):
+    """
+    Create the HTTP application.
+
+    Args:
+        workers (int): Number of requests processed at the same time
+        max_queue (int): Number of requests allowed to wait for a worker before 503s are returned
+
+    Returns:
+        web.Application: The application
+    """
+    app = web.Application(middlewares=[error_middleware])
+    app["workers"] = workers
+    app["max_queue"] = max_queue
+    app["executor"] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="server-worker")
+    app["limiter"] = asyncio.Semaphore(workers)
+    app["active"] = 0
+    app["waiting"] = 0
+    app.on_startup.append(_preload)
+    app.on_cleanup.append(_shutdown)
+    app.add_routes([
+        web.get("/health", handle_health),
+        web.get("/models", handle_models),
+        web.post("/chat", handle_chat),
+        web.post("/agents", handle_agents),
+        web.post("/images", handle_images),
+        web.post("/audio", handle_audio),
+        web.post("/jobs", handle_submit_job),
+        web.get("/jobs/{job_id}", handle_job_status),
+    ])
+    return app
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve agents, chat, image and audio generation over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Requests processed at the same time")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUED_REQUESTS,
+                        help="Requests allowed to wait for a worker before 503s are returned")
+    args = parser.parse_args()
+    web.run_app(create_app(args.workers, args.max_queue), host=args.host, port=args.port)
@@ -0,0 +1,66 @@
+"""
+Test script for batch checkpoints.
+"""
+
+import os
+import tempfile
+
+from batch_jobs import Checkpoint, run_batch, DONE, FAILED, IN_FLIGHT, PENDING
+
+ITEMS = [{"id": f"item-{i}"} for i in range(5)]
+
+def test_resume_skips_completed_items():
+    """
+    A second run only processes the items the first run did not complete.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "batch.checkpoint.json")
+        seen = []
+
+        def flaky(item):
+            seen.append(item["id"])
+            return item["id"] != "item-3", {"outputs": [item["id"]]}
+
+        checkpoint = run_batch(ITEMS, flaky, path, concurrency=2)
+        assert checkpoint.counts()[DONE] == 4 and checkpoint.counts()[FAILED] == 1
+
+        seen.clear()
+        checkpoint = run_batch(ITEMS, flaky, path, concurrency=2)
+        assert seen == []
+
+        checkpoint = run_batch(ITEMS, lambda item: (seen.append(item["id"]) or True, {}), path, retry_failed=True)
+        assert seen == ["item-3"]
+        assert checkpoint.counts()[DONE] == 5
+        assert checkpoint.items["item-3"]["attempts"] == 2
+        assert os.path.getsize(path + ".journal") == 0
+
+def test_journal_replayed_after_crash():
+    """
+    State changes journaled before a crash survive, in-flight items are retried and a torn line is ignored.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "batch.checkpoint.json")
+        checkpoint = Checkpoint(path, ITEMS)
+        checkpoint.mark("item-0", DONE, outputs=["a.png"])
+        checkpoint.mark("item-1", IN_FLIGHT)
+        checkpoint._journal.write('{"id": "item-2", "ent')
+        checkpoint._journal.flush()
+
+        resumed = Checkpoint(path, ITEMS)
+        assert resumed.state("item-0") == DONE
+        assert resumed.items["item-0"]["outputs"] == ["a.png"]
+        assert resumed.state("item-1") == PENDING
+        assert resumed.items["item-1"]["attempts"] == 1
+        assert resumed.state("item-2") == PENDING
+        resumed.close()
+
+def main():
+    """
+    Main function to test batch checkpoints.
+    """
+    for test in (test_resume_skips_completed_items, test_journal_replayed_after_crash):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Test script for request coalescing.
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from coalesce import SingleFlight, coalesce, single_flight
+
+CALLERS = 8
+
+def _run_together(group, key, func):
+    """
+    Call group.do from several threads once the first caller is inside func.
+
+    Returns:
+        list: Each caller's result, or the exception it received
+    """
+    entered = threading.Event()
+    release = threading.Event()
+
+    def upstream():
+        entered.set()
+        release.wait(5)
+        return func()
+
+    def caller(_):
+        try:
+            return group.do(key, upstream)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        leader = executor.submit(caller, 0)
+        entered.wait(5)
+        followers = [executor.submit(caller, i) for i in range(1, CALLERS)]
+        while group.stats()["calls"] < CALLERS:
+            time.sleep(0.001)
+        release.set()
+        return [leader.result()] + [future.result() for future in followers]
+
+def test_concurrent_callers_share_one_result():
+    """
+    Identical concurrent calls run once and every caller gets the same result object.
+    """
+    group = SingleFlight("test")
+    runs = []
+    results = _run_together(group, "same", lambda: runs.append(1) or {"answer": 42})
+
+    assert len(runs) == 1
+    assert all(result is results[0] for result in results)
+    assert group.stats() == {"calls": CALLERS, "upstream": 1, "coalesced": CALLERS - 1, "in_flight": 0}
+
+def test_exception_reaches_every_waiter():
+    """
+    When the shared run fails, every waiting caller receives its exception.
+    """
+    group = SingleFlight("test")
+
+    def failing():
+        raise RuntimeError("upstream failed")
+
+    results = _run_together(group, "same", failing)
+    assert len(results) == CALLERS
+    assert all(isinstance(result, RuntimeError) and str(result) == "upstream failed" for result in results)
+    assert group.stats()["in_flight"] == 0
+
+    # Nothing is kept once the call finished: the next call runs again
+    assert group.do("same", lambda: "fresh") == "fresh"
+    assert group.stats()["upstream"] == 2
+
+def test_decorator_keys_on_arguments():
+    """
+    The decorator only shares calls made with the same arguments.
+    """
+    runs = []
+
+    @coalesce("test-decorator")
+    def lookup(name, limit=10):
+        runs.append((name, limit))
+        return f"{name}:{limit}"
+
+    assert lookup("a") == "a:10"
+    assert lookup("a", limit=5) == "a:5"
+    assert lookup("b") == "b:10"
+    assert runs == [("a", 10), ("a", 5), ("b", 10)]
+    assert single_flight("test-decorator").stats()["coalesced"] == 0
+
+def main():
+    """
+    Main function to test request coalescing.
+    """
+    for test in (test_concurrent_callers_share_one_result, test_exception_reaches_every_waiter,
+                 test_decorator_keys_on_arguments):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
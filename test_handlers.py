@@ -0,0 +1,63 @@
+"""
+Test script for the request handlers.
+"""
+
+import os
+
+import image_gen
+from handlers import generate_images, image_params, audio_params
+
+def _fake_generate_image(calls):
+    """
+    Stand in for image_gen.generate_image, recording its arguments instead of calling the provider.
+    """
+    def generate_image(**kwargs):
+        calls.append(kwargs)
+        return False
+    return generate_image
+
+def test_save_path_stays_inside_images():
+    """
+    A save_path with directories is reduced to its file name, and one naming no file is rejected.
+    """
+    calls = []
+    original = image_gen.generate_image
+    image_gen.generate_image = _fake_generate_image(calls)
+    try:
+        generate_images({"prompt": "A lighthouse", "save_path": "../../etc/lighthouse"})
+    finally:
+        image_gen.generate_image = original
+    assert calls[0]["save_path"] == "lighthouse"
+    assert image_gen.image_file_path(calls[0]["save_path"], 0, 1, "jpeg") == os.path.join("Images", "lighthouse.jpeg")
+
+    for save_path in ("../", "..", "/tmp/", "."):
+        try:
+            image_params({"prompt": "A lighthouse", "save_path": save_path})
+        except ValueError:
+            continue
+        raise AssertionError(f"save_path {save_path!r} was accepted")
+    assert audio_params({"text": "Hi", "output": "../../welcome"})["output_file"] == "welcome.mp3"
+
+def test_reference_image_must_be_a_url():
+    """
+    Only http(s) reference images are accepted, so clients cannot have server files uploaded.
+    """
+    for reference_image in ("/etc/passwd", "../secret.png", "file:///etc/passwd"):
+        try:
+            image_params({"prompt": "A lighthouse", "reference_image": reference_image})
+        except ValueError:
+            continue
+        raise AssertionError(f"reference_image {reference_image!r} was accepted")
+    url = "https://example.com/depth.png"
+    assert image_params({"prompt": "A lighthouse", "reference_image": url})["reference_image"] == url
+
+def main():
+    """
+    Main function to test the request handlers.
+    """
+    for test in (test_save_path_stays_inside_images, test_reference_image_must_be_a_url):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
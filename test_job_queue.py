@@ -0,0 +1,92 @@
+"""
+Test script for the job queue.
+"""
+
+import os
+import time
+import tempfile
+
+import job_queue
+from job_queue import enqueue, claim, complete, fail, extend_visibility, status, RUNNING, DONE, DEAD, QUEUED
+
+def test_expired_job_is_reclaimed_then_dead_lettered():
+    """
+    A job whose worker stops extending it is claimed again, and dead-lettered after its last attempt.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "jobs.db")
+        job_id = enqueue("image", {"prompt": "A lighthouse"}, max_attempts=2, db_path=db_path)
+
+        job = claim("worker-1", visibility_timeout=0.2, db_path=db_path)
+        assert job["id"] == job_id and job["attempts"] == 1
+        assert claim("worker-2", visibility_timeout=0.2, db_path=db_path) is None
+
+        time.sleep(0.3)
+        job = claim("worker-2", visibility_timeout=0.2, db_path=db_path)
+        assert job["id"] == job_id and job["attempts"] == 2
+        # The first worker lost the job and can no longer record anything for it
+        assert not extend_visibility(job_id, "worker-1", db_path=db_path)
+        assert not complete(job_id, "worker-1", {"ok": True}, db_path=db_path)
+        assert status(job_id, db_path=db_path)["state"] == RUNNING
+
+        time.sleep(0.3)
+        assert claim("worker-3", visibility_timeout=0.2, db_path=db_path) is None
+        job = status(job_id, db_path=db_path)
+        assert job["state"] == DEAD
+        assert job["error"] == "visibility timeout expired"
+
+def test_failed_job_is_retried_until_max_attempts():
+    """
+    A failed attempt requeues the job until its last attempt dead-letters it.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "jobs.db")
+        job_id = enqueue("audio", {"text": "Hello"}, max_attempts=2, db_path=db_path)
+
+        claim("worker-1", db_path=db_path)
+        assert fail(job_id, "worker-1", "upstream 500", retry_delay=0, db_path=db_path) == QUEUED
+        claim("worker-1", db_path=db_path)
+        assert fail(job_id, "worker-1", "upstream 500", retry_delay=0, db_path=db_path) == DEAD
+        assert claim("worker-1", db_path=db_path) is None
+
+        other_id = enqueue("audio", {"text": "Bye"}, db_path=db_path)
+        claim("worker-1", db_path=db_path)
+        assert complete(other_id, "worker-1", {"ok": True}, db_path=db_path)
+        assert status(other_id, db_path=db_path)["state"] == DONE
+
+def test_schema_created_once_per_database():
+    """
+    Only the first connection to a database runs the schema script.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "jobs.db")
+        enqueue("image", {"prompt": "A lighthouse"}, db_path=db_path)
+        assert os.path.abspath(db_path) in job_queue._initialized
+        scripts = []
+        connect = job_queue.sqlite3.connect
+
+        class CountingConnection(job_queue.sqlite3.Connection):
+            def executescript(self, script):
+                scripts.append(script)
+                return super().executescript(script)
+
+        job_queue.sqlite3.connect = lambda *args, **kwargs: connect(*args, factory=CountingConnection, **kwargs)
+        try:
+            job = claim("worker-1", db_path=db_path)
+            extend_visibility(job["id"], "worker-1", db_path=db_path)
+            complete(job["id"], "worker-1", {"ok": True}, db_path=db_path)
+        finally:
+            job_queue.sqlite3.connect = connect
+        assert scripts == []
+
+def main():
+    """
+    Main function to test the job queue.
+    """
+    for test in (test_expired_job_is_reclaimed_then_dead_lettered, test_failed_job_is_retried_until_max_attempts,
+                 test_schema_created_once_per_database):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Test script for the key pool.
+"""
+
+import time
+
+import httpx
+
+import key_pool
+import scheduler as scheduler_module
+from key_pool import KeyPool, key_id
+from scheduler import Scheduler
+from llm_transport import ScheduledTransport
+
+def test_best_key_has_most_quota_left():
+    """
+    The next request goes to the key with the most remaining quota, then the fewest in flight.
+    """
+    pool = KeyPool("together", ["a", "b", "c"])
+    pool.release(pool.acquire(preferred="a"), 200, {"x-ratelimit-remaining-requests": "5"})
+    pool.release(pool.acquire(preferred="b"), 200, {"x-ratelimit-remaining": "20"})
+
+    # A key that never reported its quota counts as the best known one, and was used least recently
+    assert pool.best_key() == "c"
+    assert pool.acquire() == "c"
+    assert pool.acquire() == "b"
+    assert pool.acquire(exclude={"b", "c"}) == "a"
+    assert pool.stats()[key_id("together", "c")]["in_flight"] == 1
+
+def test_rate_limited_key_cools_down_then_returns():
+    """
+    A 429 takes a key out of rotation until its Retry-After passes.
+    """
+    pool = KeyPool("together", ["a", "b"])
+    pool.release(pool.acquire(preferred="a"), 429, {"retry-after": "0.2"})
+    stats = pool.stats()[key_id("together", "a")]
+    assert stats["rate_limited"] == 1 and stats["remaining"] == 0
+
+    assert pool.best_key() == "b"
+    assert not pool.has_available(exclude={"b"})
+    time.sleep(0.3)
+    assert pool.has_available(exclude={"b"})
+    assert pool.acquire(exclude={"b"}) == "a"
+
+def test_rejected_key_is_suspended():
+    """
+    A 401 takes a key out of rotation for the unauthorized cooldown, and suspend() does the same.
+    """
+    pool = KeyPool("openai", ["a", "b"])
+    pool.release(pool.acquire(preferred="a"), 401)
+    stats = pool.stats()[key_id("openai", "a")]
+    assert stats["unauthorized"] == 1 and stats["errors"] == 1
+    assert stats["cooling_for_s"] > key_pool.UNAUTHORIZED_COOLDOWN - 5
+    assert pool.best_key() == "b"
+
+    pool.suspend("b")
+    assert pool.best_key() is None
+    assert pool.acquire() is None
+
+def test_llm_request_retried_with_next_key():
+    """
+    A LangChain request answered with a 429 or 401 cools its key down and is sent again with the next one.
+    """
+    pool = KeyPool("together", ["a", "b", "c"])
+    status = {"a": 429, "b": 401, "c": 200}
+    sent = []
+
+    def handler(request):
+        api_key = request.headers["Authorization"][len("Bearer "):]
+        sent.append(api_key)
+        return httpx.Response(status[api_key], json={"choices": []})
+
+    original_pools, original_scheduler = dict(key_pool._pools), scheduler_module._scheduler
+    key_pool._pools["together"] = pool
+    scheduler_module._scheduler = Scheduler(capacity=2, reserved_interactive=1)
+    try:
+        client = httpx.Client(transport=ScheduledTransport(httpx.MockTransport(handler)))
+        url = "https://api.together.xyz/v1/chat/completions"
+        response = client.post(url, headers={"Authorization": "Bearer a"}, json={"model": "m"})
+        assert response.status_code == 200
+        assert sent == ["a", "b", "c"]
+
+        # The next session request skips the cooling keys straight away
+        assert client.post(url, headers={"Authorization": "Bearer a"}, json={"model": "m"}).status_code == 200
+        assert sent[3:] == ["c"]
+        assert all(stats["in_flight"] == 0 for stats in scheduler_module._scheduler.stats().values())
+    finally:
+        key_pool._pools.clear()
+        key_pool._pools.update(original_pools)
+        scheduler_module._scheduler = original_scheduler
+    stats = pool.stats()
+    assert stats[key_id("together", "a")]["rate_limited"] == 1
+    assert stats[key_id("together", "b")]["unauthorized"] == 1
+    assert stats[key_id("together", "c")]["requests"] == 2
+
+def main():
+    """
+    Main function to test the key pool.
+    """
+    for test in (test_best_key_has_most_quota_left, test_rate_limited_key_cools_down_then_returns,
+                 test_rejected_key_is_suspended, test_llm_request_retried_with_next_key):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
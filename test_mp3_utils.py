@@ -0,0 +1,156 @@
+"""
+Test script for the MP3 frame utilities.
+"""
+
+import os
+import random
+import tempfile
+
+from mp3_utils import (parse_frame_header, iter_frames, concat_mp3, granules, side_info_length, adjust_frame_gain,
+                       analyze_mp3, normalize_mp3, _write_bits, _crc16, TARGET_GAIN, MAX_BOOST_STEPS)
+
+def make_frame(gains, channels=1, protected=True, padding=0, seed=0):
+    """
+    Build an MPEG-1 Layer III frame at 128 kbit/s and 44.1 kHz with the given granule gains.
+
+    Args:
+        gains (list): Global gain of each granule and channel; 0 makes a granule without Huffman data
+        channels (int): 1 for mono, 2 for stereo
+        protected (bool): Whether the frame carries a CRC
+        padding (int): The padding bit
+        seed (int): Seed for the filler bytes after the side information
+
+    Returns:
+        bytes: The frame
+    """
+    header = bytes([0xFF, 0xFA if protected else 0xFB, 0x90 | (padding << 1), 0xC0 if channels == 1 else 0x00])
+    info = parse_frame_header(header)
+    offset = 4 + (2 if protected else 0)
+    side_length = side_info_length(info)
+    filler = random.Random(seed).randbytes(info["frame_length"] - offset - side_length)
+    frame = bytearray(header + bytes(offset - 4 + side_length) + filler)
+    for (_, _, gain_offset), gain in zip(granules(bytes(frame), info), gains):
+        _write_bits(frame, gain_offset - 21, 12, 100 if gain else 0)
+        _write_bits(frame, gain_offset, 8, gain)
+    if protected:
+        protected_bits = bytes(frame[2:4]) + bytes(frame[6:6 + side_length])
+        frame[4:6] = _crc16(protected_bits, len(protected_bits) * 8).to_bytes(2, "big")
+    return bytes(frame)
+
+def crc_ok(frame, info):
+    """
+    Check the CRC of a protected frame.
+    """
+    protected_bits = frame[2:4] + frame[6:6 + side_info_length(info)]
+    return int.from_bytes(frame[4:6], "big") == _crc16(protected_bits, len(protected_bits) * 8)
+
+def assert_contiguous(path):
+    """
+    Check that a file is nothing but whole, valid frames, back to back.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    position = 0
+    while position < len(data):
+        info = parse_frame_header(data[position:position + 4])
+        assert info is not None, f"no frame header at byte {position}"
+        frame = data[position:position + info["frame_length"]]
+        assert len(frame) == info["frame_length"], "truncated frame"
+        assert not info["protected"] or crc_ok(frame, info), f"bad CRC at byte {position}"
+        position += info["frame_length"]
+
+def write_mp3(path, frames, id3=False, info_frame=False):
+    """
+    Write frames to a file, optionally behind an ID3v2 tag and a Xing/Info frame.
+    """
+    with open(path, "wb") as f:
+        if id3:
+            f.write(b"ID3\x04\x00\x00\x00\x00\x00\x0a" + bytes(10))
+        if info_frame:
+            header = bytes.fromhex("FFFB90C0")
+            info = parse_frame_header(header)
+            frame = bytearray(info["frame_length"])
+            frame[:4] = header
+            offset = 4 + side_info_length(info)
+            frame[offset:offset + 4] = b"Info"
+            f.write(bytes(frame))
+        f.write(b"".join(frames))
+
+def test_concat_keeps_frame_boundaries():
+    """
+    Joining files drops their tags and Info frames and keeps every audio frame intact and in order.
+    """
+    first = [make_frame([140 + i, 141 + i], seed=i) for i in range(20)]
+    second = [make_frame([120, 121, 122, 123], channels=2, protected=False, padding=i % 2, seed=100 + i)
+              for i in range(15)]
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, "first.mp3"), os.path.join(tmp, "second.mp3")]
+        write_mp3(paths[0], first, id3=True, info_frame=True)
+        write_mp3(paths[1], second, info_frame=True)
+        output_path = os.path.join(tmp, "joined.mp3")
+
+        assert concat_mp3(paths, output_path) == len(first) + len(second)
+        assert [frame for frame, _ in iter_frames(output_path)] == first + second
+        assert_contiguous(output_path)
+        with open(output_path, "rb") as f:
+            assert f.read() == b"".join(first + second)
+        assert not os.path.exists(output_path + ".part")
+
+def test_gain_rewrites_only_gain_and_crc():
+    """
+    Adjusting the gain changes the global gain fields and the CRC, and nothing else.
+    """
+    for channels, protected in ((1, True), (2, True), (2, False)):
+        frame = make_frame([150, 0, 254, 3][:2 * channels], channels=channels, protected=protected)
+        info = parse_frame_header(frame[:4])
+        adjusted = adjust_frame_gain(frame, info, 4)
+
+        assert len(adjusted) == len(frame)
+        assert [gain for _, gain, _ in granules(adjusted, info)] == [154, 0, 255, 7][:2 * channels]
+        assert not protected or crc_ok(adjusted, info)
+        gain_bits = {bit for _, _, offset in granules(frame, info) for bit in range(offset, offset + 8)}
+        crc_bits = set(range(32, 48)) if protected else set()
+        changed = {i for i in range(len(frame) * 8)
+                   if (frame[i >> 3] ^ adjusted[i >> 3]) >> (7 - (i & 7)) & 1}
+        assert changed <= gain_bits | crc_bits
+        assert adjust_frame_gain(frame, info, 0) == frame
+
+def test_normalize_round_trip():
+    """
+    Normalizing trims the silence to the padding and leaves valid frames at the target level.
+    """
+    silent = [make_frame([60, 0], seed=i) for i in range(5)]
+    speech = [make_frame([140 + i % 3, 142], seed=10 + i) for i in range(30)]
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "speech.mp3")
+        output_path = os.path.join(tmp, "normalized.mp3")
+        write_mp3(input_path, silent + speech + silent, id3=True, info_frame=True)
+
+        analysis = analyze_mp3(input_path)
+        assert (analysis["frames"], analysis["first_active"], analysis["last_active"]) == (40, 5, 34)
+
+        # The speech is quieter than the target by more than the largest boost
+        assert TARGET_GAIN - analysis["median_gain"] > MAX_BOOST_STEPS
+        report = normalize_mp3(input_path, output_path, pad_frames=2)
+        assert report["gain_steps"] == MAX_BOOST_STEPS
+        assert report["frames"] == len(speech) + 4
+        assert_contiguous(output_path)
+        normalized = analyze_mp3(output_path)
+        assert normalized["median_gain"] == analysis["median_gain"] + MAX_BOOST_STEPS
+        assert (normalized["first_active"], normalized["last_active"]) == (2, len(speech) + 1)
+
+        # Lowering the level in place rewrites the file it reads from
+        normalize_mp3(output_path, target_gain=normalized["median_gain"] - 3, trim=False)
+        assert analyze_mp3(output_path)["median_gain"] == normalized["median_gain"] - 3
+        assert_contiguous(output_path)
+
+def main():
+    """
+    Main function to test the MP3 frame utilities.
+    """
+    for test in (test_concat_keeps_frame_boundaries, test_gain_rewrites_only_gain_and_crc, test_normalize_round_trip):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Test script for the menu state machine.
+"""
+
+import sys
+import builtins
+
+import main as menus
+from main import STATES
+from api_utils import PREWARM_HOSTS
+from navigation import run_state_machine, PREVIOUS_MENU, MAIN_MENU, EXIT
+
+def _frame_depth():
+    """
+    Count the frames on the current thread's stack.
+    """
+    depth = 0
+    frame = sys._getframe()
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+def _run_scripted(answers, initialize_llm=None, run_option=None):
+    """
+    Run the menus with scripted answers to input() and stubbed provider setup.
+
+    Args:
+        answers (iterable): The answers, in the order the menus ask
+        initialize_llm (callable, optional): Stands in for main.initialize_llm
+        run_option (callable, optional): Stands in for main._run_option
+
+    Returns:
+        tuple: The states visited, the hosts pre-warmed and the stack depth at each prompt
+    """
+    answers = iter(answers)
+    prewarmed = []
+    depths = []
+
+    def scripted_input(prompt=""):
+        depths.append(_frame_depth())
+        return next(answers)
+
+    patches = {"prewarm_connections": lambda hosts: prewarmed.append(hosts)}
+    if initialize_llm is not None:
+        patches["initialize_llm"] = initialize_llm
+    if run_option is not None:
+        patches["_run_option"] = run_option
+    originals = {name: getattr(menus, name) for name in patches}
+    original_input = builtins.input
+    builtins.input = scripted_input
+    for name, value in patches.items():
+        setattr(menus, name, value)
+    try:
+        history = run_state_machine(STATES, MAIN_MENU)
+    finally:
+        builtins.input = original_input
+        for name, value in originals.items():
+            setattr(menus, name, value)
+    return history, prewarmed, depths
+
+def test_back_and_quit():
+    """
+    "Previous menu" goes up one level, "main menu" goes back to the top and "Exit" ends the session.
+    """
+    history, prewarmed, _ = _run_scripted(
+        ["2", "4", "1", "1", "5", "3"],
+        initialize_llm=lambda option: PREVIOUS_MENU,
+    )
+    assert history == [MAIN_MENU, "mode_menu", MAIN_MENU, "mode_menu", "run_option", "mode_menu", MAIN_MENU]
+    assert prewarmed == [PREWARM_HOSTS["general_chat"]]
+
+def test_invalid_choices_fall_back_to_defaults():
+    """
+    An invalid main menu choice selects Test LLM Provider and an invalid option selects general chat.
+    """
+    runs = []
+
+    def run_option(menu, option, llm, api_key, model_name):
+        runs.append((menu, option, model_name))
+        return EXIT
+
+    history, _, _ = _run_scripted(
+        ["9", "x"],
+        initialize_llm=lambda option: ("llm", "key", "model"),
+        run_option=run_option,
+    )
+    assert history == [MAIN_MENU, "mode_menu", "run_option"]
+    assert runs == [("test_llm", "general_chat", "model")]
+
+def test_round_trips_keep_stack_depth():
+    """
+    Going back and forth between menus many times runs at a constant stack depth.
+    """
+    round_trips = 500
+    answers = ["1", "4"] * round_trips + ["3"]
+    history, _, depths = _run_scripted(answers)
+    assert history == [MAIN_MENU, "mode_menu"] * round_trips + [MAIN_MENU]
+    assert len(set(depths)) == 1
+
+def main():
+    """
+    Main function to test the menu state machine.
+    """
+    for test in (test_back_and_quit, test_invalid_choices_fall_back_to_defaults, test_round_trips_keep_stack_depth):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
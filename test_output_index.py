@@ -0,0 +1,64 @@
+"""
+Test script for the output index.
+"""
+
+import os
+import tempfile
+
+import output_index
+from output_index import record_output, find_outputs, reindex
+
+def test_connections_closed_and_schema_created_once():
+    """
+    Recording, querying and reindexing close their connections, and only the first one runs the schema script.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "index.db")
+        images = os.path.join(tmp, "Images")
+        os.makedirs(images)
+        path = os.path.join(images, "lighthouse.png")
+        with open(path, "wb") as f:
+            f.write(b"png")
+
+        scripts = []
+        opened = []
+        connect = output_index.sqlite3.connect
+
+        class TrackingConnection(output_index.sqlite3.Connection):
+            closed = False
+
+            def executescript(self, script):
+                scripts.append(script)
+                return super().executescript(script)
+
+            def close(self):
+                self.closed = True
+                super().close()
+
+        def tracking_connect(*args, **kwargs):
+            conn = connect(*args, factory=TrackingConnection, **kwargs)
+            opened.append(conn)
+            return conn
+
+        output_index.sqlite3.connect = tracking_connect
+        try:
+            assert record_output(path, "image", {"model": "flux", "prompt": "A lighthouse"}, db_path=db_path)
+            assert record_output(path, "image", {"model": "flux", "prompt": "A lighthouse"}, db_path=db_path)
+            assert [output["prompt"] for output in find_outputs(model="flux", db_path=db_path)] == ["A lighthouse"]
+            assert reindex({images: "image"}, db_path=db_path)["unchanged"] == 1
+        finally:
+            output_index.sqlite3.connect = connect
+        assert len(scripts) == 1
+        assert os.path.abspath(db_path) in output_index._initialized
+        assert len(opened) == 4 and all(conn.closed for conn in opened)
+
+def main():
+    """
+    Main function to test the output index.
+    """
+    for test in (test_connections_closed_and_schema_created_once,):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
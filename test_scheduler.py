@@ -0,0 +1,181 @@
+"""
+Test script for the priority scheduler.
+"""
+
+import time
+import asyncio
+import threading
+
+import httpx
+
+import scheduler as scheduler_module
+from scheduler import Scheduler, INTERACTIVE, NORMAL, BULK, priority
+from llm_transport import ScheduledTransport
+
+def _acquire_in_thread(scheduler, cls, admitted):
+    """
+    Acquire a slot in a background thread and record the class once admitted.
+    """
+    thread = threading.Thread(target=lambda: admitted.append(scheduler.acquire(cls)), daemon=True)
+    thread.start()
+    return thread
+
+def _wait_until(condition, timeout=2.0):
+    """
+    Poll a condition until it holds or the timeout passes.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+def test_reserved_slots_stay_free_for_interactive_calls():
+    """
+    Bulk calls never take the reserved slots, so interactive calls are admitted at once under saturation.
+    """
+    scheduler = Scheduler(capacity=4, reserved_interactive=2)
+    admitted = []
+    for _ in range(2):
+        scheduler.acquire(BULK)
+    bulk_waiters = [_acquire_in_thread(scheduler, cls, admitted) for cls in (BULK, BULK, NORMAL)]
+    assert _wait_until(lambda: scheduler.stats()[BULK]["waiting"] == 2)
+    assert admitted == []
+
+    started = time.monotonic()
+    assert scheduler.acquire(INTERACTIVE) == INTERACTIVE
+    assert scheduler.acquire(INTERACTIVE) == INTERACTIVE
+    assert time.monotonic() - started < 0.5
+
+    # The capacity is now full: a third interactive call waits for any slot
+    _acquire_in_thread(scheduler, INTERACTIVE, admitted)
+    assert _wait_until(lambda: scheduler.stats()[INTERACTIVE]["waiting"] == 1)
+    scheduler.release(BULK)
+    assert _wait_until(lambda: admitted == [INTERACTIVE])
+
+    # Bulk and normal calls only run once fewer than capacity - reserved slots are in use
+    scheduler.release(INTERACTIVE)
+    scheduler.release(INTERACTIVE)
+    time.sleep(0.05)
+    assert admitted == [INTERACTIVE]
+    scheduler.release(INTERACTIVE)
+    assert _wait_until(lambda: len(admitted) == 2)
+    assert scheduler.stats()[INTERACTIVE]["in_flight"] == 0
+    assert sum(stats["in_flight"] for stats in scheduler.stats().values()) == 2
+
+    scheduler.release(BULK)
+    scheduler.release(admitted[1])
+    for thread in bulk_waiters:
+        thread.join(2.0)
+    assert len(admitted) == 4
+
+def test_async_interactive_call_not_starved_by_bulk_threads():
+    """
+    An event loop waiting for an interactive slot is admitted while bulk threads keep the scheduler full.
+    """
+    scheduler = Scheduler(capacity=6, reserved_interactive=2)
+    stop = threading.Event()
+
+    def bulk_worker():
+        while not stop.is_set():
+            with scheduler.slot(BULK):
+                time.sleep(0.02)
+
+    workers = [threading.Thread(target=bulk_worker, daemon=True) for _ in range(20)]
+    for worker in workers:
+        worker.start()
+    assert _wait_until(lambda: scheduler.stats()[BULK]["in_flight"] == 4)
+
+    async def interactive_calls():
+        waits = []
+        for _ in range(10):
+            started = time.monotonic()
+            cls = await scheduler.acquire_async(INTERACTIVE)
+            waits.append(time.monotonic() - started)
+            await asyncio.sleep(0.01)
+            scheduler.release(cls)
+        return waits
+
+    try:
+        waits = asyncio.run(interactive_calls())
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    assert max(waits) < 0.1
+    assert scheduler.stats()[BULK]["in_flight"] == 0
+
+def test_llm_requests_wait_for_interactive_slots_first():
+    """
+    Requests sent through the LLM transport queue in the shared scheduler, where interactive ones go first.
+    """
+    scheduler = Scheduler(capacity=3, reserved_interactive=1)
+    holds = {name: threading.Event() for name in ("bulk-1", "bulk-2", "bulk-3", "interactive-2")}
+    order = []
+
+    def handler(request):
+        name = request.headers["x-name"]
+        order.append(name)
+        if name in holds:
+            holds[name].wait(5)
+        return httpx.Response(200, json={"name": name})
+
+    client = httpx.Client(transport=ScheduledTransport(httpx.MockTransport(handler)))
+
+    def send(name, cls):
+        def run():
+            with priority(cls):
+                client.get("https://api.together.xyz/v1/models", headers={"x-name": name})
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    original = scheduler_module._scheduler
+    scheduler_module._scheduler = scheduler
+    try:
+        # Bulk work takes every shared slot and queues behind them
+        threads = [send(name, BULK) for name in ("bulk-1", "bulk-2")]
+        assert _wait_until(lambda: len(order) == 2)
+        threads.append(send("bulk-3", BULK))
+        assert _wait_until(lambda: scheduler.stats()[BULK]["waiting"] == 1)
+
+        # An interactive call still gets the reserved slot at once
+        started = time.monotonic()
+        with priority(INTERACTIVE):
+            assert client.get("https://api.together.xyz/v1/models", headers={"x-name": "interactive-1"}).is_success
+        assert time.monotonic() - started < 0.5
+
+        # With the whole capacity taken, the next free slot goes to the interactive call waiting for it
+        threads.append(send("interactive-2", INTERACTIVE))
+        assert _wait_until(lambda: "interactive-2" in order)
+        threads.append(send("interactive-3", INTERACTIVE))
+        assert _wait_until(lambda: scheduler.stats()[INTERACTIVE]["waiting"] == 1)
+        holds["bulk-1"].set()
+        assert _wait_until(lambda: "interactive-3" in order)
+        assert "bulk-3" not in order
+
+        for hold in holds.values():
+            hold.set()
+        for thread in threads:
+            thread.join(2.0)
+    finally:
+        scheduler_module._scheduler = original
+        for hold in holds.values():
+            hold.set()
+    assert sorted(order[:2]) == ["bulk-1", "bulk-2"]
+    assert order[2:] == ["interactive-1", "interactive-2", "interactive-3", "bulk-3"]
+    assert all(stats["in_flight"] == 0 and stats["waiting"] == 0 for stats in scheduler.stats().values())
+
+def main():
+    """
+    Main function to test the priority scheduler.
+    """
+    for test in (test_reserved_slots_stay_free_for_interactive_calls,
+                 test_async_interactive_call_not_starved_by_bulk_threads,
+                 test_llm_requests_wait_for_interactive_slots_first):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
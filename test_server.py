@@ -0,0 +1,67 @@
+"""
+Test script for the HTTP server.
+"""
+
+import asyncio
+import threading
+
+from aiohttp.test_utils import TestServer, TestClient
+
+import server
+from server import create_app, stream_blocking
+
+CHUNK = b"x" * 1024
+
+def test_worker_stops_when_client_disconnects():
+    """
+    A streaming worker stays at most SINK_MAX_CHUNKS ahead of a slow client and stops once the client leaves.
+    """
+    written = []
+    stopped = threading.Event()
+    max_ahead = []
+
+    def endless(sink):
+        try:
+            while True:
+                sink.write(CHUNK)
+                written.append(len(CHUNK))
+                max_ahead.append(sink.queue.qsize())
+        except BrokenPipeError:
+            stopped.set()
+            raise
+
+    async def handle_endless(request):
+        return await stream_blocking(request, endless, content_type="application/octet-stream")
+
+    async def scenario():
+        app = create_app(workers=1, max_queue=1)
+        # No provider connections or feature imports are needed here
+        app.on_startup.clear()
+        app.router.add_get("/endless", handle_endless)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/endless")
+            await response.content.readexactly(4 * len(CHUNK))
+            # Let the worker run ahead while the client reads nothing
+            await asyncio.sleep(0.3)
+            response.close()
+            assert await asyncio.to_thread(stopped.wait, 5)
+            # The worker frees its slot once it returns
+            for _ in range(100):
+                if app["active"] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert app["active"] == 0
+
+    asyncio.run(scenario())
+    assert max(max_ahead) <= server.SINK_MAX_CHUNKS
+
+def main():
+    """
+    Main function to test the HTTP server.
+    """
+    for test in (test_worker_stops_when_client_disconnects,):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Test script for the TTS cache.
+"""
+
+import os
+import tempfile
+
+from tts_cache import cache_key, cache_store, cache_copy, cache_lookup
+
+def test_changing_output_leaves_cache_intact():
+    """
+    An output served from the cache is a separate file: editing it or touching the entry does not affect the other.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, "cache")
+        source = os.path.join(tmp, "hello.mp3")
+        output = os.path.join(tmp, "again.mp3")
+        with open(source, "wb") as f:
+            f.write(b"original audio")
+        key = cache_key("cartesia/sonic-2", "laidback woman", "Hello there")
+        cache_store(key, source, cache_dir=cache_dir)
+
+        assert cache_copy(key, output, cache_dir=cache_dir)
+        assert not os.path.samefile(output, cache_lookup(key, cache_dir))
+
+        # Marking the entry as recently used leaves the output's modification time alone
+        os.utime(output, (1_000_000, 1_000_000))
+        cache_lookup(key, cache_dir)
+        assert os.path.getmtime(output) == 1_000_000
+
+        # Rewriting the output in place, as normalization might, does not reach the cached clip
+        with open(output, "r+b") as f:
+            f.write(b"NORMALIZED")
+        with open(cache_lookup(key, cache_dir), "rb") as f:
+            assert f.read() == b"original audio"
+
+        assert cache_copy(key, output, cache_dir=cache_dir)
+        with open(output, "rb") as f:
+            assert f.read() == b"original audio"
+
+def main():
+    """
+    Main function to test the TTS cache.
+    """
+    for test in (test_changing_output_leaves_cache_intact,):
+        test()
+        print(f"✅ {test.__name__}")
+
+if __name__ == "__main__":
+    main()
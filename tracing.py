@@ -0,0 +1,286 @@
+"""
+Tracing module.
+
+This module records spans: named, timed sections of work with attributes and
+the id of the span they ran in, so a slow run can be broken down without
+adding prints. The current span is kept in a context variable, so spans
+nest across function calls, asyncio tasks and work submitted with
+scheduler.submit_with_context.
+
+Tracing is off unless the TRACE_FILE environment variable names a file (or
+enable_tracing is called); a span then costs a context variable lookup.
+Finished spans are appended to the file in the Chrome trace event format,
+which chrome://tracing and https://ui.perfetto.dev open directly.
+
+Usage:
+    TRACE_FILE=trace.json python main.py
+    python tracing.py trace.json [--top 20]
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACE_ENV_VAR = "TRACE_FILE"
+# Finished spans are appended to the trace file once this many are buffered, and at exit
+FLUSH_EVENTS = 500
+
+_current = ContextVar("trace_span", default=None)
+_trace_path = os.environ.get(TRACE_ENV_VAR) or None
+_events = []
+_events_lock = threading.Lock()
+_named_threads = set()
+
+class Span:
+    """
+    One timed section of work.
+    """
+
+    __slots__ = ("name", "span_id", "parent_id", "trace_id", "attributes", "start", "started")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.started = time.perf_counter()
+
+    def set(self, **attributes):
+        """
+        Add attributes to the span, e.g. a status code once it is known.
+        """
+        self.attributes.update(attributes)
+
+class _NoSpan:
+    """
+    Stands in for a span while tracing is off.
+    """
+
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+def tracing_enabled():
+    """
+    Check whether spans are being recorded.
+
+    Returns:
+        bool: True if a trace file is set
+    """
+    return _trace_path is not None
+
+def enable_tracing(path):
+    """
+    Start recording spans to a trace file.
+
+    Args:
+        path (str): The trace file; spans are appended if it exists
+    """
+    global _trace_path
+    flush_trace()
+    _trace_path = path
+
+def disable_tracing():
+    """
+    Write the buffered spans and stop recording.
+    """
+    global _trace_path
+    flush_trace()
+    _trace_path = None
+
+def current_span():
+    """
+    Get the span the caller runs in.
+
+    Returns:
+        Span: The current span, or a stand-in whose set() does nothing outside any span or while tracing is off
+    """
+    return _current.get() or _NO_SPAN
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block as a child of the current span.
+
+    An exception leaving the block is recorded in the span's "error" attribute.
+
+    Args:
+        name (str): The span name; the part before the first dot is its category, e.g. "http.request"
+        **attributes: JSON-serializable attributes
+
+    Yields:
+        Span: The span, to add attributes with set()
+    """
+    if _trace_path is None:
+        yield _NO_SPAN
+        return
+    current = Span(name, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        _current.reset(token)
+        _finish(current)
+
+def traced(name=None, **attributes):
+    """
+    Decorate a function so each call runs in a span.
+
+    Args:
+        name (str, optional): The span name, defaults to the function's module and name
+        **attributes: Attributes added to every span
+
+    Returns:
+        callable: The decorator
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace_path is None:
+                return func(*args, **kwargs)
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _track():
+    """
+    Get the trace track of the caller: its asyncio task, or else its thread.
+    """
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return id(task), task.get_name()
+    thread = threading.current_thread()
+    return thread.ident, thread.name
+
+def _finish(current):
+    """
+    Turn a finished span into a complete ("X") trace event and buffer it.
+    """
+    duration = time.perf_counter() - current.started
+    pid = os.getpid()
+    tid, track_name = _track()
+    args = dict(current.attributes, span_id=current.span_id, trace_id=current.trace_id)
+    if current.parent_id:
+        args["parent_id"] = current.parent_id
+    event = {"name": current.name, "cat": current.name.split(".", 1)[0], "ph": "X",
+             "ts": round(current.start * 1_000_000), "dur": round(duration * 1_000_000),
+             "pid": pid, "tid": tid, "args": args}
+    with _events_lock:
+        if (pid, tid) not in _named_threads:
+            _named_threads.add((pid, tid))
+            _events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": track_name}})
+        _events.append(event)
+        full = len(_events) >= FLUSH_EVENTS
+    if full:
+        flush_trace()
+
+def flush_trace():
+    """
+    Append the buffered spans to the trace file.
+
+    The file is a JSON array whose closing bracket is left out so later runs
+    and processes can keep appending; trace viewers accept it as is.
+
+    Returns:
+        int: The number of events written
+    """
+    with _events_lock:
+        events = _events[:]
+        del _events[:]
+    path = _trace_path
+    if not events or path is None:
+        return 0
+    try:
+        with open(path, "x") as f:
+            f.write("[\n")
+    except FileExistsError:
+        pass
+    # One write per flush keeps the events of concurrent processes from interleaving
+    with open(path, "a") as f:
+        f.write("".join(json.dumps(event, default=str) + ",\n" for event in events))
+    return len(events)
+
+atexit.register(flush_trace)
+
+def load_trace(path):
+    """
+    Read the events of a trace file written by flush_trace.
+
+    Args:
+        path (str): The trace file
+
+    Returns:
+        list: The trace events
+    """
+    with open(path) as f:
+        text = f.read().strip().rstrip(",")
+    if not text.endswith("]"):
+        text += "]"
+    return json.loads(text)
+
+def summarize_trace(events):
+    """
+    Add up the time spent in each span name, with its self time (not spent in child spans).
+
+    Args:
+        events (list): Trace events, as returned by load_trace
+
+    Returns:
+        list: One dict per span name with its count, total, self and maximum time in milliseconds,
+            the largest total first
+    """
+    spans = [event for event in events if event.get("ph") == "X"]
+    child_time = {}
+    for event in spans:
+        parent = event["args"].get("parent_id")
+        if parent:
+            child_time[parent] = child_time.get(parent, 0) + event["dur"]
+
+    summary = {}
+    for event in spans:
+        entry = summary.setdefault(event["name"], {"name": event["name"], "count": 0, "total_ms": 0.0,
+                                                   "self_ms": 0.0, "max_ms": 0.0})
+        duration = event["dur"] / 1000
+        entry["count"] += 1
+        entry["total_ms"] += duration
+        entry["self_ms"] += max(0.0, duration - child_time.get(event["args"]["span_id"], 0) / 1000)
+        entry["max_ms"] = max(entry["max_ms"], duration)
+    for entry in summary.values():
+        for key in ("total_ms", "self_ms", "max_ms"):
+            entry[key] = round(entry[key], 1)
+    return sorted(summary.values(), key=lambda entry: entry["total_ms"], reverse=True)
+
+if __name__ == "__main__":
+    import argparse
+    from tabulate import tabulate
+
+    parser = argparse.ArgumentParser(description="Show where the time of a trace went, by span name.")
+    parser.add_argument("trace", help="A trace file written with TRACE_FILE set")
+    parser.add_argument("--top", type=int, default=20, help="Number of span names to show")
+    args = parser.parse_args()
+
+    rows = summarize_trace(load_trace(args.trace))[:args.top]
+    print(tabulate([[row["name"], row["count"], row["total_ms"], row["self_ms"], row["max_ms"]] for row in rows],
+                   headers=["Span", "Count", "Total (ms)", "Self (ms)", "Max (ms)"], tablefmt="grid"))
@@ -0,0 +1,188 @@
+"""
+TTS cache module.
+
+This module provides a content-addressed cache of synthesized speech, keyed
+by the normalized text together with the model, voice and format. The cache
+is capped in size and evicts the least recently used clips first. The size
+is tracked as a running total per cache directory, so the directory is only
+walked on first use and when the total goes over the cap.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import unicodedata
+from tracing import span
+
+CACHE_DIR = ".tts_cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Eviction frees space down to this share of the cap, so it does not run again on the next store
+EVICT_TO_FRACTION = 0.9
+
+_cache_lock = threading.Lock()
+# Running total of bytes per cache directory, set by the last walk in evict
+_cache_bytes = {}
+
+def normalize_text(text):
+    """
+    Normalize text so trivially different inputs share a cache entry.
+
+    Args:
+        text (str): The text to normalize
+
+    Returns:
+        str: The text in NFC form with whitespace collapsed
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(model, voice, text, response_format="mp3"):
+    """
+    Build the cache key for a piece of speech.
+
+    Args:
+        model (str): The text-to-speech model
+        voice (str): The voice
+        text (str): The text being spoken
+        response_format (str): The audio format
+
+    Returns:
+        str: The hex SHA-256 key
+    """
+    payload = json.dumps([model, voice, response_format, normalize_text(text)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _cache_path(key, cache_dir=None):
+    """
+    Get the path a cache entry is stored at.
+
+    Args:
+        key (str): The cache key
+        cache_dir (str, optional): The cache directory, defaults to CACHE_DIR
+
+    Returns:
+        str: The path of the entry
+    """
+    return os.path.join(cache_dir or CACHE_DIR, key[:2], key)
+
+def cache_lookup(key, cache_dir=None):
+    """
+    Look up a cached clip and mark it as recently used.
+
+    Args:
+        key (str): The cache key
+        cache_dir (str, optional): The cache directory
+
+    Returns:
+        str or None: The path of the cached clip, or None on a miss
+    """
+    path = _cache_path(key, cache_dir)
+    with span("cache.lookup", cache="tts") as lookup:
+        try:
+            os.utime(path)
+        except OSError:
+            lookup.set(hit=False)
+            return None
+        lookup.set(hit=True)
+        return path
+
+def cache_copy(key, output_path, cache_dir=None):
+    """
+    Copy a cached clip to an output path.
+
+    The output is a copy, not a hard link: the LRU touch of the entry would
+    change the output's modification time, and editing the output in place,
+    e.g. to normalize it, would change the cached clip.
+
+    Args:
+        key (str): The cache key
+        output_path (str): Where to place the clip
+        cache_dir (str, optional): The cache directory
+
+    Returns:
+        bool: True on a cache hit, False on a miss
+    """
+    path = cache_lookup(key, cache_dir)
+    if path is None:
+        return False
+    try:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        shutil.copyfile(path, output_path)
+        return True
+    except OSError:
+        return False
+
+def cache_store(key, source_path, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+    """
+    Add a synthesized clip to the cache, evicting old entries if over the size cap.
+
+    Args:
+        key (str): The cache key
+        source_path (str): The clip to store
+        cache_dir (str, optional): The cache directory
+        max_bytes (int): Maximum total size of the cache
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    path = _cache_path(key, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    shutil.copyfile(source_path, tmp_path)
+    added = os.path.getsize(tmp_path)
+    with _cache_lock:
+        try:
+            added -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        total = _cache_bytes.get(cache_dir)
+        if total is not None:
+            total = _cache_bytes[cache_dir] = total + added
+    # Other processes sharing the directory are only accounted for by the walk
+    if total is None or total > max_bytes:
+        evict(max_bytes, cache_dir)
+
+def evict(max_bytes=CACHE_MAX_BYTES, cache_dir=None):
+    """
+    Remove the least recently used clips until the cache fits in max_bytes.
+
+    Once over the cap, clips are removed until the cache is down to
+    EVICT_TO_FRACTION of it. The walk also resets the running size total.
+
+    Args:
+        max_bytes (int): Maximum total size of the cache
+        cache_dir (str, optional): The cache directory
+
+    Returns:
+        int: The number of clips removed
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    with _cache_lock:
+        entries = []
+        total = 0
+        for root, _, files in os.walk(cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = 0
+        target = max_bytes * EVICT_TO_FRACTION if total > max_bytes else max_bytes
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        _cache_bytes[cache_dir] = total
+        return removed
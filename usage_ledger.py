@@ -0,0 +1,612 @@
+"""
+Usage ledger module.
+
+This module keeps a local SQLite ledger of every provider call: the tokens,
+images and speech characters it used, its latency and its cost, by provider,
+model, key and job. Prices come from the Together AI model catalog, stored
+whenever list_together_models fetches it, with a small built-in table for
+OpenAI, which publishes no catalog. Calls are buffered in memory and written
+in batches by a background thread, so recording never waits on the disk.
+
+Aggregates report cost per unit of throughput (per thousand tokens, per image,
+per thousand characters) and tokens per second of latency, which is what
+models should be compared on. Daily and monthly budgets, set in USD with the
+USAGE_BUDGET_DAY and USAGE_BUDGET_MONTH environment variables, print an alert
+when 80% and 100% of them are spent.
+
+Usage:
+    python usage_ledger.py summary [--by provider,model] [--since 24h] [--job JOB]
+    python usage_ledger.py budgets
+    python usage_ledger.py prices [--refresh]
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LEDGER_DB_PATH = "usage_ledger.db"
+
+# Buffered calls are written once this many are pending, or every FLUSH_INTERVAL seconds
+FLUSH_ROWS = 200
+FLUSH_INTERVAL = 2.0
+
+# USD per million tokens for OpenAI models, which have no catalog to read prices from
+OPENAI_PRICES = {
+    "gpt-3.5-turbo": {"input": 0.5, "output": 1.5},
+    "gpt-3.5-turbo-instruct": {"input": 1.5, "output": 2.0},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.6},
+    "gpt-4o": {"input": 2.5, "output": 10.0},
+}
+
+# Endpoint path suffix -> kind of call; calls to other endpoints (e.g. /models) are not recorded
+ENDPOINT_KINDS = {
+    "/chat/completions": "chat",
+    "/completions": "completion",
+    "/images/generations": "image",
+    "/audio/speech": "audio",
+}
+
+BUDGET_ENV_VARS = {"day": "USAGE_BUDGET_DAY", "month": "USAGE_BUDGET_MONTH"}
+BUDGET_ALERT_LEVELS = (0.8, 1.0)
+
+# Columns a summary can be grouped by
+GROUP_COLUMNS = ("provider", "model", "key_id", "job", "kind")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    provider TEXT,
+    model TEXT,
+    key_id TEXT,
+    job TEXT,
+    kind TEXT NOT NULL,
+    status INTEGER,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    megapixels REAL NOT NULL DEFAULT 0,
+    audio_chars INTEGER NOT NULL DEFAULT 0,
+    latency REAL,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_created_at ON usage (created_at);
+CREATE INDEX IF NOT EXISTS idx_usage_model ON usage (provider, model);
+CREATE INDEX IF NOT EXISTS idx_usage_job ON usage (job);
+CREATE TABLE IF NOT EXISTS prices (
+    model TEXT PRIMARY KEY,
+    pricing TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_job = ContextVar("usage_job", default=None)
+
+_pending = []
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_wake = threading.Event()
+_flusher = None
+_prices = None
+_prices_lock = threading.Lock()
+_alerted = set()
+
+def _connect(db_path=None):
+    """
+    Open the ledger database, creating the schema if needed.
+
+    Args:
+        db_path (str, optional): Path to the database, defaults to LEDGER_DB_PATH
+
+    Returns:
+        sqlite3.Connection: The open connection
+    """
+    import sqlite3
+    conn = sqlite3.connect(db_path or LEDGER_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+@contextmanager
+def usage_job(name):
+    """
+    Attribute the provider calls made in a block, and in work it submits with context, to a job.
+
+    Args:
+        name (str): The job, e.g. a queue job id or a batch name
+    """
+    token = _job.set(name)
+    try:
+        yield
+    finally:
+        _job.reset(token)
+
+def current_job():
+    """
+    Get the job the current provider calls are attributed to.
+
+    Returns:
+        str: The job, or None outside usage_job
+    """
+    return _job.get()
+
+def update_prices(model_details, db_path=None):
+    """
+    Store the prices of a model catalog, as returned by list_together_models.
+
+    Args:
+        model_details (dict): Model id to details with a "pricing" dict
+        db_path (str, optional): Path to the ledger database
+    """
+    global _prices
+    now = time.time()
+    rows = [(model_id, json.dumps(details["pricing"]), now)
+            for model_id, details in model_details.items() if details.get("pricing")]
+    if not rows:
+        return
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO prices (model, pricing, updated_at) VALUES (?, ?, ?)", rows)
+    finally:
+        conn.close()
+    with _prices_lock:
+        _prices = None
+
+def get_prices(db_path=None):
+    """
+    Get the known prices of every model.
+
+    Returns:
+        dict: Model id to its pricing dict, catalog prices overriding the built-in ones
+    """
+    global _prices
+    with _prices_lock:
+        if _prices is None:
+            prices = {model: dict(pricing) for model, pricing in OPENAI_PRICES.items()}
+            conn = _connect(db_path)
+            try:
+                for row in conn.execute("SELECT model, pricing FROM prices"):
+                    prices[row["model"]] = json.loads(row["pricing"])
+            finally:
+                conn.close()
+            _prices = prices
+        return _prices
+
+def compute_cost(model, prompt_tokens=0, completion_tokens=0, images=0, megapixels=0.0, audio_chars=0,
+                 prices=None):
+    """
+    Compute the cost of a call from its model's catalog pricing.
+
+    Together AI quotes token prices in USD per million tokens as "input" and
+    "output". Image models carry their price per image in "base", or per
+    megapixel in "input"; speech models quote "input" per million characters.
+
+    Args:
+        model (str): The model id
+        prompt_tokens (int): Input tokens
+        completion_tokens (int): Output tokens
+        images (int): Images generated
+        megapixels (float): Total megapixels of the images
+        audio_chars (int): Characters synthesized
+        prices (dict, optional): Model id to pricing, defaults to get_prices()
+
+    Returns:
+        float: The cost in USD, or None if the model has no known price
+    """
+    pricing = (prices if prices is not None else get_prices()).get(model)
+    if not pricing:
+        return None
+    price_in = float(pricing.get("input") or 0)
+    price_out = float(pricing.get("output") or 0)
+    cost = (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+    if images:
+        base = float(pricing.get("base") or 0)
+        cost += images * base if base else megapixels * price_in
+    if audio_chars:
+        cost += audio_chars * price_in / 1_000_000
+    return round(cost, 8)
+
+def call_usage(url, payload, response, parse_body=True):
+    """
+    Work out what a provider call used from its request and response.
+
+    Args:
+        url (str): The provider endpoint
+        payload (dict): The JSON request body
+        response: The HTTP response; a "usage" attribute set by a streaming caller takes precedence
+        parse_body (bool): Whether the response body may be read to find the token usage
+
+    Returns:
+        dict: The kind of call, model, status and units used, or None for endpoints that are not metered
+    """
+    path = url.split("?", 1)[0]
+    kind = next((kind for suffix, kind in ENDPOINT_KINDS.items() if path.endswith(suffix)), None)
+    if kind is None or not isinstance(payload, dict):
+        return None
+    status = response.status_code
+    usage = {"kind": kind, "model": payload.get("model"), "status": status}
+    if status != 200:
+        return usage
+
+    if kind in ("chat", "completion"):
+        tokens = getattr(response, "usage", None)
+        if tokens is None and parse_body:
+            try:
+                tokens = response.json().get("usage")
+            except Exception:
+                tokens = None
+        tokens = tokens or {}
+        usage["prompt_tokens"] = int(tokens.get("prompt_tokens") or 0)
+        usage["completion_tokens"] = int(tokens.get("completion_tokens") or 0)
+    elif kind == "image":
+        usage["images"] = int(payload.get("n") or 1)
+        pixels = int(payload.get("width") or 1024) * int(payload.get("height") or 1024)
+        usage["megapixels"] = usage["images"] * pixels / 1_000_000
+    else:
+        usage["audio_chars"] = len(payload.get("input") or "")
+    return usage
+
+def record_call(provider, url, payload, response, latency, parse_body=True):
+    """
+    Record a provider call in the ledger, if its endpoint is metered.
+
+    Args:
+        provider (str): The service, e.g. "together"
+        url (str): The provider endpoint
+        payload (dict): The JSON request body
+        response: The HTTP response, with the key id used in its key_id attribute
+        latency (float): Seconds from sending the request to the end of the response
+        parse_body (bool): Whether the response body may be read to find the token usage
+    """
+    usage = call_usage(url, payload, response, parse_body)
+    if usage is not None:
+        record_usage(provider, latency=latency, key_id=getattr(response, "key_id", None), **usage)
+
+def record_usage(provider, model, kind, status=200, prompt_tokens=0, completion_tokens=0, images=0,
+                 megapixels=0.0, audio_chars=0, latency=None, key_id=None, job=None):
+    """
+    Record the usage of one call. The row is buffered and written shortly after.
+
+    Args:
+        provider (str): The service, e.g. "together" or "openai"
+        model (str): The model id
+        kind (str): "chat", "completion", "image" or "audio"
+        status (int): The response status
+        prompt_tokens (int): Input tokens
+        completion_tokens (int): Output tokens
+        images (int): Images generated
+        megapixels (float): Total megapixels of the images
+        audio_chars (int): Characters synthesized
+        latency (float, optional): Seconds the call took
+        key_id (str, optional): The id of the API key used
+        job (str, optional): The job the call belongs to, defaults to current_job()
+    """
+    cost = 0.0
+    if status == 200:
+        cost = compute_cost(model, prompt_tokens, completion_tokens, images, megapixels, audio_chars)
+    row = (time.time(), provider, model, key_id, job or current_job(), kind, status, prompt_tokens,
+           completion_tokens, images, megapixels, audio_chars, latency, cost)
+    with _pending_lock:
+        _pending.append(row)
+        pending = len(_pending)
+    _start_flusher()
+    if pending >= FLUSH_ROWS:
+        _flush_wake.set()
+
+def langchain_callback(provider, model, api_key=None, kind="chat"):
+    """
+    Build a LangChain callback handler that records the model's calls in the ledger.
+
+    LangChain models talk to the provider with their own HTTP client, so their
+    calls do not pass through provider_request; the handler reads the token
+    usage LangChain reports at the end of each call instead.
+
+    Args:
+        provider (str): A key of llm_providers.PROVIDERS
+        model (str): The model name
+        api_key (str, optional): The key the model uses, recorded by its id
+        kind (str): "chat" or "completion"
+
+    Returns:
+        langchain_core.callbacks.BaseCallbackHandler: The handler
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+    from key_pool import key_id
+
+    service = "openai" if provider == "openai" else "together"
+
+    class UsageCallbackHandler(BaseCallbackHandler):
+        def __init__(self):
+            self._started = {}
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._started[run_id] = time.time()
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._started[run_id] = time.time()
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            started = self._started.pop(run_id, None)
+            output = response.llm_output or {}
+            tokens = output.get("token_usage") or output.get("usage") or {}
+            record_usage(service, output.get("model_name") or model, kind,
+                         prompt_tokens=int(tokens.get("prompt_tokens") or 0),
+                         completion_tokens=int(tokens.get("completion_tokens") or 0),
+                         latency=time.time() - started if started else None,
+                         key_id=key_id(service, api_key) if api_key else None)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            started = self._started.pop(run_id, None)
+            record_usage(service, model, kind, status=getattr(error, "status_code", 0),
+                         latency=time.time() - started if started else None,
+                         key_id=key_id(service, api_key) if api_key else None)
+
+    return UsageCallbackHandler()
+
+def _start_flusher():
+    """
+    Start the background thread that writes buffered calls, once per process.
+    """
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _pending_lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+
+        def run():
+            while True:
+                _flush_wake.wait(FLUSH_INTERVAL)
+                _flush_wake.clear()
+                try:
+                    flush()
+                except Exception as e:
+                    print(f"⚠️ Could not write the usage ledger: {e}")
+
+        _flusher = threading.Thread(target=run, name="usage-ledger", daemon=True)
+        _flusher.start()
+
+def flush(db_path=None):
+    """
+    Write the buffered calls to the ledger, then check the budgets.
+
+    Args:
+        db_path (str, optional): Path to the ledger database
+
+    Returns:
+        int: The number of calls written
+    """
+    with _flush_lock:
+        with _pending_lock:
+            rows = _pending[:]
+            del _pending[:]
+        if not rows:
+            return 0
+        conn = _connect(db_path)
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO usage (created_at, provider, model, key_id, job, kind, status, prompt_tokens, "
+                    "completion_tokens, images, megapixels, audio_chars, latency, cost) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        finally:
+            conn.close()
+    if budgets():
+        alert_budgets(db_path)
+    return len(rows)
+
+atexit.register(flush)
+
+def parse_since(value):
+    """
+    Turn a relative time such as "24h", "7d" or "30m", or a Unix timestamp, into a timestamp.
+
+    Args:
+        value (str): The time
+
+    Returns:
+        float: The Unix timestamp
+
+    Raises:
+        ValueError: If the value is not understood
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value[-1:] in units:
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+def summarize(group_by=("provider", "model"), since=None, until=None, job=None, db_path=None):
+    """
+    Aggregate the ledger and compute cost per unit of throughput.
+
+    Args:
+        group_by (iterable): Columns of GROUP_COLUMNS to group by
+        since (float, optional): Only calls from this Unix timestamp on
+        until (float, optional): Only calls before this Unix timestamp
+        job (str, optional): Only calls of this job
+        db_path (str, optional): Path to the ledger database
+
+    Returns:
+        list: One dict per group with its calls, errors, units, cost, latency, cost per 1K tokens,
+            per image and per 1K characters, tokens per second and the calls without a known price
+
+    Raises:
+        ValueError: If a grouping column is unknown
+    """
+    group_by = list(group_by)
+    unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(unknown)}. Choose from: {', '.join(GROUP_COLUMNS)}")
+    flush(db_path)
+
+    clauses, params = [], []
+    for clause, value in (("created_at >= ?", since), ("created_at < ?", until), ("job = ?", job)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    group = f"GROUP BY {', '.join(group_by)}" if group_by else ""
+    columns = "".join(f"{column}, " for column in group_by)
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT {columns}COUNT(*) AS calls, SUM(status != 200) AS errors, "
+            "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, "
+            "SUM(images) AS images, SUM(audio_chars) AS audio_chars, "
+            "COALESCE(SUM(CASE WHEN kind IN ('chat', 'completion') THEN cost END), 0) AS token_cost, "
+            "SUM(CASE WHEN kind IN ('chat', 'completion') AND status = 200 THEN latency END) AS token_latency, "
+            "COALESCE(SUM(CASE WHEN kind = 'image' THEN cost END), 0) AS image_cost, "
+            "COALESCE(SUM(CASE WHEN kind = 'audio' THEN cost END), 0) AS audio_cost, "
+            "SUM(CASE WHEN status = 200 THEN latency ELSE 0 END) AS latency, "
+            "COALESCE(SUM(cost), 0) AS cost, SUM(cost IS NULL) AS unpriced "
+            f"FROM usage {where} {group} ORDER BY cost DESC",
+            params,
+        ).fetchall()
+    finally:
+        conn.close()
+
+    summary = []
+    for row in rows:
+        entry = dict(row)
+        token_cost, token_latency, image_cost, audio_cost = (
+            entry.pop(column) for column in ("token_cost", "token_latency", "image_cost", "audio_cost"))
+        tokens = entry["prompt_tokens"] + entry["completion_tokens"]
+        entry["tokens"] = tokens
+        entry["cost"] = round(entry["cost"], 6)
+        entry["latency"] = round(entry["latency"] or 0.0, 3)
+        entry["cost_per_1k_tokens"] = round(token_cost * 1000 / tokens, 6) if tokens else None
+        entry["cost_per_image"] = round(image_cost / entry["images"], 6) if entry["images"] else None
+        entry["cost_per_1k_chars"] = (round(audio_cost * 1000 / entry["audio_chars"], 6)
+                                      if entry["audio_chars"] else None)
+        entry["tokens_per_second"] = round(tokens / token_latency, 1) if tokens and token_latency else None
+        summary.append(entry)
+    return summary
+
+def _period_start(period, now=None):
+    """
+    Get the local start of the current day or month.
+    """
+    local = time.localtime(now)
+    day = 1 if period == "month" else local.tm_mday
+    return time.mktime((local.tm_year, local.tm_mon, day, 0, 0, 0, 0, 0, -1))
+
+def budgets():
+    """
+    Get the configured budgets.
+
+    Returns:
+        dict: Period ("day" or "month") to its limit in USD, for the periods that have one
+    """
+    limits = {}
+    for period, env_var in BUDGET_ENV_VARS.items():
+        value = os.environ.get(env_var)
+        if value:
+            limits[period] = float(value)
+    return limits
+
+def check_budgets(limits=None, db_path=None):
+    """
+    Compare the spend of the current day and month with their budgets.
+
+    Args:
+        limits (dict, optional): Period to limit in USD, defaults to budgets()
+        db_path (str, optional): Path to the ledger database
+
+    Returns:
+        list: One dict per budget with its period, limit, spend, the share spent and the highest
+            alert level of BUDGET_ALERT_LEVELS reached, or None
+    """
+    limits = budgets() if limits is None else limits
+    if not limits:
+        return []
+    conn = _connect(db_path)
+    try:
+        report = []
+        for period, limit in limits.items():
+            start = _period_start(period)
+            spent = conn.execute("SELECT COALESCE(SUM(cost), 0) FROM usage WHERE created_at >= ?",
+                                 (start,)).fetchone()[0]
+            share = spent / limit if limit > 0 else float("inf")
+            level = max((level for level in BUDGET_ALERT_LEVELS if share >= level), default=None)
+            report.append({"period": period, "start": start, "limit": limit, "spent": round(spent, 6),
+                           "share": round(share, 4), "level": level})
+        return report
+    finally:
+        conn.close()
+
+def alert_budgets(db_path=None):
+    """
+    Print an alert the first time spending crosses each alert level of a budget in its period.
+
+    Args:
+        db_path (str, optional): Path to the ledger database
+
+    Returns:
+        list: The budgets that raised a new alert
+    """
+    alerts = []
+    for budget in check_budgets(db_path=db_path):
+        marker = (budget["period"], budget["start"], budget["level"])
+        if budget["level"] is None or marker in _alerted:
+            continue
+        _alerted.add(marker)
+        alerts.append(budget)
+        state = "exceeded" if budget["level"] >= 1.0 else f"at {budget['share']:.0%}"
+        print(f"⚠️ {budget['period'].capitalize()} budget {state}: "
+              f"${budget['spent']:.4f} of ${budget['limit']:g} spent")
+    return alerts
+
+if __name__ == "__main__":
+    import argparse
+    from tabulate import tabulate
+
+    parser = argparse.ArgumentParser(description="Token, image and speech usage and cost of provider calls.")
+    parser.add_argument("--db", help=f"Path to the ledger database (default: {LEDGER_DB_PATH})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="Aggregate usage and cost per unit of throughput")
+    summary_parser.add_argument("--by", default="provider,model",
+                                help=f"Comma-separated columns to group by: {', '.join(GROUP_COLUMNS)}")
+    summary_parser.add_argument("--since", help="Only calls since e.g. 24h, 7d or a Unix timestamp")
+    summary_parser.add_argument("--job", help="Only calls of this job")
+    summary_parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    subparsers.add_parser("budgets", help="Show the spend against USAGE_BUDGET_DAY and USAGE_BUDGET_MONTH")
+    prices_parser = subparsers.add_parser("prices", help="Show the known model prices")
+    prices_parser.add_argument("--refresh", action="store_true", help="Fetch the Together AI catalog first")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        group_by = [column.strip() for column in args.by.split(",") if column.strip()]
+        summary = summarize(group_by, since=parse_since(args.since) if args.since else None, job=args.job,
+                            db_path=args.db)
+        if args.json:
+            print(json.dumps(summary, indent=2))
+        else:
+            columns = group_by + ["calls", "errors", "tokens", "images", "audio_chars", "cost",
+                                  "cost_per_1k_tokens", "cost_per_image", "cost_per_1k_chars",
+                                  "tokens_per_second", "unpriced"]
+            print(tabulate([[entry[column] for column in columns] for entry in summary],
+                           headers=columns, tablefmt="grid"))
+    elif args.command == "budgets":
+        report = check_budgets(db_path=args.db)
+        if not report:
+            print("No budget set. Set USAGE_BUDGET_DAY or USAGE_BUDGET_MONTH in USD.")
+        for budget in report:
+            marker = "⚠️" if budget["level"] else "✅"
+            print(f"{marker} {budget['period']}: ${budget['spent']:.4f} of ${budget['limit']:g} "
+                  f"({budget['share']:.0%})")
+    else:
+        if args.refresh:
+            from llm_providers import provider_api_key
+            from model_selection import list_together_models
+            update_prices(list_together_models(provider_api_key("together"))["model_details"], db_path=args.db)
+        prices = get_prices(db_path=args.db)
+        print(tabulate([[model, json.dumps(pricing)] for model, pricing in sorted(prices.items())],
+                       headers=["Model", "Pricing"], tablefmt="grid"))
@@ -0,0 +1,167 @@
+"""
+Voice previews module.
+
+This module renders a short sample of every voice for every audio model into
+a local cache, so voices can be previewed instantly while choosing one, with
+no network calls. The cache is rebuilt when the voice or model list changes.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from models_config import FAMOUS_MODELS, AVAILABLE_VOICES
+from audio_gen import synthesize_speech, open_audio_player
+from scheduler import priority, BULK
+from llm_providers import provider_api_key
+
+PREVIEW_DIR = os.path.join("Audio", ".previews")
+PREVIEW_TEXT = "Hi, this is how I sound. Pick me for your next recording!"
+PREVIEW_WORKERS = 8
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+def _fingerprint():
+    """
+    Fingerprint the inputs the previews depend on.
+
+    Returns:
+        str: A hash of the models, voices and preview text
+    """
+    models = [model["name"] for model in FAMOUS_MODELS["Audio Models"]]
+    payload = json.dumps([models, AVAILABLE_VOICES, PREVIEW_TEXT])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def preview_path(model, voice):
+    """
+    Get the path of the preview for a model and voice.
+
+    Args:
+        model (str): The audio model
+        voice (str): The voice
+
+    Returns:
+        str: Path of the preview file
+    """
+    name = hashlib.sha1(f"{model}|{voice}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(PREVIEW_DIR, f"{name}.mp3")
+
+def _validate_cache():
+    """
+    Clear the preview cache if it was built for a different voice or model list.
+    """
+    manifest_path = os.path.join(PREVIEW_DIR, "manifest.json")
+    fingerprint = _fingerprint()
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                return
+    except (OSError, ValueError):
+        pass
+
+    shutil.rmtree(PREVIEW_DIR, ignore_errors=True)
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint}, f)
+
+def missing_previews():
+    """
+    List the model and voice pairs that have no cached preview.
+
+    Returns:
+        list: (model, voice) tuples still to be rendered
+    """
+    return [(model["name"], voice)
+            for model in FAMOUS_MODELS["Audio Models"]
+            for voice in AVAILABLE_VOICES
+            if not os.path.exists(preview_path(model["name"], voice))]
+
+def warm_voice_previews(api_key, max_workers=PREVIEW_WORKERS):
+    """
+    Render the missing previews concurrently.
+
+    Args:
+        api_key (str): The Together AI API key
+        max_workers (int): Number of previews rendered at the same time
+
+    Returns:
+        int: The number of previews rendered
+    """
+    _validate_cache()
+    todo = missing_previews()
+    if not todo:
+        return 0
+
+    def render(pair):
+        model, voice = pair
+        try:
+            with priority(BULK):
+                return synthesize_speech(api_key, PREVIEW_TEXT, model, voice,
+                                         preview_path(model, voice)) is not None
+        except Exception as e:
+            print(f"⚠️ Could not render preview for {voice} ({model}): {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(render, todo))
+
+def start_preview_warmup(api_key):
+    """
+    Render missing previews in a background thread, if any are missing.
+
+    Args:
+        api_key (str): The Together AI API key
+
+    Returns:
+        threading.Thread or None: The warm-up thread, or None if the cache is already complete
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return _warmup_thread
+        _validate_cache()
+        if not missing_previews():
+            return None
+        _warmup_thread = threading.Thread(target=warm_voice_previews, args=(api_key,), daemon=True)
+        _warmup_thread.start()
+        return _warmup_thread
+
+def play_preview(model, voice):
+    """
+    Play the cached preview of a voice. No network call is made.
+
+    Args:
+        model (str): The audio model
+        voice (str): The voice
+
+    Returns:
+        bool: True if the preview was played, False if it is not cached yet or no player is available
+    """
+    path = preview_path(model, voice)
+    if not os.path.exists(path):
+        print(f"The preview for '{voice}' is not ready yet.")
+        return False
+
+    player = open_audio_player()
+    if player is None:
+        print(f"Preview saved at {path}")
+        return False
+    try:
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, player.stdin)
+        player.stdin.close()
+        player.wait()
+        return True
+    except (BrokenPipeError, OSError):
+        return False
+
+if __name__ == "__main__":
+    api_key = provider_api_key("together")
+    if not api_key:
+        print("TOGETHER_API_KEY or TOGETHER_API_KEYS must be set to render voice previews.")
+    else:
+        rendered = warm_voice_previews(api_key)
+        print(f"✅ Rendered {rendered} voice preview(s) into {PREVIEW_DIR}")